@@ -1,2 +1,37 @@
-from .annot_export import AnnotationExporter
-from .generic import PDF, Annotation, Page
\ No newline at end of file
+"""
+The classes are imported when they are first used (PEP 562), so importing the
+package does not load PyPDF2, openpyxl and sqlite3.
+"""
+import importlib
+import logging as lg
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .annot_export import AnnotationExporter
+    from .generic import PDF, Annotation, Page
+    from .options import ExportOptions
+
+_LAZY_ATTRIBUTES: dict[str, str] = { # name to module
+    "AnnotationExporter": ".annot_export",
+    "PDF": ".generic",
+    "Annotation": ".generic",
+    "Page": ".generic",
+    "ExportOptions": ".options",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+lg.getLogger(__name__).addHandler(lg.NullHandler()) # logging is configured by the application, see log_config
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value # later lookups do not go through __getattr__
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
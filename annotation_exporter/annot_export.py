@@ -1,25 +1,81 @@
 """
 Contains the AnnotationExporter class which contains the logic for exporting annotations
 """
-import os
+import csv
 import logging as lg
+import threading
+from contextlib import closing
+from dataclasses import replace
+from typing import Any, Callable, Iterable, Iterator, TextIO
 from sqlite3 import connect, Connection, Cursor
-import PyPDF2
-import PyPDF2.generic
 import openpyxl as pyxl
 from openpyxl.worksheet.worksheet import Worksheet
-from openpyxl.styles import PatternFill
-from openpyxl.cell.cell import Cell
-from .generic import PDF, Annotation, Page
+from openpyxl.styles import PatternFill, NamedStyle
+from openpyxl.cell import WriteOnlyCell
+from .backends import RecordMemo, close_reader, open_reader
+from .generic import PDF, Annotation, Page, PageSummary
+from .cache import AnnotationCache
+from .metrics import ExportReport
+from .options import ExportOptions
+from .pipeline import ExportPipeline
+from .progress import LOAD_TEMPLATE, EXTRACT, WRITE_OUTPUTS, COMPLETE, ExportProgress, ProgressTracker
+from .template_cache import TEMPLATE_CACHE, CachedTemplate, TemplateCache
+from .spec import (
+    SpecTemplate, SpecOverlay, TemplateFullError, PRESENT, EXPORTER_HEADER, DATASETS, VARIABLES,
+    DATASET_COL, VAR_DATASET_COL, VAR_NAME_COL, VAR_LABEL_COL, VAR_PAGES_COL)
+
+logger = lg.getLogger(__name__)
+
+CSV_DELIMITER: str = "#"
+VARIABLE_CSV_HEADER: list[str] = ["Variable Name", "Variable Label", "Dataset Name", "Page(s)"]
+DATASET_CSV_HEADER: list[str] = ["Dataset Name", "Color"]
+
+
+def csv_writer(stream: TextIO) -> Any:
+    """
+    Returns a csv writer that separates the values with CSV_DELIMITER.
+
+    :param stream: the text stream
+    :type stream: TextIO
+    :return: the csv writer
+    :rtype: Any
+    """
+    return csv.writer(stream, delimiter=CSV_DELIMITER, lineterminator="\n")
+
+
+def write_csv(target: str | TextIO, header: list[str], rows: Iterable[list[str]]) -> None:
+    """
+    Writes the rows with the csv module, separated by CSV_DELIMITER.
+    Values containing the delimiter or quotes are quoted.
+
+    :param target: path of the csv file or an open text stream like sys.stdout
+    :type target: str | TextIO
+    :param header: the first row
+    :type header: list[str]
+    :param rows: the rows, written as they are produced
+    :type rows: Iterable[list[str]]
+    """
+    if not isinstance(target, str):
+        writer = csv_writer(target)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return
+
+    with open(target, "w", encoding="utf-8", newline="") as f:
+        write_csv(f, header, rows)
 
 class AnnotationExporter:
     """
     Responsible for exporting annotations from a pdf to an \n 
     excel file
     """
-    def __init__(self) -> None:
+    def __init__(self, template_cache: TemplateCache | None = None) -> None:
         """
         initializes variables for use in the programm
+
+        :param template_cache: cache of the parsed templates, defaults to the cache
+            shared by the process (TEMPLATE_CACHE), TemplateCache(0) disables caching
+        :type template_cache: TemplateCache | None
         """
         self.green_cell_fill = PatternFill(
             start_color = "FF00FF00",
@@ -29,32 +85,37 @@ class AnnotationExporter:
             fill_type=None,
             start_color="FFFFFFFF",
             end_color="FF000000")
-        self.wb: pyxl.Workbook
+        self.wb: pyxl.Workbook | None = None
         self.pdf: PDF
         self.output_folder: str
         self.exporter_col_ds: str | None
         self.exporter_col_var: str | None
         self.ws_datasets: Worksheet
         self.ws_variables: Worksheet
+        self.template: SpecTemplate
+        self.template_cache: TemplateCache = template_cache if template_cache is not None else TEMPLATE_CACHE
+        self.cached_template: CachedTemplate
+        self.overlay: SpecOverlay
         self.supp_var_names: list[str] = ["QVAL", "QNAM", "QLABEL"]
         self.ds_replace_annots: list[dict] = []
         self.current_page: Page
-        lg.basicConfig(
-            filename=f"{os.path.dirname(__file__)}/Annotation_Exporter.log",
-            encoding="utf-8",
-            level=lg.DEBUG,
-            filemode="w")
+        self.dataset_rows: dict[str, int] = {}
+        self.variable_rows: dict[tuple[str, str], int] = {}
+        self.supp_rows: dict[str, list[int]] = {}
+        self.cache_stats: dict[str, int] | None = None
+        self.report: ExportReport = ExportReport()
 
-    def determine_exporter_col(self, sheet: str) -> str | None:
+    def determine_exporter_col(self, sheet: str) -> str:
         """
-        Determines the exporter column. Returns the exel column index of the free column or None.
+        Determines the exporter column. Returns the exel column index of the free column,
+        raises TemplateFullError if the sheet has none.
         The column chosen is the first free column in the sheet. The exporter column is used for 
         marking the entries as present.
 
         :param sheet: name of the sheet
         :type sheet: str
-        :return: the exel column index of the free column or None
-        :rtype: str | None
+        :return: the exel column index of the free column
+        :rtype: str
         """
         value = None
         for cell in self.wb[sheet]["1"]:
@@ -63,15 +124,63 @@ class AnnotationExporter:
                 value =  "".join([i for i in cell.coordinate if not i.isdigit()])  # remove all digits
 
         if value is None:
-            lg.critical("no free column for sheet %s found, exiting...", sheet)
-            exit()
+            logger.critical("no free column for sheet %s found", sheet)
+            raise TemplateFullError(f"no free column for sheet {sheet} found")
 
         return value
 
-    def export_annotations(self, template_path: str, pdf_path: str, output_folder: str) -> None:
+    def build_row_index(self) -> None:
+        """
+        Builds the lookup tables that map datasets, (dataset, variable) pairs and
+        SUPPxx datasets to their rows. Only the first occurrence of a key is used for
+        the lookup, mirroring a top to bottom search of the sheet. The tables are kept
+        up to date whenever a row is appended.
+        """
+        self.dataset_rows = {}
+        self.variable_rows = {}
+        self.supp_rows = {}
+
+        for row_nr, row in enumerate(self.template[DATASETS].rows, start=1):
+            self.dataset_rows.setdefault(row[DATASET_COL - 1], row_nr)
+
+        for row_nr, row in enumerate(self.template[VARIABLES].rows, start=1):
+            self.index_variable_row(row[VAR_DATASET_COL - 1], row[VAR_NAME_COL - 1], row_nr)
+
+    def index_variable_row(self, dataset_name: str, variable_name: str, row_nr: int) -> None:
+        """
+        Adds a row of the Variables sheet to the lookup tables.
+
+        :param dataset_name: value of the dataset column (B)
+        :type dataset_name: str
+        :param variable_name: value of the variable column (C)
+        :type variable_name: str
+        :param row_nr: the row number
+        :type row_nr: int
+        """
+        self.variable_rows.setdefault((dataset_name, variable_name), row_nr)
+        if isinstance(dataset_name, str) and dataset_name.startswith("SUPP"):
+            self.supp_rows.setdefault(dataset_name, []).append(row_nr)
+
+    def export_annotations(
+            self,
+            template_path: str,
+            pdf_path: str,
+            output_folder: str,
+            options: ExportOptions | None = None,
+            progress: Callable[[ExportProgress], None] | None = None,
+            cancel_event: threading.Event | None = None,
+            memo: RecordMemo | None = None,
+            **option_values: Any) -> ExportReport:
         """
         Exports annots, this is the main function that should be called. 
         Expects the paths to have the correct endings (.pdf, .xlsx).
+        The pages are extracted once and passed to the sinks (see pipeline),
+        which write the outputs. Single options can also be passed as keyword
+        arguments, they replace the values of options (see ExportOptions).
+        Setting the cancel event stops the export between two pages with
+        progress.ExportCancelled, the outputs are not written. Passing the same
+        memo to every export of a pdf lets the scanner skip the annotations that
+        did not change (see watch).
 
         :param template_path: path to the template file
         :type template_path: str
@@ -79,79 +188,342 @@ class AnnotationExporter:
         :type pdf_path: str
         :param output_folder: path to the output folder
         :type output_folder: str
+        :param options: the options of the export, the defaults if None
+        :type options: ExportOptions | None
+        :param progress: called with the progress of the export
+        :type progress: Callable[[ExportProgress], None] | None
+        :param cancel_event: the export is cancelled once the event is set
+        :type cancel_event: threading.Event | None
+        :param memo: records of the annotations of previous exports of the pdf
+        :type memo: RecordMemo | None
+        :param option_values: single options, see ExportOptions
+        :type option_values: Any
+        :return: the report of the export
+        :rtype: ExportReport
         """
+        options = replace(options or ExportOptions(), **option_values)
         print("exporting annotations...")
-        lg.info("export annots")
-        self.wb = pyxl.load_workbook(template_path)
-        self.output_folder = output_folder
+        logger.info("export annots")
+        self.report = ExportReport(options.trace_memory, options.profile)
+        tracker = ProgressTracker(progress, cancel_event)
+        tracker.stage(LOAD_TEMPLATE)
+        with self.report.stage("load_template"):
+            self.load_template(template_path, options.streaming, options.template_index)
+            self.template_path = template_path
+            self.output_folder = output_folder
+            self.streaming = options.streaming
+
+            self.overlay = SpecOverlay(self.template, options.page_ranges)
+            self.overlay.check_exporter_cols()
+            self.build_row_index()
+
+        if memo is not None:
+            memo.start()
+        cache = pdf_reader = None
+        pages_read = False # the cache is only pruned if all pages were read through it
+        try:
+            if options.cache_path is not None:
+                cache = AnnotationCache(options.cache_path, pdf_path)
+            pdf_reader = open_reader(pdf_path, options.memory_map)
+            self.pdf: PDF = PDF(
+                pdf_reader, options.lazy, options.workers, pdf_path, cache, self.report,
+                options.color_precision, options.backend, memo)
+
+            pipeline = ExportPipeline(
+                self, options.sinks, options.threaded_sinks, options.document, options.incremental)
+            try:
+                pipeline.start()
+                tracker.stage(EXTRACT, self.pdf.page_count())
+                with self.report.stage("init_pages+add_to_workbook" if options.lazy else "add_to_workbook"), \
+                        closing(self.pdf.iter_pages()) as pages: # stops the workers if the export is cancelled
+                    for page in pages:
+                        self.current_page = page
+                        logger.info("starting on page: %s", page.get_page_nr())
+
+                        self.report.count("pages")
+                        self.add_to_workbook(page.get_annotations())
+                        pipeline.write_page(page)
+
+                        if logger.isEnabledFor(lg.DEBUG):
+                            logger.debug("datasets on page %s: %s", page.get_page_nr(), page.get_datasets())
+                        logger.info("Page %s done!", page.get_page_nr())
+                        tracker.page_done()
+                pages_read = True
+
+                if cache is not None:
+                    self.cache_stats = cache.stats()
+                    self.report.count("cache_hits", self.cache_stats["hits"])
+                    self.report.count("cache_misses", self.cache_stats["misses"])
+                    print(f"annotation cache: {self.cache_stats['hits']} hits, {self.cache_stats['misses']} misses")
+                if memo is not None:
+                    self.report.count("memo_hits", memo.hits)
+                    self.report.count("memo_misses", memo.misses)
+
+                tracker.stage(WRITE_OUTPUTS)
+                print("writing outputs...")
+                logger.info("writing the outputs of export")
+                with self.report.stage("write_outputs"):
+                    pipeline.finish()
+            except BaseException:
+                pipeline.abort()
+                raise
+        finally: # the pdf is owned by self.pdf, which may not exist if it failed to initialise
+            if pdf_reader is not None:
+                close_reader(pdf_reader)
+            if cache is not None:
+                cache.close(prune=pages_read)
+
+        if options.report_path is not None:
+            self.report.write_json(options.report_path)
+
+        tracker.stage(COMPLETE)
+        print("complete!")
+        logger.info("exported annots")
+        return self.report
 
-        self.exporter_col_ds = self.determine_exporter_col("Datasets")
-        self.exporter_col_var = self.determine_exporter_col("Variables")
+    def save_workbook(self) -> None:
+        """
+        Writes the template with the changes of the export to output.xlsx in the output folder.
+        """
+        if self.streaming:
+            self.write_streaming_workbook(f"{self.output_folder}/output.xlsx")
+            return
 
-        self.ws_datasets = self.wb["Datasets"]
-        self.ws_variables = self.wb["Variables"]
+        self.wb = self.cached_template.workbook() # a workbook of its own, the cached template is not changed
+        try:
+            self.apply_overlay()
+            self.wb.save(f"{self.output_folder}/output.xlsx")
+        finally:
+            self.wb = None
 
-        self.pdf: PDF = PDF(PyPDF2.PdfReader(pdf_path))
+    def load_template(self, template_path: str, streaming: bool, template_index: bool) -> None:
+        """
+        Loads the values of the template from the template cache (see template_cache),
+        which is shared by the exports of the process. If the template is not cached
+        it is taken from the template index if possible. Without an index the full
+        workbook is loaded right away unless the streaming mode is used, as it is
+        needed for the output anyway.
 
-        for page in self.pdf.pages:
-            self.current_page = page
-            lg.info("starting on page: %s", page.get_page_nr())
+        :param template_path: path to the template file
+        :type template_path: str
+        :param streaming: whether the streaming mode is used
+        :type streaming: bool
+        :param template_index: whether to use and update the template index
+        :type template_index: bool
+        """
+        self.wb = None
+        self.cached_template = self.template_cache.get(template_path, not streaming, template_index)
+        self.template = self.cached_template.template
 
-            self.add_to_workbook(page.get_annotations())
+    def apply_overlay(self) -> None:
+        """
+        Applies the changes recorded in the overlay to the loaded workbook.
+        """
+        self.exporter_col_ds = self.determine_exporter_col(DATASETS)
+        self.exporter_col_var = self.determine_exporter_col(VARIABLES)
+        self.ws_datasets = self.wb[DATASETS]
+        self.ws_variables = self.wb[VARIABLES]
+
+        for row_nr in self.overlay.present_datasets:
+            self.ws_datasets[f"{self.exporter_col_ds}{row_nr}"] = PRESENT
+            self.ws_datasets[f"{self.exporter_col_ds}{row_nr}"].fill = self.green_cell_fill
+
+        for dataset_name in self.overlay.new_datasets:
+            self.ws_datasets.append({
+                "A": dataset_name,
+                self.exporter_col_ds: PRESENT,
+            })
+            self.ws_datasets[f"{self.exporter_col_ds}{self.ws_datasets.max_row}"].fill = self.green_cell_fill
+            self.ws_datasets[f"A{self.ws_datasets.max_row}"].fill = self.reset_cell_fill
+
+        for row_nr in self.overlay.present_variables:
+            self.ws_variables[f"{self.exporter_col_var}{row_nr}"].value = PRESENT
+            self.ws_variables[f"{self.exporter_col_var}{row_nr}"].fill = self.green_cell_fill
+            self.ws_variables[f"L{row_nr}"].value = "CRF"
+
+        for dataset_name, variable_name in self.overlay.new_variables:
+            self.ws_variables.append({
+                "B": dataset_name,
+                "C": variable_name,
+                "L": "CRF",
+                "F": "200",
+                self.exporter_col_var: PRESENT
+            })
+            self.ws_variables[f"{self.exporter_col_var}{self.ws_variables.max_row}"].fill = self.green_cell_fill
+            for modified_col in ["B", "C", "L", "F"]:
+                self.ws_variables[f"{modified_col}{self.ws_variables.max_row}"].fill = self.reset_cell_fill
+
+        for row_nr in self.overlay.pages:
+            self.ws_variables[f"M{row_nr}"].value = self.overlay.page_value(row_nr)
+            self.ws_variables[f"M{row_nr}"].fill = self.reset_cell_fill
+
+    def write_streaming_workbook(self, output_path: str) -> None:
+        """
+        Writes the template with the changes of the overlay using the write only
+        workbook. The cells marked as present share one registered style.
 
-            lg.debug(page.get_datasets())
-            lg.info("Page %s done!", page.get_page_nr())
+        :param output_path: path of the output file
+        :type output_path: str
+        """
+        wb = pyxl.Workbook(write_only=True)
+        present_style = NamedStyle(name="Present", fill=self.green_cell_fill)
+        wb.add_named_style(present_style)
+
+        for sheet in self.template.sheets.values():
+            ws = wb.create_sheet(sheet.title)
+            if sheet.title == DATASETS:
+                rows = self.final_dataset_rows()
+                exporter_col = self.overlay.exporter_col_ds
+            elif sheet.title == VARIABLES:
+                rows = self.final_variable_rows()
+                exporter_col = self.overlay.exporter_col_var
+            else:
+                for row in sheet.rows:
+                    ws.append(row)
+                continue
 
+            for row_nr, row in enumerate(rows, start=1):
+                if row_nr > 1 and row[exporter_col - 1] == PRESENT:
+                    cell = WriteOnlyCell(ws, PRESENT)
+                    cell.style = present_style.name
+                    row[exporter_col - 1] = cell
+                ws.append(row)
 
-        self.wb.save(f"{output_folder}/output.xlsx")
-        print("generating csv...")
-        lg.info("generating csv of export")
-        self.generate_variable_csv()
-        self.generate_dataset_csv()
+        wb.save(output_path)
 
-        print("complete!")
-        lg.info("exported annots")
+    def final_dataset_rows(self) -> Iterator[list]:
+        """
+        Yields the values of every row of the Datasets sheet with the changes applied.
+
+        :return: iterator over the rows
+        :rtype: Iterator[list]
+        """
+        sheet = self.template[DATASETS]
+        exporter_col = self.overlay.exporter_col_ds
+        for row_nr, row in enumerate(sheet.rows, start=1):
+            row = list(row)
+            if row_nr == 1:
+                row = [EXPORTER_HEADER if value is None else value for value in row]
+            elif row_nr in self.overlay.present_datasets:
+                row[exporter_col - 1] = PRESENT
+            yield row
+
+        for dataset_name in self.overlay.new_datasets:
+            row = [None] * sheet.max_column
+            row[DATASET_COL - 1] = dataset_name
+            row[exporter_col - 1] = PRESENT
+            yield row
+
+    def final_variable_rows(self) -> Iterator[list]:
+        """
+        Yields the values of every row of the Variables sheet with the changes applied.
+
+        :return: iterator over the rows
+        :rtype: Iterator[list]
+        """
+        sheet = self.template[VARIABLES]
+        yield [EXPORTER_HEADER if value is None else value for value in sheet.rows[0]]
+
+        for row_nr in range(2, sheet.max_row + len(self.overlay.new_variables) + 1):
+            yield [self.overlay.variable_value(row_nr, col) for col in range(1, sheet.max_column + 1)]
 
-    def generate_sqlite(self, output_folder: str) -> None:
+    def generate_sqlite(self, output_folder: str, document: str | None = None) -> None:
         """
         generates an sqlite database from the annotations and
-        saves it in the output folder
+        saves it in the output folder. All rows are inserted in a single
+        transaction. By default the table is recreated, if a document key
+        (for example the study id) is given only the rows of that document
+        are replaced, so several pdfs can share one database.
 
         :param output_folder: path to the output folder
         :type output_folder: str
+        :param document: key of the document for the upsert mode
+        :type document: str | None
+        """
+        with self.report.stage("generate_sqlite"):
+            self.write_sqlite(output_folder, document)
+
+    def write_sqlite(
+            self,
+            output_folder: str,
+            document: str | None = None,
+            rows: Iterable[tuple] | None = None) -> None:
+        """
+        Writes the annotations table, see generate_sqlite.
+
+        :param output_folder: path to the output folder
+        :type output_folder: str
+        :param document: key of the document for the upsert mode
+        :type document: str | None
+        :param rows: the rows to insert, by default the rows of all processed pages
+        :type rows: Iterable[tuple] | None
+        """
+        conn: Connection= connect(f"{output_folder}/annotations.sqlite", timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        with conn: # single transaction, commits on success
+            c: Cursor = conn.cursor()
+            c.execute("BEGIN IMMEDIATE") # lock before reading the schema, other exports may share the file
+            if document is None:
+                c.execute("DROP TABLE IF EXISTS annotations")
+            c.execute("""CREATE TABLE IF NOT EXISTS annotations
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        dataset BOOLEAN,
+                        new_dataset BOOLEAN,
+                        dataset_name TEXT,
+                        supp BOOLEAN,
+                        assigned_dataset TEXT,
+                        variable_name TEXT,
+                        content TEXT,
+                        color TEXT,
+                        page_number INTEGER,
+                        document TEXT)""")
+
+            columns = [row[1] for row in c.execute("PRAGMA table_info(annotations)")]
+            if "document" not in columns: # database created by an older version
+                c.execute("ALTER TABLE annotations ADD COLUMN document TEXT")
+
+            for column in ("dataset_name", "variable_name", "page_number", "document"):
+                c.execute(f"CREATE INDEX IF NOT EXISTS idx_annotations_{column} ON annotations ({column})")
+
+            if document is not None:
+                c.execute("DELETE FROM annotations WHERE document = ?", (document,))
+
+            c.executemany("""INSERT INTO annotations
+                (dataset, new_dataset, dataset_name, supp, assigned_dataset, variable_name, content, color, page_number, document)
+                VALUES (?,?,?,?,?,?,?,?,?,?)""",
+                self.sqlite_rows(document) if rows is None else rows)
+
+        conn.close()
+
+    def sqlite_rows(self, document: str | None = None) -> Iterator[tuple]:
+        """
+        Yields the rows for the annotations table, one per valid annotation.
+
+        :param document: key of the document
+        :type document: str | None
+        :return: iterator over the rows
+        :rtype: Iterator[tuple]
         """
-        conn: Connection= connect(f"{output_folder}/annotations.sqlite")
-        c: Cursor = conn.cursor()
-        c.execute("DROP TABLE IF EXISTS annotations")
-        c.execute("""CREATE TABLE annotations
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    dataset BOOLEAN,
-                    new_dataset BOOLEAN,
-                    dataset_name TEXT,
-                    supp BOOLEAN,
-                    assigned_dataset TEXT,
-                    variable_name TEXT,
-                    content TEXT,
-                    color TEXT,
-                    page_number INTEGER)""")
-
-        for page in self.pdf.pages:
-            for annot in page.get_annotations():
-                if annot.is_valid:
-                    c.execute("""INSERT INTO annotations
-                        (dataset, new_dataset, dataset_name, supp, assigned_dataset, variable_name, content, color, page_number)
-                        VALUES (?,?,?,?,?,?,?,?,?)""",
-                        (annot.dataset,
-                         annot.new_datset,
-                         annot.dataset_name,
-                         annot.supp,
-                         annot.assigned_dataset,
-                         annot.variable_name,
-                         annot.content,
-                         str(annot.color),
-                         annot.page.get_page_nr() + 1))
-
-        conn.commit()
+        for page in self.pdf.processed_pages():
+            yield from self.page_sqlite_rows(page, document)
+
+    @staticmethod
+    def page_sqlite_rows(page: Page | PageSummary, document: str | None = None) -> Iterator[tuple]:
+        """
+        Yields the rows for the annotations table of a single page.
+
+        :param page: the processed page
+        :type page: Page | PageSummary
+        :param document: key of the document
+        :type document: str | None
+        :return: iterator over the rows
+        :rtype: Iterator[tuple]
+        """
+        page_number = page.get_page_nr() + 1
+        for row in page.store.rows(page.indices):
+            yield (*row[:7], str(row[7]), page_number, document)
 
     def enter_dataset(self, annot: Annotation) -> None:
         """
@@ -160,24 +532,17 @@ class AnnotationExporter:
         :param annot: annotation object
         :type annot: Annotation
         """
-        for cell in self.ws_datasets.iter_rows(max_col=1):
-            cell = cell[0]
-            if cell.value == annot.dataset_name:
-                y_coordinate = cell.coordinate.split("A", 1)[1]
-                self.ws_datasets[f"{self.exporter_col_ds}{y_coordinate}"] = "Present"
-                self.ws_datasets[f"{self.exporter_col_ds}{y_coordinate}"].fill = self.green_cell_fill
+        y_coordinate = self.dataset_rows.get(annot.dataset_name)
+        if y_coordinate is not None:
+            self.overlay.mark_dataset(y_coordinate)
 
-                lg.debug(
+            if logger.isEnabledFor(lg.DEBUG):
+                logger.debug(
                     "%s was assigned as a dataset with the color %s",
                     annot.dataset_name, annot.color)
-                return
+            return
 
-        self.ws_datasets.append({
-            "A": annot.dataset_name,
-            self.exporter_col_ds: "Present",
-        })
-        self.ws_datasets[self.exporter_col_ds][self.ws_datasets.max_row - 1].fill = self.green_cell_fill
-        self.ws_datasets["A"][self.ws_datasets.max_row - 1].fill = self.reset_cell_fill
+        self.dataset_rows[annot.dataset_name] = self.overlay.append_dataset(annot.dataset_name)
 
     def enter_supp(self, annot: Annotation) -> None:
         """
@@ -188,30 +553,13 @@ class AnnotationExporter:
         """
         self.enter_dataset(annot)
 
-        modified_cols: list[str] = ["B", "C", "L", "F"]
-
-        all_values = [x[0] for x in self.ws_variables.iter_rows(min_col=2, max_col=2, values_only=True)] # very performance inefficient
-
-        if annot.dataset_name in all_values:
-            for cell in self.ws_variables["B"]:
-                if cell.value != annot.dataset_name:
-                    continue
-                self.add_page_cell(self.ws_variables[f"M{cell.row}"])
-                break
+        if annot.dataset_name in self.supp_rows:
+            self.add_page(self.supp_rows[annot.dataset_name][0])
         else:
             for var_name in self.supp_var_names:
-                self.ws_variables.append({
-                    "B": annot.dataset_name,
-                    "C": var_name,
-                    "L": "CRF",
-                    "F": "200",
-                    self.exporter_col_var: "Present"})
-
-                self.add_page_cell(self.ws_variables[f"M{self.ws_variables.max_row}"])
-                self.ws_variables[self.exporter_col_var][self.ws_variables.max_row - 1].fill = self.green_cell_fill
-
-                for col in modified_cols:
-                    self.ws_variables[col][self.ws_variables.max_row - 1].fill = self.reset_cell_fill
+                row_nr = self.overlay.append_variable(annot.dataset_name, var_name)
+                self.index_variable_row(annot.dataset_name, var_name, row_nr)
+                self.add_page(row_nr)
 
     def add_to_workbook(self, annotations: list[Annotation]) -> None:
         """
@@ -222,6 +570,11 @@ class AnnotationExporter:
         :type data: list[Annotation]
         """
         for annot in annotations:
+            if annot.is_valid:
+                self.report.count("annotations")
+            else:
+                self.report.count("invalid_annotations")
+
             if annot.dataset:
                 self.enter_dataset(annot)
             elif annot.supp:
@@ -238,82 +591,81 @@ class AnnotationExporter:
         """
         annot.sort_into_datasets()
         if annot.assigned_dataset is None:
+            self.report.count("unmatched_variables")
+            return
+
+        y_coordinate = self.variable_rows.get((annot.assigned_dataset, annot.variable_name))
+        if y_coordinate is not None:
+            if not self.overlay.is_variable_present(y_coordinate):
+                self.overlay.mark_variable(y_coordinate)
+            self.add_page(y_coordinate)
             return
 
-        for cell in self.ws_variables["B"]:
-            y_coordinate = cell.coordinate.split("B", 1)[1]
-
-            if cell.value == annot.assigned_dataset and self.ws_variables["C" + y_coordinate].value == annot.variable_name:
-                if self.ws_variables[f"{self.exporter_col_var}{y_coordinate}"].value == "Present":
-                    self.add_page_cell(self.ws_variables[f"M{y_coordinate}"])
-                    return
-
-                self.ws_variables[f"{self.exporter_col_var}{y_coordinate}"].value = "Present"
-                self.ws_variables[f"{self.exporter_col_var}{y_coordinate}"].fill = self.green_cell_fill
-                self.ws_variables[f"L{y_coordinate}"].value = "CRF"
-                self.add_page_cell(self.ws_variables[f"M{y_coordinate}"])
-                return
-
-        self.ws_variables.append({
-            "B": annot.assigned_dataset,
-            "C": annot.variable_name,
-            "L": "CRF",
-            "F": "200",
-            self.exporter_col_var: "Present"
-        })
-        self.add_page_cell(self.ws_variables[f"M{self.ws_variables.max_row}"])
-        self.ws_variables[self.exporter_col_var][self.ws_variables.max_row - 1].fill = self.green_cell_fill
-        for modified_col in ["B", "C", "L", "F"]:
-            self.ws_variables[modified_col][self.ws_variables.max_row - 1].fill = self.reset_cell_fill
-
-    def generate_variable_csv(self) -> None:
+        row_nr = self.overlay.append_variable(annot.assigned_dataset, annot.variable_name)
+        self.index_variable_row(annot.assigned_dataset, annot.variable_name, row_nr)
+        self.add_page(row_nr)
+
+    def generate_variable_csv(self, stream: TextIO | None = None) -> None:
         """
         generates the csv for the variables and saves it in the output folder
+        or writes it to the stream (for example sys.stdout)
+
+        :param stream: text stream the csv is written to instead of the file
+        :type stream: TextIO | None
         """
-        csv_list = ["Variable Name#Variable Label#Dataset Name#Page(s)\n"] # start with first line
-        for cell in self.ws_variables[self.exporter_col_var]:
-            if cell.value == "Present":
-                cell_str: str = ""
-                cell_str += str(self.ws_variables["C" + str(cell.row)].value) + "#"
-                cell_str += str(self.ws_variables["D" + str(cell.row)].value) + "#"
-                cell_str += str(self.ws_variables["B" + str(cell.row)].value) + "#"
-                cell_str += str(self.ws_variables["M" + str(cell.row)].value) + "\n"
-                csv_list.append(cell_str)
+        write_csv(stream or f"{self.output_folder}/Variables.csv", VARIABLE_CSV_HEADER, self.variable_csv_rows())
 
+    def variable_csv_rows(self) -> Iterator[list[str]]:
+        """
+        Yields the rows of the variable csv, one per present variable.
 
-        csv_str = "".join(csv_list)
-        with open(f"{self.output_folder}/Variables.csv", "w", encoding="utf-8") as f:
-            f.write(csv_str)
+        :return: iterator over the rows
+        :rtype: Iterator[list[str]]
+        """
+        for row_nr in self.overlay.present_variable_rows():
+            yield [str(self.overlay.variable_value(row_nr, col))
+                   for col in (VAR_NAME_COL, VAR_LABEL_COL, VAR_DATASET_COL, VAR_PAGES_COL)]
 
-    def generate_dataset_csv(self):
+    def generate_dataset_csv(self, stream: TextIO | None = None) -> None:
         """
         generates the csv for the datasets and saves it in the output folder
-        """
-        csv_list: list[str] = ["Dataset Name#Color\n"] # start with first line
-        for page in self.pdf.pages:
-            for dataset in page.get_datasets():
-                csv_entry: str = f"{dataset[0]}#{dataset[1]}\n"
-                if csv_entry in csv_list:
-                    continue
-                csv_list.append(csv_entry)
+        or writes it to the stream (for example sys.stdout)
 
-        csv_str = "".join(csv_list)
+        :param stream: text stream the csv is written to instead of the file
+        :type stream: TextIO | None
+        """
+        write_csv(stream or f"{self.output_folder}/Datasets.csv", DATASET_CSV_HEADER, self.dataset_csv_rows())
 
-        with open(f"{self.output_folder}/Datasets.csv", "w", encoding="utf-8") as f:
-            f.write(csv_str)
+    def dataset_csv_rows(
+            self,
+            pages: Iterable[Page | PageSummary] | None = None,
+            seen: set[tuple[str, str]] | None = None) -> Iterator[list[str]]:
+        """
+        Yields the rows of the dataset csv, every combination
+        of dataset name and color once, in order of appearance.
+
+        :param pages: the pages, by default all processed pages
+        :type pages: Iterable[Page | PageSummary] | None
+        :param seen: the rows that were already written, updated with the new rows
+        :type seen: set[tuple[str, str]] | None
+        :return: iterator over the rows
+        :rtype: Iterator[list[str]]
+        """
+        seen = set() if seen is None else seen
+        for page in self.pdf.processed_pages() if pages is None else pages:
+            for dataset_name, color in page.get_datasets():
+                row = (str(dataset_name), str(color))
+                if row in seen:
+                    continue
+                seen.add(row)
+                yield list(row)
 
-    def add_page_cell(self, cell: Cell):
+    def add_page(self, row_nr: int) -> None:
         """
-        Appends current page number to the string in a cell if it is not already present.
+        Adds the current page number to the pages of a variable row,
+        the page column is written when the output is saved.
 
-        :param cell: The cell in which to add the current page number
-        :type cell: Cell
+        :param row_nr: The row of the Variables sheet
+        :type row_nr: int
         """
-        if not cell.value:
-            new_value = str(self.current_page.get_page_nr() + 1)
-            cell.value = new_value
-            cell.fill = self.reset_cell_fill
-        elif str(self.current_page.get_page_nr() + 1) in cell.value:
-            return
-        else:
-            new_value = f"{cell.value} {self.current_page.get_page_nr() + 1}"
+        self.overlay.add_page(row_nr, self.current_page.get_page_nr() + 1)
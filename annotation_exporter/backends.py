@@ -0,0 +1,204 @@
+"""
+Reader backends for the annotation extraction. A backend returns the annotation
+records (see Annotation.get_multiple_variables) of every page of a pdf.
+
+-PyPDF2Backend reads the pages with PdfReader.pages \n
+-ScannerBackend (see scanner) walks the page tree once and only parses the
+ annotation objects, it is used by default
+
+If the scanner can not read a pdf, for example an encrypted one, PyPDF2Backend is used.
+
+RecordMemo keeps the records of parsed annotation objects between exports of the
+same pdf (see watch), the scanner then only parses annotations that changed.
+
+open_reader can memory map the pdf instead of reading it into memory, then only
+the parts of the file that are parsed are paged in and processes reading the same
+pdf share the os page cache. close_reader closes the mapping again.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import logging as lg
+import mmap
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING: # PyPDF2 is imported when a backend is used, so importing this module stays cheap
+    import PyPDF2
+
+logger = lg.getLogger(__name__)
+
+SCANNER: str = "scanner"
+PYPDF2: str = "pypdf2"
+BACKENDS: tuple[str] = (SCANNER, PYPDF2)
+DEFAULT_BACKEND: str = SCANNER
+
+
+class RecordMemo:
+    """
+    Annotation records keyed by the raw bytes of the annotation object they were
+    read from. Only the entries used by the last export are kept, call start
+    before every export.
+    """
+    def __init__(self) -> None:
+        """
+        Initialise class.
+        """
+        self.current: dict[bytes, list[tuple]] = {}
+        self.previous: dict[bytes, list[tuple]] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def start(self) -> None:
+        """
+        starts a new export, entries that are not used again are dropped at the next start
+        """
+        self.previous, self.current = self.current, {}
+        self.hits = self.misses = 0
+
+    def get(self, raw: bytes) -> list[tuple] | None:
+        """
+        Returns the records of an annotation object.
+
+        :param raw: the raw bytes of the object
+        :type raw: bytes
+        :return: the records or None if the object is not known
+        :rtype: list[tuple] | None
+        """
+        records = self.current.get(raw)
+        if records is None:
+            records = self.previous.pop(raw, None)
+            if records is None:
+                self.misses += 1
+                return None
+            self.current[raw] = records
+        self.hits += 1
+        return records
+
+    def put(self, raw: bytes, records: list[tuple]) -> None:
+        """
+        Stores the records of an annotation object.
+
+        :param raw: the raw bytes of the object
+        :type raw: bytes
+        :param records: the records
+        :type records: list[tuple]
+        """
+        self.current[raw] = records
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of hits and misses of the current export.
+
+        :return: dictionary with hits and misses
+        :rtype: dict[str, int]
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class PdfBackend:
+    """
+    Returns the annotation records of the pages of a pdf read with a PdfReader.
+    """
+    name: str = ""
+
+    def __init__(self, pdf_reader: PyPDF2.PdfReader) -> None:
+        """
+        Initialise class.
+
+        :param pdf_reader: the reader of the pdf
+        :type pdf_reader: PyPDF2.PdfReader
+        """
+        self.pdf_reader: PyPDF2.PdfReader = pdf_reader
+
+    def page_count(self) -> int:
+        """
+        Returns the number of pages.
+
+        :return: the number of pages
+        :rtype: int
+        """
+        return len(self.pdf_reader.pages)
+
+    def page_records(self, page_nr: int) -> list[tuple] | None:
+        """
+        Returns the annotation records of a page.
+
+        :param page_nr: the 0 based page number
+        :type page_nr: int
+        :return: list of records or None if the page has no annotations
+        :rtype: list[tuple] | None
+        """
+        from .generic import Page # circular import
+
+        return Page.extract_records(self.pdf_reader.pages[page_nr])
+
+
+class PyPDF2Backend(PdfBackend):
+    """
+    Reads the pages with PdfReader.pages.
+    """
+    name = PYPDF2
+
+
+def open_backend(
+        pdf_reader: PyPDF2.PdfReader,
+        name: str = DEFAULT_BACKEND,
+        memo: RecordMemo | None = None) -> PdfBackend:
+    """
+    Creates a backend for a pdf. If the scanner can not read the pdf PyPDF2 is used.
+    The memo is only used by the scanner.
+
+    :param pdf_reader: the reader of the pdf
+    :type pdf_reader: PyPDF2.PdfReader
+    :param name: name of the backend, see BACKENDS
+    :type name: str
+    :param memo: records of annotation objects read by previous exports
+    :type memo: RecordMemo | None
+    :return: the backend
+    :rtype: PdfBackend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"unknown backend {name}, choose from {list(BACKENDS)}")
+    if name == PYPDF2:
+        return PyPDF2Backend(pdf_reader)
+
+    from .scanner import ScanError, ScannerBackend
+
+    try:
+        return ScannerBackend(pdf_reader, memo)
+    except (ScanError, NotImplementedError) as e:
+        logger.info("reading the pdf with PyPDF2: %s", e)
+        return PyPDF2Backend(pdf_reader)
+
+
+def open_reader(pdf_path: str | Path, memory_map: bool = False) -> PyPDF2.PdfReader:
+    """
+    Opens a pdf with PyPDF2. PdfReader reads the whole file into memory, with memory_map
+    the file is mapped read only and the reader and the scanner read from the mapping.
+
+    :param pdf_path: path of the pdf
+    :type pdf_path: str | Path
+    :param memory_map: map the pdf instead of reading it
+    :type memory_map: bool
+    :return: the reader
+    :rtype: PyPDF2.PdfReader
+    """
+    import PyPDF2
+
+    if not memory_map or not Path(pdf_path).stat().st_size: # an empty file can not be mapped
+        return PyPDF2.PdfReader(pdf_path)
+    with open(pdf_path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # stays open after the file is closed
+    return PyPDF2.PdfReader(mapping)
+
+
+def close_reader(pdf_reader: PyPDF2.PdfReader) -> None:
+    """
+    Closes the memory mapping of a reader opened by open_reader, the reader and the
+    backends using it can not read the pdf afterwards. Readers of a pdf read into
+    memory are left as they are.
+
+    :param pdf_reader: the reader
+    :type pdf_reader: PyPDF2.PdfReader
+    """
+    if isinstance(pdf_reader.stream, mmap.mmap):
+        pdf_reader.stream.close()
@@ -0,0 +1,159 @@
+"""
+Persistent cache of extracted annotation records. The records of a page are
+stored under a hash of the values of its annotations the parser reads, so after
+a revision of the aCRF only pages whose annotations changed have to be parsed again.
+
+The cache remembers the page hashes every pdf used in its last export. Records
+that are not used by any pdf anymore, for example the pages of an old revision,
+are removed when the cache is closed, so a shared cache file does not keep growing.
+
+The records are stored pickled, only use cache files you created yourself.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import hashlib
+import logging as lg
+import os
+import pickle
+from io import BytesIO
+from sqlite3 import connect, Connection
+import PyPDF2
+from PyPDF2._page import PageObject
+from PyPDF2.generic import ArrayObject
+from .generic import Page
+
+logger = lg.getLogger(__name__)
+
+CACHE_VERSION: str = "3" # increase when the record format or the parsing changes
+ANNOT_KEYS: tuple[str, ...] = ("/Contents", "/C", "/Subtype", "/Rect") # read by Annotation.get_multiple_variables
+
+
+class AnnotationCache:
+    """
+    Sqlite backed cache mapping page hashes to annotation records,
+    keeps track of hits and misses. With a document (the path of the pdf)
+    the hashes of the pages are recorded and unused records are pruned on close.
+    """
+    def __init__(self, cache_path: str, document: str | None = None) -> None:
+        """
+        Opens or creates the cache file.
+
+        :param cache_path: path to the cache file
+        :type cache_path: str
+        :param document: path of the pdf whose pages are read
+        :type document: str | None
+        """
+        self.cache_path: str = cache_path
+        self.document: str | None = os.path.abspath(document) if document is not None else None
+        self.hits: int = 0
+        self.misses: int = 0
+        self.pages: int = 0 # pages read through the cache
+        self.seen: set[str] = set() # page hashes of this export
+        self.conn: Connection = connect(cache_path, timeout=30)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS page_records
+                    (page_hash TEXT PRIMARY KEY,
+                    records BLOB)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS page_documents
+                    (document TEXT,
+                    page_hash TEXT,
+                    PRIMARY KEY (document, page_hash))""")
+
+    @staticmethod
+    def page_hash(page: PageObject) -> str:
+        """
+        Hashes the values of the annotations of a page that the parser reads
+        (ANNOT_KEYS). Indirect values are resolved, so a revision that changes
+        an indirect /Contents without renumbering the object changes the hash.
+
+        :param page: the page object
+        :type page: PageObject
+        :return: hex digest of the annotations
+        :rtype: str
+        """
+        stream = BytesIO()
+        stream.write(f"{CACHE_VERSION}:{PyPDF2.__version__}:".encode())
+        for annot in page["/Annots"]:
+            annot_obj = annot.get_object()
+            for key in ANNOT_KEYS:
+                value = annot_obj.get(key)
+                if value is None:
+                    stream.write(b"-")
+                    continue
+                value = value.get_object()
+                if isinstance(value, ArrayObject): # colors and rectangles may hold references
+                    value = ArrayObject(item.get_object() for item in value)
+                value.write_to_stream(stream, None)
+                stream.write(b" ")
+            stream.write(b"\n")
+
+        return hashlib.sha256(stream.getvalue()).hexdigest()
+
+    def get_records(self, page: PageObject) -> list[tuple] | None:
+        """
+        Returns the annotation records of the page, from the cache if possible.
+
+        :param page: the page object
+        :type page: PageObject
+        :return: list of records or None if the page has no annotations
+        :rtype: list[tuple] | None
+        """
+        self.pages += 1
+        if "/Annots" not in page:
+            return None
+
+        page_hash = self.page_hash(page)
+        self.seen.add(page_hash)
+        row = self.conn.execute(
+            "SELECT records FROM page_records WHERE page_hash = ?", (page_hash,)).fetchone()
+        if row is not None:
+            self.hits += 1
+            return pickle.loads(row[0])
+
+        self.misses += 1
+        records = Page.extract_records(page)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO page_records (page_hash, records) VALUES (?,?)",
+            (page_hash, pickle.dumps(records)))
+        return records
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of cache hits and misses.
+
+        :return: dictionary with hits and misses
+        :rtype: dict[str, int]
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def prune(self) -> None:
+        """
+        Records the page hashes of this export as the hashes of the document and
+        removes the records no document uses anymore. Documents whose file was
+        deleted are forgotten. Only call this after all pages were read.
+        """
+        if self.document is not None:
+            self.conn.execute("DELETE FROM page_documents WHERE document = ?", (self.document,))
+            self.conn.executemany(
+                "INSERT INTO page_documents (document, page_hash) VALUES (?,?)",
+                ((self.document, page_hash) for page_hash in self.seen))
+
+        documents = [row[0] for row in self.conn.execute("SELECT DISTINCT document FROM page_documents")]
+        self.conn.executemany(
+            "DELETE FROM page_documents WHERE document = ?",
+            ((document,) for document in documents if not os.path.exists(document)))
+        removed = self.conn.execute(
+            "DELETE FROM page_records WHERE page_hash NOT IN (SELECT page_hash FROM page_documents)").rowcount
+        logger.info("annotation cache %s: removed %s unused pages", self.cache_path, removed)
+
+    def close(self, prune: bool = True) -> None:
+        """
+        Saves the new entries, prunes the cache (see prune) if the pages of the
+        document were read through it and closes the cache file.
+
+        :param prune: whether to remove the records no document uses anymore
+        :type prune: bool
+        """
+        logger.info("annotation cache %s: %s hits, %s misses", self.cache_path, self.hits, self.misses)
+        if prune and self.document is not None and self.pages:
+            self.prune()
+        self.conn.commit()
+        self.conn.close()
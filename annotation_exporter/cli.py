@@ -0,0 +1,237 @@
+"""
+Command line entry point for running exports without the gui. Takes a manifest of
+export jobs and runs them in a process pool, for example from a scheduler or container.
+
+The manifest is a csv file with the header ``pdf,template,output``, one job per line.
+An optional ``document`` column is used as the key of the job in the sqlite database,
+so jobs writing to the same output folder share one database.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import argparse
+import csv
+import json
+import logging as lg
+import sys
+import time
+from dataclasses import dataclass, asdict, field, replace
+from .backends import BACKENDS, DEFAULT_BACKEND, RecordMemo
+from .log_config import configure_logging
+from .options import ExportOptions, output_sinks
+from .store import DEFAULT_COLOR_PRECISION
+
+logger = lg.getLogger("annotation_exporter.cli") # __name__ is __main__ when run with -m
+
+
+@dataclass
+class ExportJob:
+    """
+    A single export, consisting of the pdf, the template, the output folder and the options of the export.
+    """
+    pdf: str
+    template: str
+    output: str
+    options: ExportOptions = field(default_factory=ExportOptions)
+
+
+@dataclass
+class JobResult:
+    """
+    The outcome of an export job. status is 0 on success and 1 on failure.
+    """
+    pdf: str
+    output: str
+    status: int
+    seconds: float
+    error: str | None = None
+    cache_stats: dict[str, int] | None = None
+    metrics: dict | None = None
+
+
+def read_manifest(manifest_path: str, options: ExportOptions | None = None) -> list[ExportJob]:
+    """
+    Reads the manifest file and creates the export jobs. The document column
+    of a row replaces the document of the options.
+
+    :param manifest_path: path to the manifest csv
+    :type manifest_path: str
+    :param options: the options of every job, the defaults if None
+    :type options: ExportOptions | None
+    :return: list of export jobs
+    :rtype: list[ExportJob]
+    """
+    options = options or ExportOptions()
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        return [
+            ExportJob(
+                row["pdf"], row["template"], row["output"],
+                replace(options, document=row["document"]) if row.get("document") else options)
+            for row in csv.DictReader(f)
+            if row["pdf"]
+            ]
+
+
+def run_job(job: ExportJob, memo: RecordMemo | None = None) -> JobResult:
+    """
+    Runs a single export job. Any error is caught and reported in the result
+    so one broken study does not stop the batch.
+
+    :param job: the job to run
+    :type job: ExportJob
+    :param memo: records of the annotations of previous exports of the pdf, see watch
+    :type memo: RecordMemo | None
+    :return: the result of the job
+    :rtype: JobResult
+    """
+    from .annot_export import AnnotationExporter
+
+    start = time.perf_counter()
+    try:
+        annotation_exporter = AnnotationExporter()
+        annotation_exporter.export_annotations(job.template, job.pdf, job.output, job.options, memo=memo)
+    except Exception as e: # pylint: disable=broad-except
+        logger.exception("export of %s failed", job.pdf)
+        return JobResult(job.pdf, job.output, 1, time.perf_counter() - start, repr(e))
+
+    return JobResult(
+        job.pdf, job.output, 0, time.perf_counter() - start,
+        cache_stats=annotation_exporter.cache_stats,
+        metrics=annotation_exporter.report.to_dict())
+
+
+def run_batch(
+        jobs: list[ExportJob],
+        workers: int = 1,
+        log_level: int | str = lg.WARNING,
+        log_file: str | None = None) -> list[JobResult]:
+    """
+    Runs all jobs, in a process pool if more than one worker is requested.
+    The results are in the same order as the jobs.
+
+    :param jobs: the jobs to run
+    :type jobs: list[ExportJob]
+    :param workers: number of worker processes
+    :type workers: int
+    :param log_level: log level of the worker processes
+    :type log_level: int | str
+    :param log_file: log file of the worker processes, they log to stderr if None
+    :type log_file: str | None
+    :return: list of results
+    :rtype: list[JobResult]
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [run_job(job) for job in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor # loads multiprocessing, only needed for batches
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=configure_logging,
+            initargs=(log_level, log_file, "a", False)) as executor:
+        return list(executor.map(run_job, jobs))
+
+
+def print_result(result: JobResult) -> None:
+    """
+    prints the state, duration and error of a job
+
+    :param result: the result of the job
+    :type result: JobResult
+    """
+    state = "ok" if result.status == 0 else "failed"
+    print(f"{state:6} {result.seconds:8.2f}s {result.pdf} -> {result.output}", flush=True) # the watch mode keeps running
+    if result.error:
+        print(f"       {result.error}", flush=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    parses the arguments, runs the batch and prints the result of every job
+
+    :param argv: command line arguments, defaults to sys.argv
+    :type argv: list[str] | None
+    :return: exit code, 0 if all jobs succeeded
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        prog="annotation-exporter",
+        description="Export aCRF annotations to SDTM specifications without the gui.")
+    parser.add_argument("manifest", help="csv file with the columns pdf,template,output")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument(
+        "--page-workers", type=int, default=1,
+        help="number of worker processes for the annotation extraction of each job")
+    parser.add_argument("--convert-old", action="store_true", help="convert the old dataset standard")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="append the converted annotations to a copy of the pdf instead of writing it again")
+    parser.add_argument("--sqlite", action="store_true", help="create a sqlite database per job")
+    parser.add_argument("--lazy", action="store_true", help="stream the pages to keep memory usage low")
+    parser.add_argument(
+        "--streaming", action="store_true",
+        help="write the workbook in streaming mode, faster but drops the template formatting")
+    parser.add_argument(
+        "--no-template-index", action="store_false", dest="template_index",
+        help="always parse the templates instead of using the index file next to them")
+    parser.add_argument(
+        "--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+        help="reader for the annotations, the scanner falls back to pypdf2 for pages it can not read")
+    parser.add_argument(
+        "--mmap", action="store_true", dest="memory_map",
+        help="memory map the pdfs instead of reading them into memory, workers share the os page cache")
+    parser.add_argument(
+        "--cache", help="annotation cache file, unchanged pages are not parsed again, pages of old revisions are pruned")
+    parser.add_argument(
+        "--color-precision", type=int, default=DEFAULT_COLOR_PRECISION,
+        help="decimals the colors are rounded to when variables are matched to datasets")
+    parser.add_argument(
+        "--exact-colors", action="store_const", const=None, dest="color_precision",
+        help="only match variables to datasets with exactly the same color")
+    parser.add_argument(
+        "--page-ranges", action="store_true", help="combine consecutive pages into ranges, for example 3-7")
+    parser.add_argument("--trace-memory", action="store_true", help="measure the peak memory of every stage")
+    parser.add_argument("--profile", action="store_true", help="include a cProfile capture in the report")
+    parser.add_argument("--log-level", default="WARNING", help="log level, for example INFO or DEBUG")
+    parser.add_argument("--log-file", help="write the log to this file instead of stderr")
+    parser.add_argument("--report", help="write the job results to this json file")
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="keep running and export a job again when its pdf or template changes, the jobs run one at a time")
+    parser.add_argument(
+        "--settle", type=float, default=1.0,
+        help="watch mode: seconds without further changes before a changed job is exported")
+    parser.add_argument("--poll", action="store_true", help="watch mode: poll for changes instead of using inotify")
+    args = parser.parse_args(argv)
+    if args.cache is not None and args.page_workers > 1:
+        parser.error("--cache only works with a single page worker, the page workers parse the pages themselves")
+    configure_logging(args.log_level.upper(), args.log_file)
+
+    options = ExportOptions(
+        lazy=args.lazy, workers=args.page_workers, cache_path=args.cache, streaming=args.streaming,
+        template_index=args.template_index, trace_memory=args.trace_memory, profile=args.profile,
+        color_precision=args.color_precision, page_ranges=args.page_ranges,
+        sinks=output_sinks(args.convert_old, args.sqlite), incremental=args.incremental,
+        backend=args.backend, memory_map=args.memory_map)
+    if args.watch:
+        from .watch import WatchDaemon # circular import
+
+        try:
+            WatchDaemon(args.manifest, options, args.settle, args.poll, on_result=print_result).run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    jobs = read_manifest(args.manifest, options)
+    results = run_batch(jobs, args.workers, args.log_level.upper(), args.log_file)
+
+    for result in results:
+        print_result(result)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+
+    return int(any(result.status for result in results))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,73 +2,135 @@
 contains multiple classes for various tasks: \n
 -Page class for keeping track of page information and annotations \n
 -PDF class for reading and modifying pdf files \n
--Annotation class for acessing annotations easily
+-Annotation class for acessing annotations in the AnnotationStore easily
 """
 from __future__ import annotations # Nessecary for typehinting
-import os
 import logging as lg
-import PyPDF2
-from PyPDF2.generic import AnnotationBuilder, NameObject, DictionaryObject, RectangleObject
-from PyPDF2._page import PageObject
+import mmap
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+from .backends import DEFAULT_BACKEND, PdfBackend, RecordMemo, close_reader, open_backend
+from .metrics import ExportReport
+from .parser import tokenize
+from .store import AnnotationStore, DEFAULT_COLOR_PRECISION, DATASET, NEW_DATASET, SUPP, VALID
 
+if TYPE_CHECKING: # PyPDF2 is imported where it is used, so importing this module stays cheap
+    import PyPDF2
+    from PyPDF2.generic import DictionaryObject
+    from PyPDF2._page import PageObject
+    from .cache import AnnotationCache
 
-SEPARATORS: tuple[str] = (",", ";", "|") # expand as needed
-
-lg.basicConfig(
-    filename=f"{os.path.dirname(__file__)}/Annotation_Exporter.log",
-    encoding="utf-8",
-    level=lg.DEBUG,
-    filemode="w")
+logger = lg.getLogger(__name__)
 
 
 class Page:
     """
     Keeps track of the datasets on each page and the page number.
+    The annotations are kept in an AnnotationStore.
     """
-    def __init__(self, page: PageObject, page_nr: int) -> None:
+    def __init__(
+            self,
+            page: PageObject | None,
+            page_nr: int,
+            records: list[tuple] | None = None,
+            store: AnnotationStore | None = None) -> None:
         """
         Initialise class. page_nr is passed because of the way PyPDF2 works
-        where the page number is not in the page object.
+        where the page number is not in the page object. If the annotation
+        records were already extracted (for example by a worker process)
+        they can be passed instead of the page object.
         
         :param page: The page object.
-        :type page: PageObject
+        :type page: PageObject | None
         :param page_nr: Page number.
         :type page: int
+        :param records: already extracted annotation records, see extract_records
+        :type records: list[tuple] | None
+        :param store: the store the annotations are added to, a new one if None
+        :type store: AnnotationStore | None
         """
-        self.page: PageObject = page
+        self.page: PageObject | None = page
         self.page_nr: int = page_nr
-        self.datasets: list[tuple] = []
-        self.has_annotations: bool = False
-        self.annotations: list[Annotation] = self.generate_annotation_list()
+        self.store: AnnotationStore = store if store is not None else AnnotationStore()
+        self.datasets: list[tuple] = self.store.page_datasets(page_nr)
+        if records is None and page is not None:
+            records = self.extract_records(page)
+        self.has_annotations: bool = records is not None
+        self.indices: range | list[int] = self.generate_annotation_list(records or [])
+
+    @classmethod
+    def from_store(cls, store: AnnotationStore, page_nr: int, indices: range) -> Page:
+        """
+        Returns a page over annotations that are already in a store.
 
-    def generate_annotation_list(self) -> list[Annotation]:
+        :param store: the store
+        :type store: AnnotationStore
+        :param page_nr: Page number.
+        :type page_nr: int
+        :param indices: the indices of the annotations of the page
+        :type indices: range
+        :return: the page
+        :rtype: Page
         """
-        Generates the list of annotations, resolves 
-        IndirectObject references and creates Annotation objects.
-        
-        :return: list of annotations
-        :rtype: list[Annotation]
+        page = cls(None, page_nr, store=store)
+        page.has_annotations = len(indices) > 0
+        page.indices = indices
+        return page
+
+    @staticmethod
+    def extract_records(page: PageObject) -> list[tuple] | None:
         """
-        if "/Annots" not in self.page:
-            return []
+        Resolves the IndirectObject references of the page annotations and
+        splits them into records, one per variable. The records are plain
+        tuples, so they can be sent between processes.
+
+        :param page: The page object.
+        :type page: PageObject
+        :return: list of records or None if the page has no annotations
+        :rtype: list[tuple] | None
+        """
+        if "/Annots" not in page:
+            return None
 
-        self.has_annotations = True
-        annotation_dictionary_objects: list[DictionaryObject] = [annot.get_object() for annot in self.page["/Annots"]]
+        annotation_dictionary_objects: list[DictionaryObject] = [annot.get_object() for annot in page["/Annots"]]
 
         return [
-            Annotation(annot_dict, self)
+            record
             for dict_obj in annotation_dictionary_objects
-            for annot_dict in Annotation.get_multiple_variables(dict_obj)
+            for record in Annotation.get_multiple_variables(dict_obj)
             ]
 
+    def generate_annotation_list(self, records: list[tuple]) -> range:
+        """
+        Adds the annotation records to the store.
+
+        :param records: the annotation records of the page
+        :type records: list[tuple]
+        :return: the indices of the annotations in the store
+        :rtype: range
+        """
+        for record in records:
+            if record[2] != "/FreeText":
+                logger.info("Unsupported Annotation on page %s", self.page_nr)
+        return self.store.extend(records, self.page_nr)
+
     def add_annotation(self, annotation: Annotation) -> None:
         """
-        Adds an annotation to the page.
+        Adds an annotation to the page. Annotations of another store or page
+        are copied into the store of the page.
 
         :param annotation: The annotation to add.
         :type annotation: Annotation
         """
-        self.annotations.append(annotation)
+        index = annotation.index
+        if annotation.store is not self.store or annotation.page_nr != self.page_nr:
+            index = self.store.append_row(annotation.store, annotation.index, self.page_nr)
+            if annotation.dataset:
+                self.store.add_dataset(self.page_nr, annotation.dataset_name, annotation.color)
+
+        if isinstance(self.indices, range) and index == self.indices.stop:
+            self.indices = range(self.indices.start, index + 1)
+        else: # not next to the other annotations of the page
+            self.indices = [*self.indices, index]
 
     def get_annotations(self) -> list[Annotation]:
         """
@@ -77,7 +139,7 @@ class Page:
         :return: list of annotations
         :rtype: list[Annotation]
         """
-        return self.annotations
+        return [Annotation(self.store, index) for index in self.indices]
 
     def get_page_nr(self) -> int:
         """
@@ -101,18 +163,146 @@ class Page:
         """
         Adds the datasets to the list.
 
-        :param data: The dataset to add.
+        :param data: The dataset to add, a tuple with dataset name and color
         :type data: tuple
         """
-        self.datasets.append(data)
+        self.store.add_dataset(self.page_nr, *data)
+
+class PageSummary:
+    """
+    Small summary of a processed page without the page object, so it can be
+    freed. Only the valid annotations are kept, in a store of their own, so a
+    summary does not keep the store of the other pages alive. Offers the same
+    getters as Page.
+    """
+    __slots__ = ("page_nr", "datasets", "store", "indices")
+
+    def __init__(self, page: Page) -> None:
+        """
+        Initialise class from a processed page.
+
+        :param page: the processed page
+        :type page: Page
+        """
+        flags = page.store.flags
+        self.page_nr: int = page.get_page_nr()
+        self.store: AnnotationStore = page.store.page_slice(
+            self.page_nr, [index for index in page.indices if flags[index] & VALID])
+        self.datasets: list[tuple] = self.store.page_datasets(self.page_nr)
+        self.indices: range = range(len(self.store))
+
+    def get_annotations(self) -> list[Annotation]:
+        """
+        getter for the valid annotations
+
+        :return: list of annotations
+        :rtype: list[Annotation]
+        """
+        return [Annotation(self.store, index) for index in self.indices]
+
+    def get_page_nr(self) -> int:
+        """
+        Simple getter for the page number.
+
+        :return: The page number.
+        :rtype: int
+        """
+        return self.page_nr
+
+    def get_datasets(self) -> list[tuple]:
+        """
+        Simple getter for all datasets.
+
+        :return: The datasets. each dataset is a tuple with dataset name and color
+        :rtype: list[tuple]
+        """
+        return self.datasets
 
 class PDF:
     """
     Modifies the pdf file and generates a data structure to work on
     """
-    def __init__(self, pdf_reader: PyPDF2.PdfReader) -> None:
+    def __init__(
+            self,
+            pdf_reader: PyPDF2.PdfReader,
+            lazy: bool = False,
+            workers: int = 1,
+            pdf_path: str | None = None,
+            cache: AnnotationCache | None = None,
+            report: ExportReport | None = None,
+            color_precision: int | None = DEFAULT_COLOR_PRECISION,
+            backend: str = DEFAULT_BACKEND,
+            memo: RecordMemo | None = None) -> None:
+        """
+        Initialise class. In lazy mode the pages are not created up front,
+        they are generated one at a time by iter_pages and only a summary of
+        each page is kept afterwards. With more than one worker the annotations
+        are extracted in a process pool, this requires the path of the pdf.
+        If a cache is passed, pages with unchanged annotations are taken
+        from it instead of being parsed. The cache is only used with a single
+        worker, with more workers it is ignored with a warning.
+        The annotations of all pages are kept in the AnnotationStore self.store, in lazy
+        mode every page gets a store of its own (sharing the string and color tables)
+        that is freed with the page.
+        Variables are matched to datasets with colors rounded to color_precision decimals.
+        The annotations are read with the given reader backend (see backends), pages
+        taken from the cache are always read with PyPDF2. If the pdf is memory mapped
+        (see backends.open_reader) the workers map it as well and close unmaps it. The memo
+        keeps the records of the annotations between exports (only used by the scanner with
+        a single worker).
+
+        :param pdf_reader: the reader of the pdf file
+        :type pdf_reader: PyPDF2.PdfReader
+        :param lazy: whether to stream the pages instead of creating them all at once
+        :type lazy: bool
+        :param workers: number of worker processes for the extraction
+        :type workers: int
+        :param pdf_path: path to the pdf file, required for workers > 1
+        :type pdf_path: str | None
+        :param cache: cache of annotation records
+        :type cache: AnnotationCache | None
+        :param report: report the stages and counts are recorded in
+        :type report: ExportReport | None
+        :param color_precision: decimals of the color matching, None for exact matches
+        :type color_precision: int | None
+        :param backend: name of the reader backend, see backends.BACKENDS
+        :type backend: str
+        :param memo: records of annotation objects read by previous exports
+        :type memo: RecordMemo | None
+        """
         self.pdf_reader: PyPDF2.PdfReader =  pdf_reader
-        self.pages: list[Page] = self.init_pages()
+        self.lazy: bool = lazy
+        self.workers: int = workers if pdf_path is not None else 1
+        self.pdf_path: str | None = pdf_path
+        self.cache: AnnotationCache | None = cache
+        if cache is not None and self.workers > 1: # the workers parse the pages in their own processes
+            logger.warning("the annotation cache is not used with %s page workers", self.workers)
+            self.cache = None
+        self.report: ExportReport = report if report is not None else ExportReport()
+        self.color_precision: int | None = color_precision
+        self.store: AnnotationStore = AnnotationStore(color_precision)
+        self.summaries: list[PageSummary] = []
+        self.pages: list[Page] = []
+        self.backend: PdfBackend = open_backend(pdf_reader, backend, memo)
+        self.memory_map: bool = isinstance(pdf_reader.stream, mmap.mmap)
+        if not lazy:
+            with self.report.stage("init_pages"):
+                self.pages = self.init_pages()
+
+    def close(self) -> None:
+        """
+        Closes the memory mapping of the pdf, the pdf can not be read afterwards.
+        Does nothing if the pdf was read into memory.
+        """
+        close_reader(self.pdf_reader)
+
+    def check_open(self) -> None:
+        """
+        Raises ValueError if the memory mapping of the pdf was closed.
+        """
+        if self.memory_map and self.pdf_reader.stream.closed:
+            raise ValueError(
+                "the memory mapped pdf was closed after the export, pass the outputs as sinks to export_annotations")
 
     def init_pages(self) -> list[Page]:
         """
@@ -121,26 +311,133 @@ class PDF:
         :return: list of pages
         :rtype: list[Page]
         """
-        page_list: list[Page] = []
-        for page in self.pdf_reader.pages:
-            page_list.append(Page(page, self.pdf_reader.get_page_number(page)))
+        return list(self.generate_pages())
 
-        return page_list
+    def page_count(self) -> int:
+        """
+        Returns the number of pages of the pdf.
 
-    def convert_old_standard(self, output_folder: str) -> None:
+        :return: the number of pages
+        :rtype: int
+        """
+        return self.backend.page_count()
+
+    def generate_pages(self) -> Iterator[Page]:
+        """
+        Creates the pages one at a time, extracting the annotations
+        in worker processes if more than one worker is used.
+
+        :return: iterator over the pages
+        :rtype: Iterator[Page]
+        """
+        self.check_open()
+        if self.cache is not None:
+            for page_nr, page_obj in enumerate(self.pdf_reader.pages):
+                yield Page(page_obj, page_nr, self.cache.get_records(page_obj), self.store)
+            return
+
+        if self.workers <= 1:
+            for page_nr in range(self.page_count()):
+                yield Page(None, page_nr, self.backend.page_records(page_nr), self.store)
+            return
+
+        from .parallel import iter_page_records # circular import
+
+        for page_nr, records in iter_page_records(
+                self.pdf_path, self.page_count(), self.workers, backend=self.backend.name, memory_map=self.memory_map):
+            yield Page(None, page_nr, records, self.store)
+
+    def iter_pages(self) -> Iterator[Page]:
+        """
+        Yields the pages of the pdf. In lazy mode each page is created in a store of
+        its own when it is requested and replaced by a PageSummary once the next page
+        is requested, so only one page worth of annotations is in memory at a time.
+
+        :return: iterator over the pages
+        :rtype: Iterator[Page]
+        """
+        if not self.lazy:
+            yield from self.pages
+            return
+
+        self.summaries = []
+        self.store = AnnotationStore(self.color_precision)
+        for page in self.generate_pages():
+            yield page
+            self.summaries.append(PageSummary(page))
+            self.store = self.store.empty_copy() # generate_pages creates the next page in it
+
+    def processed_pages(self) -> Iterable[Page | PageSummary]:
+        """
+        Returns the pages for stages that run after the export, these are
+        the summaries in lazy mode. If the pages have not been streamed yet
+        they are streamed now.
+
+        :return: the pages or page summaries
+        :rtype: Iterable[Page | PageSummary]
+        """
+        if not self.lazy:
+            return self.pages
+        if not self.summaries:
+            return self.iter_pages()
+        return self.summaries
+
+    def convert_old_standard(self, output_folder: str, incremental: bool = False) -> None:
         """
         Converts the old standard to the new standard,
-        for reference check the gitHub repo.
+        for reference check the gitHub repo. In incremental mode only the new
+        annotations are appended to a copy of the original file instead of
+        writing the whole document again, which is much faster for large pdfs.
 
         :param output_folder: path to the output folder
         :type output_folder: str
+        :param incremental: whether to append the changes to a copy of the original file
+        :type incremental: bool
         """
-        writer = PyPDF2.PdfWriter()
-        new_pdf_path: str = f"{output_folder}/output.pdf"
+        with self.report.stage("convert_old_standard"):
+            self.write_converted_pdf(output_folder, incremental)
+
+    def write_converted_pdf(
+            self,
+            output_folder: str,
+            incremental: bool = False,
+            annotations: Iterable[tuple[int, DictionaryObject]] | None = None) -> None:
+        """
+        Writes the converted pdf, see convert_old_standard.
 
-        writer.append_pages_from_reader(self.pdf_reader)
+        :param output_folder: path to the output folder
+        :type output_folder: str
+        :param incremental: whether to append the changes to a copy of the original file
+        :type incremental: bool
+        :param annotations: the converted annotations, by default the ones of all processed pages
+        :type annotations: Iterable[tuple[int, DictionaryObject]] | None
+        """
+        self.check_open()
+        if annotations is None:
+            annotations = self.converted_annotations(self.processed_pages())
+
+        if incremental and self.pdf_reader.is_encrypted:
+            logger.warning("incremental updates of encrypted pdfs are not supported, writing the whole pdf")
+            incremental = False
+
+        if incremental:
+            self.write_converted_incremental(output_folder, annotations)
+        else:
+            self.write_converted(output_folder, annotations)
 
-        for page in self.pages:
+    @staticmethod
+    def converted_annotations(pages: Iterable[Page | PageSummary]) -> Iterator[tuple[int, DictionaryObject]]:
+        """
+        Yields the new standard annotations for the old standard dataset annotations.
+
+        :param pages: the processed pages
+        :type pages: Iterable[Page | PageSummary]
+        :return: iterator over (page number, annotation) tuples
+        :rtype: Iterator[tuple[int, DictionaryObject]]
+        """
+        from PyPDF2.generic import AnnotationBuilder, NameObject
+
+        for page in pages:
 
             for annot in page.get_annotations():
                 if not annot.dataset or annot.new_datset:
@@ -152,123 +449,228 @@ class PDF:
                     rect=annot.rect,
                 )
                 new_annot[NameObject("/C")] = annot.color
-                writer.add_annotation(page.get_page_nr(), new_annot)
+                yield page.get_page_nr(), new_annot
+
+    def write_converted(self, output_folder: str, annotations: Iterable[tuple[int, DictionaryObject]]) -> None:
+        """
+        Writes the pdf with the converted dataset annotations,
+        see convert_old_standard.
+
+        :param output_folder: path to the output folder
+        :type output_folder: str
+        :param annotations: the converted annotations
+        :type annotations: Iterable[tuple[int, DictionaryObject]]
+        """
+        import PyPDF2
+
+        writer = PyPDF2.PdfWriter()
+        new_pdf_path: str = f"{output_folder}/output.pdf"
+
+        writer.append_pages_from_reader(self.pdf_reader)
+
+        for page_nr, new_annot in annotations:
+            writer.add_annotation(page_nr, new_annot)
 
         with open(new_pdf_path, "wb") as fp:
             writer.write(fp)
 
+    def write_converted_incremental(
+            self,
+            output_folder: str,
+            annotations: Iterable[tuple[int, DictionaryObject]]) -> None:
+        """
+        Writes a copy of the pdf with the converted dataset annotations
+        appended as an incremental update, see convert_old_standard.
+
+        :param output_folder: path to the output folder
+        :type output_folder: str
+        :param annotations: the converted annotations
+        :type annotations: Iterable[tuple[int, DictionaryObject]]
+        """
+        from .incremental import IncrementalUpdate
+
+        update = IncrementalUpdate(self.pdf_reader)
+        for page_nr, new_annot in annotations:
+            update.add_annotation(page_nr, new_annot)
+        update.write(f"{output_folder}/output.pdf")
+
 class Annotation:
     """
-    This is the class that stores a single annotation with convenient 
-    access to frequently used proprties and some useful methods
+    This is the class that gives convenient access to a single annotation
+    in an AnnotationStore and some useful methods. It only keeps the store
+    and the index of the annotation.
     """
-    def __init__(self, annot_obj: DictionaryObject, page: Page) -> None:
-        self.is_valid: bool = True
-        self.annot_obj = annot_obj
-        self.page: Page = page
-        self.dataset: bool = False
-        self.new_datset: bool = False
-        self.supp: bool = False
-        self.separators: tuple[str] = SEPARATORS
-        self.dataset_name: str = None
-        self.assigned_dataset: str = None
-        self.variable_name: str = None
+    __slots__ = ("store", "index")
 
+    def __init__(self, store: AnnotationStore, index: int) -> None:
+        """
+        Initialise class.
+
+        :param store: the store the annotation is in
+        :type store: AnnotationStore
+        :param index: the index of the annotation in the store
+        :type index: int
+        """
+        self.store: AnnotationStore = store
+        self.index: int = index
+
+    @classmethod
+    def from_object(cls, annot_obj: dict[str, Any] | tuple, page: Page) -> Annotation:
+        """
+        Creates an annotation from an annotation dictionary or record (see get_multiple_variables),
+        like annotations were created before the store was introduced. It is added to the store
+        of the page, datasets are added to the datasets of the page.
+
+        :param annot_obj: the annotation dictionary or record
+        :type annot_obj: dict[str, Any] | tuple
+        :param page: the page of the annotation
+        :type page: Page
+        :return: the annotation
+        :rtype: Annotation
+        """
+        return cls(page.store, page.store.append(cls.to_record(annot_obj), page.page_nr))
+
+    @staticmethod
+    def to_record(annot_obj: dict[str, Any] | tuple) -> tuple:
+        """
+        Converts an annotation dictionary with /Contents, /C, /Subtype and /Rect into
+        a record, dictionaries with missing keys become unsupported annotations.
+
+        :param annot_obj: the annotation dictionary or record
+        :type annot_obj: dict[str, Any] | tuple
+        :return: the record
+        :rtype: tuple
+        """
+        if isinstance(annot_obj, tuple):
+            return annot_obj
         try:
-            self.color: list[float] = annot_obj["/C"]
-            self.content: str = annot_obj["/Contents"]
-            self.content_without_spaces: str = "".join(self.content.split())
-            self.rect: RectangleObject = annot_obj["/Rect"]
-            self.subtype: str = annot_obj["/Subtype"]
-            if self.subtype != "/FreeText":
-                raise KeyError # not a KeyError but requires the same action
+            return annot_obj["/Contents"], annot_obj["/C"], annot_obj["/Subtype"], annot_obj["/Rect"]
         except KeyError:
-            lg.info("Unsupported Annotation: %s", annot_obj)
-            self.is_valid = False
-            return
+            return "", annot_obj.get("/C") or [], None, annot_obj.get("/Rect") or (0, 0, 0, 0)
+
+    @property
+    def is_valid(self) -> bool:
+        """
+        whether the annotation is a FreeText annotation
+        """
+        return bool(self.store.flags[self.index] & VALID)
+
+    @property
+    def dataset(self) -> bool:
+        """
+        whether the annotation is a dataset
+        """
+        return bool(self.store.flags[self.index] & DATASET)
 
-        self.dataset = self.is_dataset()
-        self.supp = self.is_supp()
+    @property
+    def new_datset(self) -> bool:
+        """
+        whether the annotation is a dataset in the new standard
+        """
+        return bool(self.store.flags[self.index] & NEW_DATASET)
 
-        self.truncate_exess_text()
+    @property
+    def supp(self) -> bool:
+        """
+        whether the annotation is a supplementary variable
+        """
+        return bool(self.store.flags[self.index] & SUPP)
 
-    def truncate_exess_text(self) -> None:
+    @property
+    def content(self) -> str:
         """
-        truncates the annotation if it contains invalid text
+        the text of the annotation, truncated at the first separator for variables
         """
-        if self.dataset or self.supp:
-            return
+        return self.store.strings[self.store.contents[self.index]]
+
+    @property
+    def dataset_name(self) -> str | None:
+        """
+        the name of the dataset for datasets and supplementary variables
+        """
+        return self.store.string(self.store.dataset_names[self.index])
 
-        for separator in SEPARATORS:
-            if separator not in self.content:
-                continue
+    @property
+    def variable_name(self) -> str | None:
+        """
+        the name of the variable for variables
+        """
+        return self.store.string(self.store.variable_names[self.index])
+
+    @property
+    def assigned_dataset(self) -> str | None:
+        """
+        the dataset the variable was sorted into, see sort_into_datasets
+        """
+        return self.store.string(self.store.assigned_datasets[self.index])
+
+    @assigned_dataset.setter
+    def assigned_dataset(self, dataset_name: str | None) -> None:
+        self.store.assigned_datasets[self.index] = self.store.intern(dataset_name)
 
-            self.content = self.content.split(separator, 1)[0]
+    @property
+    def color(self) -> list[float]:
+        """
+        the color of the annotation
+        """
+        return self.store.colors[self.store.annotation_colors[self.index]]
+
+    @property
+    def rect(self) -> tuple[float, ...]:
+        """
+        the rectangle of the annotation
+        """
+        return tuple(self.store.rects[self.index * 4:self.index * 4 + 4])
+
+    @property
+    def page_nr(self) -> int:
+        """
+        the number of the page the annotation is on
+        """
+        return self.store.page_nrs[self.index]
+
+    @property
+    def page(self) -> Page:
+        """
+        the page the annotation is on, a Page over the annotations of the page in the store
+        """
+        return Page.from_store(self.store, self.page_nr, self.store.page_block(self.index))
 
     @staticmethod
-    def get_multiple_variables(annot_obj: DictionaryObject) -> list[dict]:
+    def get_multiple_variables(annot_obj: DictionaryObject) -> list[tuple]:
         """
         returns all variables from an annotation. this is used to pick up on multiple variables
-        being in the same annotation.  This has the side effect of converting the DictionaryObjects 
-        to dictionaries which looses some (hopefully irrelevant) data.
+        being in the same annotation. The variables are returned as records, tuples of
+        (contents, color, subtype, rect), which looses some (hopefully irrelevant) data.
 
         :param annot_obj: the annotation object
         :type annot_obj: DictionaryObject
-        :return: list of annotations as a list of dictionaries
-        :rtype: list[dict]
+        :return: list of annotation records
+        :rtype: list[tuple]
         """
-        split_set = set()
         try: # try except as this is an unsafe annotation
             content: str = annot_obj["/Contents"]
             color: list[float] = annot_obj["/C"]
             subtype: str = annot_obj["/Subtype"]
             rect: list[float] = annot_obj["/Rect"]
         except KeyError:
-            lg.info("Unsupported Annotation: %s", annot_obj)
+            logger.info("Unsupported Annotation without contents")
+            if logger.isEnabledFor(lg.DEBUG): # the repr of the annotation object is expensive
+                logger.debug("Unsupported Annotation: %s", annot_obj)
             return []
 
-        for separator in SEPARATORS:
-            for possible_variable in content.split(separator):
-                if any(ext in possible_variable for ext in SEPARATORS): # if any separator is in the string don't add it
-                    continue
-                elif "("  in possible_variable: #brackets are special cases
-                    possible_variable = possible_variable.split("(", 1)[0]
-                elif ")" in possible_variable:
-                    possible_variable = possible_variable.split(")", 1)[1]
-
-                if possible_variable == "":
-                    continue
-                split_set.add(possible_variable)
-
-        split_content = list(split_set)
-        return [{"/Contents": string,
-                    "/C": color,
-                    "/Subtype": subtype,
-                    "/Rect": rect}
-                    for string in split_content]
+        return [(string, color, subtype, rect) for string in tokenize(content)]
 
     def is_dataset(self) -> bool:
         """
-        Returns wehther the annotation is a dataset or not
-        and implicitly adds the dataset to the page. There is
-        a static method that checks if a string is a dataset 
-        aswell so if you need to call this on just a string you
-        can use Annotation.is_dataset_static(string).
+        Returns wehther the annotation is a dataset or not. The annotation is
+        classified when it is added to the store, which also adds datasets to
+        their page. Annotation.is_dataset_static checks a string.
 
         :return: if the annotation is a dataset
         :rtype: bool
         """
-        if len(self.content_without_spaces.split("(", 1)[0]) == 2: # new standard
-            self.new_datset = True
-            self.dataset_name = self.content_without_spaces.split("(", 1)[0]
-            self.page.add_datasets((self.dataset_name, self.color))
-            return True
-        elif len(self.content_without_spaces.split("=", 1)[0]) == 2: # old standard
-            self.dataset_name = self.content_without_spaces.split("=", 1)[0]
-            self.page.add_datasets((self.dataset_name, self.color))
-            return True
-        self.variable_name = self.content_without_spaces.split("=", 1)[0]
-        return False
+        return self.dataset
 
     def is_supp(self) -> bool:
         """
@@ -277,24 +679,25 @@ class Annotation:
         :return: if the annotation is a supplementary variable
         :rtype: bool
         """
-        if self.content_without_spaces.split("=", 1)[0][:4] == "SUPP":
-            self.dataset_name = self.content_without_spaces.split("=", 1)[0][:6]
-            return True
-        return False
+        return self.supp
+
+    def truncate_exess_text(self) -> None:
+        """
+        kept for compatibility, the text is truncated when the annotation is added to the store
+        """
 
     def sort_into_datasets(self) -> None:
         """
-        Sorts self into one of the datasets from the page it is on
+        Sorts self into the dataset with the same color from the page it is on
         """
-        for combination in self.page.get_datasets():
-            if combination[1] == self.color: # match color
-                lg.debug(
-                        """Variable %s was assiged %s because %s is the same as %s""", 
-                        self.content, combination, self.color, combination[1])
-                self.assigned_dataset = combination[0]
-                return
+        dataset_name = self.store.match_dataset(self.index)
+        if dataset_name is None:
+            logger.error("no dataset was matched to variable! %s", self)
+            return
 
-        lg.error("no dataset was matched to variable! %s", self)
+        if logger.isEnabledFor(lg.DEBUG): # called for every variable
+            logger.debug("Variable %s was assiged %s because of the color %s", self.content, dataset_name, self.color)
+        self.assigned_dataset = dataset_name
 
     @staticmethod
     def is_dataset_static(string: str) -> bool:
@@ -313,7 +716,7 @@ class Annotation:
         return False
 
     def __str__(self) -> str:
-        return f"Annotation: {self.content} on page {self.page.get_page_nr()}"
+        return f"Annotation: {self.content} on page {self.page_nr}"
 
     def __repr__(self) -> str:
-        return f"Annotation: {self.content} on page {self.page.get_page_nr()}"
+        return f"Annotation: {self.content} on page {self.page_nr}"
@@ -0,0 +1,238 @@
+"""
+Incremental update of a pdf file. Instead of writing the whole document again
+the new and changed objects and a new cross reference section are appended to
+a copy of the original file (PDF 1.7, 7.5.6), so the time it takes depends on
+the number of changed objects and not on the size of the document.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import io
+import shutil
+from typing import BinaryIO, Iterator
+import PyPDF2
+from PyPDF2.errors import PdfReadError
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, PdfObject)
+
+STARTXREF: bytes = b"startxref"
+XREF_TABLE: bytes = b"xref"
+TAIL_SIZE: int = 1024 # startxref has to be in the last 1024 bytes
+TRAILER_KEYS: tuple[str] = ("/Root", "/Info", "/ID")
+
+
+def find_startxref(stream: BinaryIO) -> int:
+    """
+    Returns the offset of the last cross reference section of a pdf.
+
+    :param stream: the pdf file
+    :type stream: BinaryIO
+    :return: the offset of the cross reference section
+    :rtype: int
+    """
+    stream.seek(0, io.SEEK_END)
+    stream.seek(max(0, stream.tell() - TAIL_SIZE))
+    tail = stream.read()
+    position = tail.rfind(STARTXREF)
+    if position < 0:
+        raise PdfReadError("startxref not found")
+    return int(tail[position + len(STARTXREF):].split()[0])
+
+
+def subsections(idnums: list[int]) -> Iterator[tuple[int, int]]:
+    """
+    Splits sorted object numbers into runs of consecutive numbers.
+
+    :param idnums: the sorted object numbers
+    :type idnums: list[int]
+    :return: iterator over (first object number, number of objects) tuples
+    :rtype: Iterator[tuple[int, int]]
+    """
+    start = count = 0
+    for idnum in idnums:
+        if count and idnum == start + count:
+            count += 1
+            continue
+        if count:
+            yield start, count
+        start, count = idnum, 1
+    if count:
+        yield start, count
+
+
+class IncrementalUpdate:
+    """
+    Collects the objects of an incremental update of a pdf read with a
+    PdfReader and appends them to a copy of the file. The cross reference
+    section is written in the same form (table or stream) as the last one
+    of the original file. Encrypted files are not supported.
+    """
+    def __init__(self, pdf_reader: PyPDF2.PdfReader) -> None:
+        """
+        Initialise class.
+
+        :param pdf_reader: the reader of the original pdf
+        :type pdf_reader: PyPDF2.PdfReader
+        """
+        if pdf_reader.is_encrypted:
+            raise NotImplementedError("incremental updates of encrypted pdfs are not supported")
+        self.pdf_reader: PyPDF2.PdfReader = pdf_reader
+        self.next_idnum: int = self.first_free_idnum()
+        self.objects: dict[int, tuple[int, PdfObject]] = {} # object number to generation and object
+        self.page_annotations: dict[int, list[IndirectObject]] = {}
+
+    def first_free_idnum(self) -> int:
+        """
+        Returns the first object number that is not used by the original file.
+
+        :return: the object number
+        :rtype: int
+        """
+        idnums = [idnum for section in self.pdf_reader.xref.values() for idnum in section]
+        idnums += list(self.pdf_reader.xref_objStm)
+        return max(max(idnums, default=0) + 1, self.pdf_reader.trailer.get("/Size", 0))
+
+    def add_object(self, obj: PdfObject) -> IndirectObject:
+        """
+        Adds a new object to the update.
+
+        :param obj: the object
+        :type obj: PdfObject
+        :return: the reference to the object
+        :rtype: IndirectObject
+        """
+        idnum = self.next_idnum
+        self.next_idnum += 1
+        self.objects[idnum] = (0, obj)
+        return IndirectObject(idnum, 0, self.pdf_reader)
+
+    def add_annotation(self, page_number: int, annotation: DictionaryObject) -> None:
+        """
+        Adds an annotation to a page, like PdfWriter.add_annotation.
+
+        :param page_number: the 0 based page number
+        :type page_number: int
+        :param annotation: the annotation
+        :type annotation: DictionaryObject
+        """
+        annotation[NameObject("/P")] = self.pdf_reader.pages[page_number].indirect_reference
+        self.page_annotations.setdefault(page_number, []).append(self.add_object(annotation))
+
+    def update_pages(self) -> None:
+        """
+        Adds the changed /Annots arrays of the pages with new annotations to the update.
+        If the array is an object of its own only the array is replaced, otherwise the page.
+        """
+        for page_number, annotation_refs in self.page_annotations.items():
+            page = self.pdf_reader.pages[page_number]
+            annots = page.raw_get("/Annots") if "/Annots" in page else None
+            if isinstance(annots, IndirectObject):
+                self.objects[annots.idnum] = (
+                    annots.generation, ArrayObject(list(annots.get_object()) + annotation_refs))
+                continue
+
+            page_ref = page.indirect_reference
+            new_page = DictionaryObject(page)
+            new_page[NameObject("/Annots")] = ArrayObject(list(annots or []) + annotation_refs)
+            self.objects[page_ref.idnum] = (page_ref.generation, new_page)
+
+    def write(self, output_path: str) -> None:
+        """
+        Writes a copy of the original file with the update appended.
+
+        :param output_path: path of the new pdf
+        :type output_path: str
+        """
+        self.update_pages()
+        source = self.pdf_reader.stream
+        previous_xref = find_startxref(source)
+        source.seek(previous_xref)
+        xref_table = source.read(len(XREF_TABLE)) == XREF_TABLE
+        source.seek(-1, io.SEEK_END)
+        ends_with_newline = source.read(1) in b"\r\n"
+
+        with open(output_path, "wb") as f:
+            source.seek(0)
+            shutil.copyfileobj(source, f)
+            if not ends_with_newline:
+                f.write(b"\n")
+
+            offsets: dict[int, tuple[int, int]] = {}
+            for idnum, (generation, obj) in sorted(self.objects.items()):
+                offsets[idnum] = (f.tell(), generation)
+                f.write(f"{idnum} {generation} obj\n".encode())
+                obj.write_to_stream(f, None)
+                f.write(b"\nendobj\n")
+
+            trailer = DictionaryObject()
+            for key in TRAILER_KEYS:
+                if key in self.pdf_reader.trailer:
+                    trailer[NameObject(key)] = self.pdf_reader.trailer.raw_get(key)
+            trailer[NameObject("/Prev")] = NumberObject(previous_xref)
+
+            if xref_table:
+                xref_offset = self.write_xref_table(f, offsets, trailer)
+            else:
+                xref_offset = self.write_xref_stream(f, offsets, trailer)
+            f.write(b"%s\n%d\n%%%%EOF\n" % (STARTXREF, xref_offset))
+
+    def write_xref_table(self, f: BinaryIO, offsets: dict[int, tuple[int, int]], trailer: DictionaryObject) -> int:
+        """
+        Writes a cross reference table and the trailer.
+
+        :param f: the output file
+        :type f: BinaryIO
+        :param offsets: object number to offset and generation
+        :type offsets: dict[int, tuple[int, int]]
+        :param trailer: the trailer without /Size
+        :type trailer: DictionaryObject
+        :return: the offset of the table
+        :rtype: int
+        """
+        xref_offset = f.tell()
+        f.write(XREF_TABLE + b"\n")
+        f.write(b"0 1\n0000000000 65535 f\r\n") # head of the free list, readers expect the table to start at 0
+        idnums = sorted(offsets)
+        for start, count in subsections(idnums):
+            f.write(f"{start} {count}\n".encode())
+            for idnum in range(start, start + count):
+                offset, generation = offsets[idnum]
+                f.write(f"{offset:010d} {generation:05d} n\r\n".encode())
+
+        trailer[NameObject("/Size")] = NumberObject(self.next_idnum)
+        f.write(b"trailer\n")
+        trailer.write_to_stream(f, None)
+        f.write(b"\n")
+        return xref_offset
+
+    def write_xref_stream(self, f: BinaryIO, offsets: dict[int, tuple[int, int]], trailer: DictionaryObject) -> int:
+        """
+        Writes a cross reference stream (PDF 1.7, 7.5.8), the stream is not compressed.
+
+        :param f: the output file
+        :type f: BinaryIO
+        :param offsets: object number to offset and generation
+        :type offsets: dict[int, tuple[int, int]]
+        :param trailer: the trailer without /Size
+        :type trailer: DictionaryObject
+        :return: the offset of the stream
+        :rtype: int
+        """
+        xref_idnum = self.next_idnum
+        xref_offset = f.tell()
+        offsets[xref_idnum] = (xref_offset, 0)
+        offset_width = max(1, (xref_offset.bit_length() + 7) // 8)
+        idnums = sorted(offsets)
+
+        data = b"".join(
+            b"\x01" + offsets[idnum][0].to_bytes(offset_width, "big") + offsets[idnum][1].to_bytes(2, "big")
+            for idnum in idnums)
+        trailer[NameObject("/Type")] = NameObject("/XRef")
+        trailer[NameObject("/Size")] = NumberObject(xref_idnum + 1)
+        trailer[NameObject("/W")] = ArrayObject([NumberObject(1), NumberObject(offset_width), NumberObject(2)])
+        trailer[NameObject("/Index")] = ArrayObject(
+            [NumberObject(number) for subsection in subsections(idnums) for number in subsection])
+        trailer[NameObject("/Length")] = NumberObject(len(data))
+
+        f.write(f"{xref_idnum} 0 obj\n".encode())
+        trailer.write_to_stream(f, None)
+        f.write(b"\nstream\n" + data + b"\nendstream\nendobj\n")
+        return xref_offset
@@ -0,0 +1,80 @@
+"""
+Logging setup for applications using the annotation exporter. The package itself
+never configures logging, the gui and the command line call configure_logging.
+Records are put on a queue and written by a background thread, so the export
+never waits for the disk.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import atexit
+import logging as lg
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+PACKAGE_LOGGER: str = "annotation_exporter"
+LOG_FORMAT: str = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: QueueListener | None = None
+
+
+def configure_logging(
+        level: int | str = lg.INFO,
+        filename: str | None = None,
+        filemode: str = "a",
+        background: bool = True) -> QueueListener | None:
+    """
+    Sends the log records of the package through a queue to a file (or stderr
+    if no file is given). Calling it again replaces the previous configuration.
+    Without background the records are written directly, this is meant for
+    worker processes, which exit without running the atexit handlers.
+
+    :param level: the log level
+    :type level: int | str
+    :param filename: path of the log file
+    :type filename: str | None
+    :param filemode: mode the log file is opened with
+    :type filemode: str
+    :param background: whether to write the records on a background thread
+    :type background: bool
+    :return: the listener writing the records, it is stopped at exit
+    :rtype: QueueListener | None
+    """
+    global _listener # pylint: disable=global-statement
+    stop_logging()
+
+    if filename is None:
+        handler: lg.Handler = lg.StreamHandler()
+    else:
+        handler = lg.FileHandler(filename, mode=filemode, encoding="utf-8")
+    handler.setFormatter(lg.Formatter(LOG_FORMAT))
+
+    logger = lg.getLogger(PACKAGE_LOGGER)
+    for old_handler in [h for h in logger.handlers if not isinstance(h, lg.NullHandler)]:
+        logger.removeHandler(old_handler)
+        old_handler.close()
+    logger.setLevel(level)
+    logger.propagate = False
+
+    if not background:
+        logger.addHandler(handler)
+        return None
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """
+    Writes the remaining records and stops the background thread.
+    """
+    global _listener # pylint: disable=global-statement
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -3,8 +3,18 @@ This is the main file for the annotation export project. It allows the user to e
 from a pdf to an excel file. For further information on how to use this please consult the 
 README.md
 """
+import os
+import logging as lg
+import threading
 import FreeSimpleGUI as sg
 from .annot_export import AnnotationExporter
+from .log_config import configure_logging
+from .options import ExportOptions, output_sinks
+from .progress import EXTRACT, ExportCancelled, ExportProgress
+
+PROGRESS_EVENT: str = "-PROGRESS-"
+DONE_EVENT: str = "-DONE-"
+CLOSE_TIMEOUT: float = 5.0 # seconds the export has to stop after the window was closed
 
 
 def ending_present(string: str, ending: str) -> bool:
@@ -21,10 +31,74 @@ def ending_present(string: str, ending: str) -> bool:
     split_str = string.split(".")
     return split_str[-1] == ending
 
+def export_worker(
+        window: sg.Window,
+        annotation_exporter: AnnotationExporter,
+        xlsx_path: str,
+        pdf_path: str,
+        output_folder: str,
+        options: ExportOptions,
+        cancel_event: threading.Event,
+        closed: threading.Event) -> None:
+    """
+    runs an export on a worker thread, the progress and the result are posted to the window as events
+    until the window is closed
+
+    :param window: the window of the gui
+    :type window: sg.Window
+    :param annotation_exporter: the exporter
+    :type annotation_exporter: AnnotationExporter
+    :param xlsx_path: path to the template
+    :type xlsx_path: str
+    :param pdf_path: path to the pdf
+    :type pdf_path: str
+    :param output_folder: path to the output folder
+    :type output_folder: str
+    :param options: the options of the export
+    :type options: ExportOptions
+    :param cancel_event: set by the cancel button
+    :type cancel_event: threading.Event
+    :param closed: set when the window is closed, its events are no longer read
+    :type closed: threading.Event
+    """
+    def post(event: str, value: object) -> None:
+        if not closed.is_set():
+            window.write_event_value(event, value)
+
+    try:
+        annotation_exporter.export_annotations(
+            xlsx_path,
+            pdf_path,
+            output_folder,
+            options,
+            progress=lambda progress: post(PROGRESS_EVENT, progress),
+            cancel_event=cancel_event)
+    except ExportCancelled:
+        post(DONE_EVENT, "Export cancelled")
+    except Exception as e: # pylint: disable=broad-except
+        lg.getLogger(__name__).exception("export failed")
+        post(DONE_EVENT, f"Export failed: {e}")
+    else:
+        post(DONE_EVENT, "Export complete")
+
+def progress_text(progress: ExportProgress) -> str:
+    """
+    formats the progress of an export for the status line
+
+    :param progress: the progress
+    :type progress: ExportProgress
+    :return: the status text
+    :rtype: str
+    """
+    if progress.stage != EXTRACT:
+        return progress.stage.replace("_", " ")
+    return f"page {progress.page} of {progress.pages} ({progress.pages_per_second:.1f} pages/s)"
+
 def run() -> None:
     """
     runs the gui from the presentation
     """
+    configure_logging(lg.DEBUG, f"{os.path.dirname(__file__)}/Annotation_Exporter.log", "w")
     annotation_exporter: AnnotationExporter = AnnotationExporter()
     sg.theme("DarkGrey5")
     layout: list[list[sg.Element]] = [
@@ -32,17 +106,45 @@ def run() -> None:
         [sg.Push(), sg.Text("PDF Path"), sg.InputText(key="pdf",default_text=r"PDF/example_compressed"), sg.FileBrowse(file_types=(("PDF", "*.pdf"),))],
         [sg.Push(), sg.Text("Spreadsheet Path"), sg.InputText(key="xlsx", default_text=r"Templates/temp"), sg.FileBrowse(file_types=(("Excel", "*.xlsx"),))],
         [sg.Push(), sg.Text("Output Folder"), sg.InputText(key="output", default_text=r"outputs"), sg.FolderBrowse()],
-        [sg.Checkbox("Convert Old Standard", key="conv_old"), sg.Checkbox("Create SQLite database", key="sqlite"), sg.Push(), sg.Button("Export Annotations", key="export")]
+        [sg.Checkbox("Convert Old Standard", key="conv_old"), sg.Checkbox("Create SQLite database", key="sqlite"), sg.Push(), sg.Button("Export Annotations", key="export"), sg.Button("Cancel", key="cancel", disabled=True)],
+        [sg.ProgressBar(1, orientation="h", size=(40, 15), key="progress"), sg.Text("", key="status", size=(40, 1))]
         ]
 
     window: sg.Window = sg.Window(title="Annotation Export", layout=layout, margins=(150, 125))
 
 
 
+    worker: threading.Thread | None = None
+    cancel_event: threading.Event = threading.Event()
+    closed: threading.Event = threading.Event()
+
     while True:
         event, values = window.read()
         if event == sg.WIN_CLOSED:
+            if worker is not None: # the worker stops posting events, so it does not wait for this thread
+                closed.set()
+                cancel_event.set()
+                worker.join(CLOSE_TIMEOUT)
             break
+
+        if event == PROGRESS_EVENT:
+            progress: ExportProgress = values[PROGRESS_EVENT]
+            window["progress"].update(progress.page, max(progress.pages, 1))
+            window["status"].update(progress_text(progress))
+            continue
+
+        if event == DONE_EVENT:
+            worker = None
+            window["status"].update(values[DONE_EVENT])
+            window["export"].update(disabled=False)
+            window["cancel"].update(disabled=True)
+            continue
+
+        if event == "cancel":
+            cancel_event.set()
+            window["status"].update("cancelling...")
+            continue
+
         try:
             pdf_p = values["pdf"]
             xlsx_p = values["xlsx"]
@@ -56,7 +158,7 @@ def run() -> None:
         conv_paths(xlsx_p)
         conv_paths(output_p)
 
-        if event == "export":
+        if event == "export" and worker is None:
             if ending_present(xlsx_p, "xlsx"):
                 xlsx_path = xlsx_p
             else:
@@ -70,16 +172,18 @@ def run() -> None:
         else:
             continue
 
-        annotation_exporter.export_annotations(
-            xlsx_path,
-            pdf_path,
-            output_folder)
-
-        if convert_old:
-            annotation_exporter.pdf.convert_old_standard(output_folder)
-
-        if sqlite:
-            annotation_exporter.generate_sqlite(output_folder)
+        options = ExportOptions(
+            lazy=True, # pages are extracted in the page loop, so progress and cancel work per page
+            sinks=output_sinks(convert_old, sqlite))
+
+        cancel_event = threading.Event()
+        window["export"].update(disabled=True)
+        window["cancel"].update(disabled=False)
+        worker = threading.Thread(
+            target=export_worker,
+            args=(window, annotation_exporter, xlsx_path, pdf_path, output_folder, options, cancel_event, closed),
+            daemon=True)
+        worker.start()
 
 
     window.close()
@@ -0,0 +1,172 @@
+"""
+Contains the ExportReport class which collects the wall time and memory usage
+of the export stages, counters and optionally a cProfile capture.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator
+
+try: # not available on windows
+    import resource
+except ImportError:
+    resource = None
+
+COUNTS: tuple[str, ...] = ( # reported even if they stay 0
+    "pages",
+    "annotations",
+    "invalid_annotations",
+    "unmatched_variables",
+    "cache_hits",
+    "cache_misses",
+    "memo_hits",
+    "memo_misses",
+)
+RSS_UNIT: int = 1 if sys.platform == "darwin" else 1024 # ru_maxrss is in bytes on macos, kilobytes elsewhere
+
+
+def max_rss() -> int | None:
+    """
+    Returns the peak resident memory of the process in bytes, None if unknown.
+
+    :return: the peak resident memory
+    :rtype: int | None
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+class ExportReport:
+    """
+    Metrics of an export. Stages are measured with the stage context manager,
+    counters are increased with count, the counters in COUNTS start at 0.
+    With trace_memory the peak python memory of every stage is measured with
+    tracemalloc, which slows the export down.
+    """
+    def __init__(self, trace_memory: bool = False, profile: bool = False) -> None:
+        """
+        Initialise class.
+
+        :param trace_memory: whether to measure the peak memory of every stage with tracemalloc
+        :type trace_memory: bool
+        :param profile: whether to capture a cProfile of the stages
+        :type profile: bool
+        """
+        self.trace_memory: bool = trace_memory
+        self.stages: dict[str, dict[str, float | int | None]] = {}
+        self.counts: dict[str, int] = dict.fromkeys(COUNTS, 0)
+        self.sinks: dict[str, float] = {} # seconds every output sink was busy, see pipeline
+        self.profiler: cProfile.Profile | None = cProfile.Profile() if profile else None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Measures the wall time and memory of the code in the with block.
+        Repeated stages are added up.
+
+        :param name: name of the stage
+        :type name: str
+        """
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+
+            peak = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+
+            metrics = self.stages.setdefault(name, {"seconds": 0.0, "peak_memory": None, "max_rss": None})
+            metrics["seconds"] += seconds
+            if peak is not None:
+                metrics["peak_memory"] = max(peak, metrics["peak_memory"] or 0)
+            metrics["max_rss"] = max_rss()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """
+        Increases a counter.
+
+        :param name: name of the counter
+        :type name: str
+        :param amount: amount to add
+        :type amount: int
+        """
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def sink_time(self, name: str, seconds: float) -> None:
+        """
+        Records the time an output sink was busy. Sinks run concurrently,
+        so these times overlap with the stages and each other.
+
+        :param name: name of the sink
+        :type name: str
+        :param seconds: the busy time
+        :type seconds: float
+        """
+        self.sinks[name] = self.sinks.get(name, 0.0) + seconds
+
+    def profile_stats(self, limit: int = 30) -> str | None:
+        """
+        Returns the functions with the highest cumulative time as text.
+
+        :param limit: number of functions
+        :type limit: int
+        :return: the stats or None if profiling is disabled
+        :rtype: str | None
+        """
+        if self.profiler is None:
+            return None
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def to_dict(self) -> dict:
+        """
+        Returns the report as a json serialisable dictionary.
+
+        :return: the report
+        :rtype: dict
+        """
+        return {
+            "stages": self.stages,
+            "total_seconds": sum(metrics["seconds"] for metrics in self.stages.values()),
+            "counts": self.counts,
+            "sinks": self.sinks,
+            "profile": self.profile_stats(),
+        }
+
+    def write_json(self, path: str) -> None:
+        """
+        Saves the report as json.
+
+        :param path: path of the json file
+        :type path: str
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __str__(self) -> str:
+        lines = [f"{name}: {metrics['seconds']:.3f}s" for name, metrics in self.stages.items()]
+        lines += [f"sink {name}: {seconds:.3f}s" for name, seconds in self.sinks.items()]
+        lines += [f"{name}: {amount}" for name, amount in self.counts.items()]
+        return "\n".join(lines)
@@ -0,0 +1,53 @@
+"""
+Contains the ExportOptions dataclass with the options of an export. The same
+options are passed from the command line, the manifest, the watch mode and the
+service through ExportJob to AnnotationExporter.export_annotations, so a new
+option is only added here.
+"""
+from __future__ import annotations # Nessecary for typehinting
+from dataclasses import dataclass
+from .backends import DEFAULT_BACKEND
+from .pipeline import CONVERTED_PDF, DEFAULT_SINKS, SQLITE
+from .store import DEFAULT_COLOR_PRECISION
+
+
+@dataclass
+class ExportOptions:
+    """
+    The options of an export, every option is described next to its default.
+    """
+    lazy: bool = False # stream the pages and only keep summaries, keeps memory usage low on large pdfs
+    workers: int = 1 # worker processes for the annotation extraction
+    cache_path: str | None = None # annotation cache file for the records of unchanged pages, only used with one worker
+    streaming: bool = False # read the template read only and write the output with the write only workbook, drops the formatting
+    template_index: bool = True # use and update the template index next to the template
+    report_path: str | None = None # json file the report with the time and memory of every stage is written to
+    trace_memory: bool = False # measure the peak memory of every stage with tracemalloc
+    profile: bool = False # include a cProfile capture in the report
+    color_precision: int | None = DEFAULT_COLOR_PRECISION # decimals colors of variables and datasets are matched by, None for exact matches
+    page_ranges: bool = False # combine consecutive pages into ranges ("3-7 12")
+    sinks: tuple[str, ...] = DEFAULT_SINKS # outputs to write, see pipeline.SINKS
+    document: str | None = None # key of the document in the sqlite database
+    incremental: bool = False # write the converted pdf as an incremental update
+    threaded_sinks: bool = True # run every sink on its own thread
+    backend: str = DEFAULT_BACKEND # reader backend, see backends.BACKENDS
+    memory_map: bool = False # memory map the pdf instead of reading it into memory, closed when the export finishes
+
+
+def output_sinks(convert_old: bool = False, sqlite: bool = False) -> tuple[str, ...]:
+    """
+    Returns the default sinks and the optional outputs.
+
+    :param convert_old: whether the converted pdf is written
+    :type convert_old: bool
+    :param sqlite: whether the sqlite database is written
+    :type sqlite: bool
+    :return: the names of the sinks
+    :rtype: tuple[str, ...]
+    """
+    sinks = DEFAULT_SINKS
+    if convert_old:
+        sinks += (CONVERTED_PDF,)
+    if sqlite:
+        sinks += (SQLITE,)
+    return sinks
@@ -0,0 +1,108 @@
+"""
+Parallel annotation extraction. The pages of a pdf are split into page ranges,
+every worker process opens the pdf with its own PdfReader (memory mapped, so the
+workers share the os page cache, if the pdf was opened with memory_map) and returns the
+annotation records of its pages. The records are plain (picklable) tuples
+as returned by Annotation.get_multiple_variables.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+from .backends import DEFAULT_BACKEND, close_reader, open_backend, open_reader
+
+
+def extract_page_range(
+        pdf_path: str,
+        start: int,
+        stop: int,
+        backend: str = DEFAULT_BACKEND,
+        memory_map: bool = False) -> list[list[tuple] | None]:
+    """
+    Extracts the annotation records of the pages start to stop (exclusive).
+    Runs in a worker process.
+
+    :param pdf_path: path to the pdf file
+    :type pdf_path: str
+    :param start: first page number
+    :type start: int
+    :param stop: page number after the last page
+    :type stop: int
+    :param backend: name of the reader backend
+    :type backend: str
+    :param memory_map: memory map the pdf, see backends.open_reader
+    :type memory_map: bool
+    :return: the records of each page, None for pages without annotations
+    :rtype: list[list[tuple] | None]
+    """
+    pdf_reader = open_reader(pdf_path, memory_map)
+    try:
+        pdf_backend = open_backend(pdf_reader, backend)
+        return [pdf_backend.page_records(page_nr) for page_nr in range(start, stop)]
+    finally:
+        close_reader(pdf_reader)
+
+
+def page_ranges(page_count: int, workers: int, chunk_size: int | None = None) -> list[tuple[int, int]]:
+    """
+    Splits the pages into ranges. By default every worker gets about four ranges
+    so uneven pages are balanced out.
+
+    :param page_count: number of pages in the pdf
+    :type page_count: int
+    :param workers: number of worker processes
+    :type workers: int
+    :param chunk_size: number of pages per range
+    :type chunk_size: int | None
+    :return: list of (start, stop) tuples
+    :rtype: list[tuple[int, int]]
+    """
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(page_count / (workers * 4)))
+
+    return [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+
+def iter_page_records(
+        pdf_path: str,
+        page_count: int,
+        workers: int,
+        chunk_size: int | None = None,
+        backend: str = DEFAULT_BACKEND,
+        memory_map: bool = False) -> Iterator[tuple[int, list[tuple] | None]]:
+    """
+    Extracts the annotation records in a process pool and yields them in page order.
+
+    :param pdf_path: path to the pdf file
+    :type pdf_path: str
+    :param page_count: number of pages in the pdf
+    :type page_count: int
+    :param workers: number of worker processes
+    :type workers: int
+    :param chunk_size: number of pages per range
+    :type chunk_size: int | None
+    :param backend: name of the reader backend
+    :type backend: str
+    :param memory_map: memory map the pdf in the workers
+    :type memory_map: bool
+    :return: iterator over (page number, records) tuples
+    :rtype: Iterator[tuple[int, list[tuple] | None]]
+    """
+    ranges = page_ranges(page_count, workers, chunk_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = executor.map(
+            extract_page_range,
+            [pdf_path] * len(ranges),
+            [start for start, _ in ranges],
+            [stop for _, stop in ranges],
+            [backend] * len(ranges),
+            [memory_map] * len(ranges))
+
+        try:
+            for (start, _), chunk in zip(ranges, chunks):
+                for offset, records in enumerate(chunk):
+                    yield start + offset, records
+        except GeneratorExit: # the export was stopped, skip the ranges that have not started
+            executor.shutdown(cancel_futures=True)
+            raise
@@ -0,0 +1,148 @@
+"""
+Parser for the text (/Contents) of annotations. tokenize splits the text into the
+variables it contains and classify determines whether a variable is a dataset,
+a SUPP dataset or a variable. Both work in a single pass over the text.
+The same texts appear on many pages of an aCRF, so the results are cached.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+SEPARATORS: tuple[str] = (",", ";", "|") # expand as needed
+
+CACHE_SIZE: int = 65536
+
+SEPARATOR_PATTERN: re.Pattern = re.compile("|".join(re.escape(separator) for separator in SEPARATORS))
+
+
+class ParsedContent(NamedTuple):
+    """
+    The classification of a single variable of an annotation.
+    """
+    content: str
+    content_without_spaces: str
+    dataset: bool
+    new_dataset: bool
+    supp: bool
+    dataset_name: str | None
+    variable_name: str | None
+
+
+_new_parsed_content = tuple.__new__ # skips the keyword handling of ParsedContent.__new__
+
+
+def strip_brackets(token: str) -> str:
+    """
+    Brackets are special cases: everything from the first opening bracket is
+    removed, if there is none everything up to the first closing bracket.
+
+    :param token: the token
+    :type token: str
+    :return: the token without the bracket part
+    :rtype: str
+    """
+    bracket = token.find("(")
+    if bracket >= 0:
+        return token[:bracket]
+
+    bracket = token.find(")")
+    if bracket >= 0:
+        return token[bracket + 1:]
+    return token
+
+
+def tokenize(content: str) -> list[str]:
+    """
+    Splits the text of an annotation into the variables it contains.
+    The text is split at the separators. A part is only kept if it is
+    enclosed by the same separator on both sides (or the start/end of the text),
+    so "A, B; C" results in "A" and "C" but not "B". The parts are ordered by
+    separator and then by position and duplicates are removed.
+
+    :param content: the text of the annotation
+    :type content: str
+    :return: list of variables
+    :rtype: list[str]
+    """
+    if SEPARATOR_PATTERN.search(content) is None: # most annotations contain a single variable
+        if "(" in content or ")" in content:
+            content = strip_brackets(content)
+        return [content] if content else []
+
+    parts: dict[str, list[str]] = {separator: [] for separator in SEPARATORS}
+    left: str | None = None
+    start = 0
+    for match in SEPARATOR_PATTERN.finditer(content):
+        right = match.group()
+        if left is None or left == right:
+            parts[right].append(content[start:match.start()])
+        left = right
+        start = match.end()
+    parts[left].append(content[start:])
+
+    tokens: dict[str, None] = {} # dict instead of set to keep the order deterministic
+    for separator_parts in parts.values():
+        for part in separator_parts:
+            token = strip_brackets(part)
+            if token:
+                tokens[token] = None
+
+    return list(tokens)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def classify(content: str) -> ParsedContent:
+    """
+    Classifies a single variable. New standard datasets have a two letter name
+    before the bracket ("DM (Demographics)"), old standard datasets before the
+    equal sign ("DM = Demographics"). SUPP datasets start with SUPP. Variables
+    are cut off at the first separator.
+
+    :param content: the text of the variable
+    :type content: str
+    :return: the classification
+    :rtype: ParsedContent
+    """
+    content_without_spaces = "".join(content.split())
+
+    bracket = content_without_spaces.find("(")
+    name = content_without_spaces[:bracket] if bracket >= 0 else content_without_spaces
+    equal_sign = content_without_spaces.find("=")
+    equal_name = content_without_spaces[:equal_sign] if equal_sign >= 0 else content_without_spaces
+
+    dataset = new_dataset = supp = False
+    dataset_name = variable_name = None
+    if len(name) == 2: # new standard
+        dataset = new_dataset = True
+        dataset_name = name
+    elif len(equal_name) == 2: # old standard
+        dataset = True
+        dataset_name = equal_name
+    else:
+        variable_name = equal_name
+
+    if equal_name[:4] == "SUPP":
+        supp = True
+        dataset_name = equal_name[:6]
+
+    if not dataset and not supp:
+        separator = SEPARATOR_PATTERN.search(content)
+        if separator is not None:
+            content = content[:separator.start()]
+
+    return _new_parsed_content(ParsedContent, (
+        content, content_without_spaces, dataset, new_dataset, supp, dataset_name, variable_name))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(content: str) -> tuple[ParsedContent, ...]:
+    """
+    Splits and classifies the text of an annotation.
+
+    :param content: the text of the annotation
+    :type content: str
+    :return: the classification of every variable
+    :rtype: tuple[ParsedContent, ...]
+    """
+    return tuple(classify(token) for token in tokenize(content))
@@ -0,0 +1,384 @@
+"""
+Export pipeline. The pages are extracted and added to the workbook once,
+every processed page is then passed to the sinks which write the outputs
+(workbook, csv files, sqlite database, converted pdf). With threads every
+sink runs on its own thread fed by a queue, so writing the outputs overlaps
+with the extraction and the sinks finish concurrently.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import logging as lg
+import os
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Iterable, TextIO
+
+if TYPE_CHECKING:
+    from PyPDF2.generic import DictionaryObject
+    from .annot_export import AnnotationExporter
+    from .generic import Page, PageSummary
+
+logger = lg.getLogger(__name__)
+
+XLSX: str = "xlsx"
+VARIABLES_CSV: str = "variables_csv"
+DATASETS_CSV: str = "datasets_csv"
+SQLITE: str = "sqlite"
+CONVERTED_PDF: str = "converted_pdf"
+DEFAULT_SINKS: tuple[str] = (XLSX, VARIABLES_CSV, DATASETS_CSV)
+
+QUEUE_SIZE: int = 64 # pages, the extraction waits if a sink falls this far behind
+_FINISH = object()
+_ABORT = object()
+
+
+class Sink:
+    """
+    Writes one output of an export. start is called before the first page,
+    write_page for every page after it was added to the workbook and finish
+    after the last page. abort is called instead of finish if the export failed,
+    also if start failed part way.
+    All methods of a sink are called from the same thread.
+    """
+    name: str = ""
+
+    def __init__(self, exporter: AnnotationExporter, document: str | None = None, incremental: bool = False) -> None:
+        """
+        Initialise class.
+
+        :param exporter: the exporter, the sinks read the output folder and the processed data from it
+        :type exporter: AnnotationExporter
+        :param document: key of the document in the sqlite database
+        :type document: str | None
+        :param incremental: whether the converted pdf is written as an incremental update
+        :type incremental: bool
+        """
+        self.exporter: AnnotationExporter = exporter
+        self.document: str | None = document
+        self.incremental: bool = incremental
+
+    def start(self) -> None:
+        """
+        called before the first page
+        """
+
+    def write_page(self, page: Page | PageSummary) -> None:
+        """
+        called for every processed page
+
+        :param page: the processed page
+        :type page: Page | PageSummary
+        """
+
+    def finish(self) -> None:
+        """
+        called after the last page
+        """
+
+    def abort(self) -> None:
+        """
+        called instead of finish if the export failed
+        """
+
+
+class XlsxSink(Sink):
+    """
+    Writes output.xlsx, the workbook needs all pages so it is written in finish.
+    """
+    name = XLSX
+
+    def finish(self) -> None:
+        self.exporter.save_workbook()
+
+
+class VariableCsvSink(Sink):
+    """
+    Writes Variables.csv, the pages of a variable are only known after the last page.
+    """
+    name = VARIABLES_CSV
+
+    def finish(self) -> None:
+        self.exporter.generate_variable_csv()
+
+
+class DatasetCsvSink(Sink):
+    """
+    Writes Datasets.csv while the pages are processed.
+    """
+    name = DATASETS_CSV
+    file: TextIO | None = None # set by start
+
+    def start(self) -> None:
+        from .annot_export import DATASET_CSV_HEADER, csv_writer # circular import
+
+        self.file: TextIO = open(f"{self.exporter.output_folder}/Datasets.csv", "w", encoding="utf-8", newline="")
+        self.writer: Any = csv_writer(self.file)
+        self.writer.writerow(DATASET_CSV_HEADER)
+        self.seen: set[tuple[str, str]] = set()
+
+    def write_page(self, page: Page | PageSummary) -> None:
+        self.writer.writerows(self.exporter.dataset_csv_rows([page], self.seen))
+
+    def finish(self) -> None:
+        self.file.close()
+
+    def abort(self) -> None:
+        if self.file is None: # the file could not be opened
+            return
+        self.file.close()
+        os.remove(self.file.name) # no partial output
+
+
+class SqliteSink(Sink):
+    """
+    Collects the rows of the annotations table while the pages are processed
+    and inserts them in finish, so the database is only locked briefly.
+    """
+    name = SQLITE
+
+    def start(self) -> None:
+        self.rows: list[tuple] = []
+
+    def write_page(self, page: Page | PageSummary) -> None:
+        self.rows.extend(self.exporter.page_sqlite_rows(page, self.document))
+
+    def finish(self) -> None:
+        self.exporter.write_sqlite(self.exporter.output_folder, self.document, self.rows)
+
+
+class ConvertedPdfSink(Sink):
+    """
+    Converts the old standard dataset annotations while the pages are processed
+    and writes output.pdf in finish, when the pdf is no longer read by the extraction.
+    """
+    name = CONVERTED_PDF
+
+    def start(self) -> None:
+        self.annotations: list[tuple[int, DictionaryObject]] = []
+
+    def write_page(self, page: Page | PageSummary) -> None:
+        self.annotations.extend(self.exporter.pdf.converted_annotations([page]))
+
+    def finish(self) -> None:
+        self.exporter.pdf.write_converted_pdf(self.exporter.output_folder, self.incremental, self.annotations)
+
+
+SINKS: dict[str, type[Sink]] = {
+    sink.name: sink for sink in (XlsxSink, VariableCsvSink, DatasetCsvSink, SqliteSink, ConvertedPdfSink)}
+
+
+class SinkRunner:
+    """
+    Runs a sink on the calling thread and measures the time it is busy.
+    """
+    def __init__(self, sink: Sink) -> None:
+        """
+        Initialise class.
+
+        :param sink: the sink
+        :type sink: Sink
+        """
+        self.sink: Sink = sink
+        self.seconds: float = 0.0
+        self.started: bool = False # only started sinks are aborted
+        self.done: bool = False
+
+    def timed(self, method: Callable, *args: Any) -> None:
+        """
+        Calls a method of the sink and adds the time it took.
+
+        :param method: the method
+        :type method: Callable
+        """
+        start = time.perf_counter()
+        try:
+            method(*args)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def start(self) -> None:
+        """
+        starts the sink
+        """
+        self.started = True
+        self.timed(self.sink.start)
+
+    def put(self, page: Page | PageSummary) -> None:
+        """
+        passes a page to the sink
+
+        :param page: the processed page
+        :type page: Page | PageSummary
+        """
+        self.timed(self.sink.write_page, page)
+
+    def finish(self) -> None:
+        """
+        finishes the sink
+        """
+        self.done = True
+        self.timed(self.sink.finish)
+
+    def join(self) -> None:
+        """
+        waits until the sink is finished
+        """
+
+    def abort(self) -> None:
+        """
+        aborts the sink if it is not finished yet
+        """
+        if not self.done:
+            self.done = True
+            if self.started:
+                self.sink.abort()
+
+
+class ThreadedSinkRunner(SinkRunner):
+    """
+    Runs a sink on its own thread. The pages are passed through a bounded queue,
+    errors of the sink are raised again by join.
+    """
+    def __init__(self, sink: Sink) -> None:
+        super().__init__(sink)
+        self.queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        self.error: BaseException | None = None
+        self.thread: threading.Thread = threading.Thread(target=self.run, name=f"sink-{sink.name}", daemon=True)
+
+    def run(self) -> None:
+        """
+        the thread, calls the sink for every item of the queue
+        """
+        while True:
+            item = self.queue.get()
+            if self.error is None:
+                try:
+                    if item is _ABORT:
+                        if self.started:
+                            self.sink.abort()
+                        return
+                    if not self.started:
+                        self.started = True
+                        self.timed(self.sink.start)
+                    if item is _FINISH:
+                        self.timed(self.sink.finish)
+                    else:
+                        self.timed(self.sink.write_page, item)
+                except BaseException as e: # raised in the exporting thread by join
+                    logger.exception("output %s failed", self.sink.name)
+                    self.error = e
+                    self.abort_after_error()
+            if item is _FINISH or item is _ABORT:
+                return
+
+    def abort_after_error(self) -> None:
+        """
+        lets the sink clean up after one of its methods failed
+        """
+        try:
+            self.sink.abort()
+        except Exception: # pylint: disable=broad-except
+            logger.exception("output %s could not be aborted", self.sink.name)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def put(self, page: Page | PageSummary) -> None:
+        self.queue.put(page)
+
+    def finish(self) -> None:
+        self.done = True
+        self.queue.put(_FINISH)
+
+    def join(self) -> None:
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self) -> None:
+        if self.done:
+            return
+        self.done = True
+        if self.thread.ident is None: # the thread was never started
+            return
+        self.queue.put(_ABORT)
+        self.thread.join()
+
+
+class ExportPipeline:
+    """
+    Passes the processed pages of an export to the sinks.
+    """
+    def __init__(
+            self,
+            exporter: AnnotationExporter,
+            sinks: Iterable[str] = DEFAULT_SINKS,
+            threaded: bool = True,
+            document: str | None = None,
+            incremental: bool = False) -> None:
+        """
+        Initialise class.
+
+        :param exporter: the exporter
+        :type exporter: AnnotationExporter
+        :param sinks: names of the sinks, see SINKS
+        :type sinks: Iterable[str]
+        :param threaded: whether every sink runs on its own thread
+        :type threaded: bool
+        :param document: key of the document in the sqlite database
+        :type document: str | None
+        :param incremental: whether the converted pdf is written as an incremental update
+        :type incremental: bool
+        """
+        unknown = [name for name in sinks if name not in SINKS]
+        if unknown:
+            raise ValueError(f"unknown outputs {unknown}, choose from {list(SINKS)}")
+
+        self.exporter: AnnotationExporter = exporter
+        runner = ThreadedSinkRunner if threaded else SinkRunner
+        self.runners: list[SinkRunner] = [
+            runner(SINKS[name](exporter, document, incremental)) for name in dict.fromkeys(sinks)]
+
+    def start(self) -> None:
+        """
+        starts all sinks
+        """
+        for runner in self.runners:
+            runner.start()
+
+    def write_page(self, page: Page | PageSummary) -> None:
+        """
+        passes a processed page to all sinks
+
+        :param page: the processed page
+        :type page: Page | PageSummary
+        """
+        for runner in self.runners:
+            runner.put(page)
+
+    def finish(self) -> None:
+        """
+        Finishes all sinks and waits for them. The busy time of every sink is
+        added to the report of the exporter. The first error of a sink is raised
+        after all sinks are done.
+        """
+        for runner in self.runners:
+            runner.finish()
+
+        error: BaseException | None = None
+        for runner in self.runners:
+            try:
+                runner.join()
+            except BaseException as e: # pylint: disable=broad-except
+                error = error or e
+            self.exporter.report.sink_time(runner.sink.name, runner.seconds)
+
+        if error is not None:
+            raise error
+
+    def abort(self) -> None:
+        """
+        aborts all sinks that are not finished yet
+        """
+        for runner in self.runners:
+            runner.abort()
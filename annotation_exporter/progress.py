@@ -0,0 +1,98 @@
+"""
+Progress reporting and cancellation of an export. The exporter reports the
+current stage and every processed page to a ProgressTracker, which passes an
+ExportProgress to the progress callback and stops the export between pages
+once the cancel event is set.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import threading
+import time
+from typing import Callable, NamedTuple
+
+LOAD_TEMPLATE: str = "load_template"
+EXTRACT: str = "extract"
+WRITE_OUTPUTS: str = "write_outputs"
+COMPLETE: str = "complete"
+
+
+class ExportCancelled(Exception):
+    """
+    Raised by the exporter when the export was cancelled.
+    """
+
+
+class ExportProgress(NamedTuple):
+    """
+    The state of an export, passed to the progress callback.
+    """
+    stage: str
+    page: int # processed pages
+    pages: int # pages of the pdf, 0 if not known yet
+    pages_per_second: float # throughput of the current stage
+
+
+class ProgressTracker:
+    """
+    Passes the progress of an export to a callback and checks for cancellation.
+    The callback is called on the exporting thread, so a gui has to hand the
+    progress over to its own thread (FreeSimpleGUI: window.write_event_value).
+    """
+    def __init__(
+            self,
+            callback: Callable[[ExportProgress], None] | None = None,
+            cancel_event: threading.Event | None = None) -> None:
+        """
+        Initialise class.
+
+        :param callback: called with the progress at the start of every stage and after every page
+        :type callback: Callable[[ExportProgress], None] | None
+        :param cancel_event: the export is cancelled once the event is set
+        :type cancel_event: threading.Event | None
+        """
+        self.callback: Callable[[ExportProgress], None] | None = callback
+        self.cancel_event: threading.Event | None = cancel_event
+        self.current_stage: str = ""
+        self.page: int = 0
+        self.pages: int = 0
+        self.start: float = time.perf_counter()
+
+    def stage(self, name: str, pages: int | None = None) -> None:
+        """
+        Starts a stage and reports it. Raises ExportCancelled if the export was cancelled.
+
+        :param name: name of the stage
+        :type name: str
+        :param pages: number of pages of the pdf, if known
+        :type pages: int | None
+        """
+        self.check_cancelled()
+        self.current_stage = name
+        if pages is not None:
+            self.pages = pages
+        self.start = time.perf_counter()
+        self.report()
+
+    def page_done(self) -> None:
+        """
+        Reports a processed page. Raises ExportCancelled if the export was cancelled.
+        """
+        self.page += 1
+        self.report()
+        self.check_cancelled()
+
+    def check_cancelled(self) -> None:
+        """
+        Raises ExportCancelled if the cancel event is set.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ExportCancelled(f"export cancelled during {self.current_stage or 'start'}")
+
+    def report(self) -> None:
+        """
+        Passes the current progress to the callback.
+        """
+        if self.callback is None:
+            return
+        seconds = time.perf_counter() - self.start
+        pages_per_second = self.page / seconds if self.current_stage == EXTRACT and seconds > 0 else 0.0
+        self.callback(ExportProgress(self.current_stage, self.page, self.pages, pages_per_second))
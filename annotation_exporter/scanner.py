@@ -0,0 +1,517 @@
+"""
+Fast annotation scanner, see ScannerBackend. Instead of building the PyPDF2
+page objects the page tree is walked once and only the page tree nodes and
+the annotation objects are parsed, with a regex based lexer. Strings are only
+decoded for the fields used by the exporter (/Contents, /C, /Subtype, /Rect),
+which are converted to the same PyPDF2 objects PdfReader returns, so the
+records are the same as the ones of the PyPDF2 backend. The cross reference
+tables are taken from the PdfReader and object streams are decoded once.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import logging as lg
+import mmap
+import re
+from functools import lru_cache
+from typing import Any, NamedTuple
+import PyPDF2
+from PyPDF2.generic import ArrayObject, FloatObject, NameObject, NumberObject, create_string_object
+from .backends import SCANNER, PdfBackend, RecordMemo
+
+logger = lg.getLogger(__name__)
+
+ANNOTATION_FIELDS: tuple[str] = ("/Contents", "/C", "/Subtype", "/Rect")
+MAX_REFERENCE_DEPTH: int = 32 # references to references, guards against cycles
+
+SKIP: re.Pattern = re.compile(rb"(?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*") # whitespace and comments
+NUMBER: re.Pattern = re.compile( # a reference or a number
+    rb"(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])"
+    rb"|[+-]?(?:\d+\.?\d*|\.\d+)")
+NAME: re.Pattern = re.compile(rb"/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)")
+KEYWORD: re.Pattern = re.compile(rb"true|false|null")
+OBJECT_HEADER: re.Pattern = re.compile(rb"[\x00\t\n\x0c\r ]*(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj")
+STRING_BODY: re.Pattern = re.compile(rb"(?:[^()\\]+|\\.)*", re.DOTALL) # up to the next unescaped bracket
+ESCAPE: re.Pattern = re.compile(rb"\\([0-7]{1,3}|[\r\n][\r\n]?|.)", re.DOTALL)
+HEX_WHITESPACE: re.Pattern = re.compile(rb"[\x00\t\n\x0c\r ]+")
+
+ESCAPES: dict[int, bytes] = { # same as PyPDF2
+    ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f", ord("c"): rb"\c",
+    **{ord(char): char.encode() for char in "()/\\ %<>[]#_&$"}}
+KEYWORDS: dict[bytes, Any] = {b"true": True, b"false": False, b"null": None}
+NUMBER_START: bytes = b"0123456789+-."
+
+
+class ScanError(Exception):
+    """
+    Raised by the scanner if an object can not be read the same way PyPDF2 reads it.
+    """
+
+
+class Reference(NamedTuple):
+    """
+    An indirect reference.
+    """
+    idnum: int
+    generation: int
+
+
+class Real(NamedTuple):
+    """
+    A real number, kept as written so it is converted exactly like PyPDF2 does.
+    """
+    token: bytes
+
+
+class PdfString(NamedTuple):
+    """
+    A string as written in the file, decoded only when it is used.
+    """
+    raw: bytes
+    hex: bool
+
+    def decode(self) -> bytes:
+        """
+        Returns the bytes of the string like PyPDF2 reads them.
+
+        :return: the bytes
+        :rtype: bytes
+        """
+        if self.hex:
+            digits = HEX_WHITESPACE.sub(b"", self.raw)
+            if len(digits) % 2:
+                digits += b"0"
+            try:
+                return bytes.fromhex(digits.decode("ascii"))
+            except ValueError as e:
+                raise ScanError("invalid hex string") from e
+
+        if b"\\" not in self.raw:
+            return self.raw
+        return ESCAPE.sub(unescape, self.raw)
+
+
+def unescape(match: re.Match) -> bytes:
+    """
+    Replaces an escape sequence of a literal string, like PyPDF2.
+
+    :param match: the match of ESCAPE
+    :type match: re.Match
+    :return: the unescaped bytes
+    :rtype: bytes
+    """
+    sequence = match.group(1)
+    first = sequence[0]
+    if 0x30 <= first <= 0x37: # octal
+        value = int(sequence, 8)
+        if value > 255:
+            raise ScanError(f"octal escape {sequence!r} out of range")
+        return bytes((value,))
+    if first in b"\r\n": # line continuation
+        return b""
+    escaped = ESCAPES.get(first)
+    if escaped is None:
+        raise ScanError(f"unsupported escape {sequence!r}")
+    return escaped
+
+
+@lru_cache(maxsize=4096)
+def decode_name(raw: bytes) -> str:
+    """
+    Decodes a name like PyPDF2.generic.NameObject, with the leading slash.
+
+    :param raw: the name without the slash
+    :type raw: bytes
+    :return: the name
+    :rtype: str
+    """
+    if b"#" in raw:
+        raw = NameObject.unnumber(raw)
+    try:
+        return "/" + raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise ScanError(f"name {raw!r} is not utf-8") from e
+
+
+def parse_value(data: bytes, pos: int) -> tuple[Any, int]:
+    """
+    Parses a pdf object. Dictionaries are dicts with the names as keys, arrays
+    are lists, names are str, integers are int, reals are Real, strings are
+    PdfString and references are Reference. The data of streams is not read.
+
+    :param data: the buffer
+    :type data: bytes
+    :param pos: the position of the object, whitespace is skipped
+    :type pos: int
+    :return: the object and the position after it
+    :rtype: tuple[Any, int]
+    """
+    pos = SKIP.match(data, pos).end()
+    if pos >= len(data):
+        raise ScanError("unexpected end of data")
+    char = data[pos]
+
+    if char == 0x2F: # /
+        match = NAME.match(data, pos)
+        return decode_name(match.group(1)), match.end()
+
+    if char in NUMBER_START:
+        match = NUMBER.match(data, pos)
+        if match is None:
+            raise ScanError(f"invalid number at {pos}")
+        if match.group(1) is not None:
+            return Reference(int(match.group(1)), int(match.group(2))), match.end()
+        token = match.group()
+        return (Real(token) if b"." in token else int(token)), match.end()
+
+    if char == 0x3C: # <
+        if data[pos:pos + 2] == b"<<":
+            return parse_dictionary(data, pos + 2)
+        end = data.find(b">", pos)
+        if end < 0:
+            raise ScanError("unterminated hex string")
+        return PdfString(data[pos + 1:end], True), end + 1
+
+    if char == 0x5B: # [
+        array: list[Any] = []
+        pos += 1
+        while True:
+            pos = SKIP.match(data, pos).end()
+            if data[pos:pos + 1] == b"]":
+                return array, pos + 1
+            value, pos = parse_value(data, pos)
+            array.append(value)
+
+    if char == 0x28: # (
+        return parse_literal_string(data, pos + 1)
+
+    match = KEYWORD.match(data, pos)
+    if match is None:
+        raise ScanError(f"unexpected {data[pos:pos + 10]!r} at {pos}")
+    return KEYWORDS[match.group()], match.end()
+
+
+def parse_dictionary(data: bytes, pos: int) -> tuple[dict[str, Any], int]:
+    """
+    Parses a dictionary, pos is after the opening angle brackets.
+
+    :param data: the buffer
+    :type data: bytes
+    :param pos: the position after the opening angle brackets
+    :type pos: int
+    :return: the dictionary and the position after it
+    :rtype: tuple[dict[str, Any], int]
+    """
+    dictionary: dict[str, Any] = {}
+    while True:
+        pos = SKIP.match(data, pos).end()
+        if data[pos:pos + 2] == b">>":
+            return dictionary, pos + 2
+        key = NAME.match(data, pos)
+        if key is None:
+            raise ScanError(f"dictionary key at {pos} is not a name")
+        dictionary[decode_name(key.group(1))], pos = parse_value(data, key.end())
+
+
+def parse_literal_string(data: bytes, pos: int) -> tuple[PdfString, int]:
+    """
+    Finds the end of a literal string, pos is after the opening bracket.
+    Balanced brackets are part of the string.
+
+    :param data: the buffer
+    :type data: bytes
+    :param pos: the position after the opening bracket
+    :type pos: int
+    :return: the string and the position after the closing bracket
+    :rtype: tuple[PdfString, int]
+    """
+    start = pos
+    depth = 1
+    while True:
+        pos = STRING_BODY.match(data, pos).end()
+        if pos >= len(data):
+            raise ScanError("unterminated string")
+        if data[pos] == 0x28: # (
+            depth += 1
+        elif data[pos] == 0x29: # )
+            depth -= 1
+            if depth == 0:
+                return PdfString(data[start:pos], False), pos + 1
+        else: # backslash at the end of the data
+            raise ScanError("unterminated string")
+        pos += 1
+
+
+class ScannerBackend(PdfBackend):
+    """
+    Reads the annotations without building the PyPDF2 page objects, see the module docstring.
+    Pages the scanner can not read are read with PyPDF2.
+    """
+    name = SCANNER
+
+    def __init__(self, pdf_reader: PyPDF2.PdfReader, memo: RecordMemo | None = None) -> None:
+        """
+        Initialise class and walk the page tree. Raises ScanError if the page tree
+        can not be read and NotImplementedError for encrypted pdfs. Annotations
+        found in the memo are not parsed again.
+
+        :param pdf_reader: the reader of the pdf
+        :type pdf_reader: PyPDF2.PdfReader
+        :param memo: records of annotation objects read by previous exports
+        :type memo: RecordMemo | None
+        """
+        super().__init__(pdf_reader)
+        self.memo: RecordMemo | None = memo
+        if pdf_reader.is_encrypted:
+            raise NotImplementedError("the scanner does not support encrypted pdfs")
+        stream = pdf_reader.stream
+        if isinstance(stream, mmap.mmap):
+            self.data: bytes | mmap.mmap = stream # scanned in place, see backends.open_reader
+        elif hasattr(stream, "getvalue"):
+            self.data = stream.getvalue() # no copy for the BytesIO of a PdfReader opened from a path
+        else:
+            stream.seek(0)
+            self.data = stream.read()
+        self.object_streams: dict[int, tuple[bytes, dict[int, tuple[int, int]]]] = {} # decoded data and extents
+        self.page_annots: list[Any] = self.walk_pages()
+
+    def page_count(self) -> int:
+        return len(self.page_annots)
+
+    def locate(self, reference: Reference) -> tuple[bytes, int, int | None] | None:
+        """
+        Finds an indirect object. The end is only known for objects in object streams.
+
+        :param reference: the reference to the object
+        :type reference: Reference
+        :return: the buffer, the start and the end of the object or None for free objects
+        :rtype: tuple[bytes, int, int | None] | None
+        """
+        idnum, generation = reference
+        if generation == 0 and idnum in self.pdf_reader.xref_objStm:
+            data, extents = self.object_stream(self.pdf_reader.xref_objStm[idnum][0])
+            if idnum not in extents:
+                raise ScanError(f"object {idnum} not in its object stream")
+            return data, *extents[idnum]
+
+        if self.pdf_reader.xref_free_entry.get(generation, {}).get(idnum, False):
+            return None
+        offset = self.pdf_reader.xref.get(generation, {}).get(idnum)
+        if offset is None:
+            raise ScanError(f"object {idnum} {generation} not in the cross reference table")
+        header = OBJECT_HEADER.match(self.data, offset)
+        if header is None or int(header.group(1)) != idnum:
+            raise ScanError(f"object {idnum} {generation} not at its offset")
+        return self.data, header.end(), None
+
+    def get_object(self, reference: Reference) -> Any:
+        """
+        Parses an indirect object.
+
+        :param reference: the reference to the object
+        :type reference: Reference
+        :return: the object
+        :rtype: Any
+        """
+        location = self.locate(reference)
+        if location is None:
+            return None
+        return parse_value(location[0], location[1])[0]
+
+    def object_stream(self, stream_idnum: int) -> tuple[bytes, dict[int, tuple[int, int]]]:
+        """
+        Returns the decoded data of an object stream and the start and end of its objects, decodes it once.
+
+        :param stream_idnum: object number of the object stream
+        :type stream_idnum: int
+        :return: the data and the object number to extent mapping
+        :rtype: tuple[bytes, dict[int, tuple[int, int]]]
+        """
+        cached = self.object_streams.get(stream_idnum)
+        if cached is not None:
+            return cached
+
+        try:
+            stream_object = self.pdf_reader.get_object(stream_idnum)
+            data = stream_object.get_data()
+            first = int(stream_object["/First"])
+            numbers = data[:first].split()
+            offsets = {
+                int(numbers[i]): first + int(numbers[i + 1])
+                for i in range(0, 2 * int(stream_object["/N"]), 2)}
+        except (KeyError, IndexError, ValueError, AttributeError) as e:
+            raise ScanError(f"object stream {stream_idnum} can not be read") from e
+        starts = sorted(offsets.values()) + [len(data)]
+        ends = dict(zip(starts, starts[1:])) # an object ends where the next one starts
+        extents = {idnum: (offset, ends[offset]) for idnum, offset in offsets.items()}
+        self.object_streams[stream_idnum] = (data, extents)
+        return data, extents
+
+    def resolve(self, value: Any) -> Any:
+        """
+        Resolves references.
+
+        :param value: the value
+        :type value: Any
+        :return: the referenced object, or the value if it is no reference
+        :rtype: Any
+        """
+        for _ in range(MAX_REFERENCE_DEPTH):
+            if not isinstance(value, Reference):
+                return value
+            value = self.get_object(value)
+        raise ScanError("too many nested references")
+
+    def walk_pages(self) -> list[Any]:
+        """
+        Walks the page tree in page order and collects the (unresolved) /Annots entry
+        of every page, None for pages without one.
+
+        :return: the /Annots entries
+        :rtype: list[Any]
+        """
+        root = self.pdf_reader.trailer.raw_get("/Root")
+        if not hasattr(root, "idnum"):
+            raise ScanError("/Root is not a reference")
+        catalog = self.resolve(Reference(root.idnum, root.generation))
+        if not isinstance(catalog, dict):
+            raise ScanError("catalog is not a dictionary")
+
+        page_annots: list[Any] = []
+        visited: set[Reference] = set()
+        stack: list[Any] = [catalog.get("/Pages")]
+        while stack:
+            node_ref = stack.pop()
+            if isinstance(node_ref, Reference):
+                if node_ref in visited:
+                    raise ScanError("page tree node used twice")
+                visited.add(node_ref)
+            node = self.resolve(node_ref)
+            if not isinstance(node, dict):
+                raise ScanError("page tree node is not a dictionary")
+
+            node_type = node.get("/Type", "/Pages") # like PdfReader, other nodes are skipped
+            if node_type == "/Pages":
+                kids = self.resolve(node.get("/Kids"))
+                if not isinstance(kids, list):
+                    raise ScanError("/Kids is not an array")
+                stack.extend(reversed(kids))
+            elif node_type == "/Page":
+                page_annots.append(node.get("/Annots"))
+        return page_annots
+
+    def page_records(self, page_nr: int) -> list[tuple] | None:
+        """
+        Returns the annotation records of a page, pages the scanner can not read are read with PyPDF2.
+
+        :param page_nr: the 0 based page number
+        :type page_nr: int
+        :return: list of records or None if the page has no annotations
+        :rtype: list[tuple] | None
+        """
+        try:
+            return self.scan_page(page_nr)
+        except ScanError as e:
+            logger.info("reading page %s with PyPDF2: %s", page_nr, e)
+            return super().page_records(page_nr)
+
+    def scan_page(self, page_nr: int) -> list[tuple] | None:
+        """
+        Reads the annotation records of a page.
+
+        :param page_nr: the 0 based page number
+        :type page_nr: int
+        :return: list of records or None if the page has no annotations
+        :rtype: list[tuple] | None
+        """
+        annots = self.page_annots[page_nr]
+        if annots is None:
+            return None
+        annots = self.resolve(annots)
+        if not isinstance(annots, list):
+            raise ScanError("/Annots is not an array")
+
+        records: list[tuple] = []
+        for annot in annots:
+            if self.memo is not None and isinstance(annot, Reference):
+                records.extend(self.memo_records(annot))
+            else:
+                records.extend(self.annotation_records(self.resolve(annot))[0])
+        return records
+
+    def memo_records(self, reference: Reference) -> list[tuple]:
+        """
+        Returns the records of an annotation object from the memo, the records are
+        only stored if the extent of the object is known and the fields used by the
+        exporter contain no references, so the raw bytes determine the records.
+
+        :param reference: the reference to the annotation
+        :type reference: Reference
+        :return: the records
+        :rtype: list[tuple]
+        """
+        location = self.locate(reference)
+        if location is None:
+            return self.annotation_records(None)[0]
+        data, start, end = location
+        if end is None: # the first endobj, if it is part of a string the parsed object ends elsewhere
+            end = data.find(b"endobj", start)
+            if end < 0:
+                raise ScanError(f"object {reference.idnum} has no end")
+
+        raw = data[start:end]
+        records = self.memo.get(raw)
+        if records is not None:
+            return records
+
+        annot, pos = parse_value(data, start)
+        records, direct = self.annotation_records(self.resolve(annot))
+        if direct and not isinstance(annot, Reference) and SKIP.match(data, pos).end() == end:
+            self.memo.put(raw, records)
+        return records
+
+    def annotation_records(self, annot: Any) -> tuple[list[tuple], bool]:
+        """
+        Reads the records of an annotation dictionary.
+
+        :param annot: the annotation dictionary
+        :type annot: Any
+        :return: the records and whether the fields used by the exporter contain no references
+        :rtype: tuple[list[tuple], bool]
+        """
+        from .generic import Annotation # circular import
+
+        if not isinstance(annot, dict):
+            raise ScanError("annotation is not a dictionary")
+        values = {key: annot[key] for key in ANNOTATION_FIELDS if key in annot}
+        direct = not any(
+            isinstance(value, Reference) or (isinstance(value, list) and any(isinstance(item, Reference) for item in value))
+            for value in values.values())
+        fields = {key: to_pypdf2(key, self.resolve(value)) for key, value in values.items()}
+        return Annotation.get_multiple_variables(fields), direct
+
+
+def to_pypdf2(key: str, value: Any) -> Any:
+    """
+    Converts a field of an annotation to the object PdfReader returns for it.
+
+    :param key: the key of the field
+    :type key: str
+    :param value: the parsed value
+    :type value: Any
+    :return: the PyPDF2 object
+    :rtype: Any
+    """
+    if key == "/Contents" and isinstance(value, PdfString):
+        return create_string_object(value.decode())
+    if key == "/Subtype" and isinstance(value, str):
+        return NameObject(value)
+    if key in ("/C", "/Rect") and isinstance(value, list):
+        numbers = ArrayObject()
+        for number in value:
+            if isinstance(number, Real):
+                numbers.append(FloatObject(number.token))
+            elif type(number) is int: # pylint: disable=unidiomatic-typecheck # bool is an int
+                numbers.append(NumberObject(number))
+            else:
+                raise ScanError(f"{key} contains {number!r}")
+        return numbers
+    raise ScanError(f"unexpected {key} {value!r}")
@@ -0,0 +1,833 @@
+"""
+Local http service for running exports from other tools without the gui, only
+the standard library is used (asyncio). Start it with
+
+    python -m annotation_exporter.service --port 8765 --workers 2
+
+Endpoints: \n
+-POST /jobs creates an export job. The body is either multipart/form-data with
+ the files "pdf" and "template" or json with the paths "pdf" and "template"
+ (only with --allow-paths, then "output" can name the output folder). Further
+ fields are options of the job, see JOB_OPTIONS. Returns the job id (202) or
+ 503 if the queue is full. \n
+-GET /jobs/<id> returns the state of the job (queued, running, done, failed,
+ cancelled), its result and the output files once it is finished \n
+-GET /jobs/<id>/files/<name> downloads an output file (see OUTPUT_FILES) \n
+-DELETE /jobs/<id> cancels a queued job or removes a finished one and its files \n
+-GET /health returns the number of queued and running jobs
+
+Uploads are streamed to the folder of the job (see MultipartReader). A job takes
+its place in the queue before its body is read, so a full service answers 503
+without reading the uploads.
+
+The jobs are queued in a bounded queue and run by run_job (see cli) in a process
+pool, at most one job per worker process runs at a time. The service binds to
+localhost by default and has no authentication, only expose it to trusted clients.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import argparse
+import asyncio
+import email.message
+import email.parser
+import email.policy
+import json
+import logging as lg
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, asdict, field
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable
+from .backends import BACKENDS
+from .cli import ExportJob, JobResult, run_job
+from .log_config import configure_logging
+from .options import ExportOptions, output_sinks
+
+logger = lg.getLogger("annotation_exporter.service") # __name__ is __main__ when run with -m
+
+QUEUED: str = "queued"
+RUNNING: str = "running"
+DONE: str = "done"
+FAILED: str = "failed"
+CANCELLED: str = "cancelled"
+
+DEFAULT_PORT: int = 8765
+DEFAULT_QUEUE_SIZE: int = 16
+DEFAULT_MAX_UPLOAD: int = 256 * 1024 * 1024
+DEFAULT_KEEP_JOBS: int = 100
+RETRY_AFTER: int = 5 # seconds, sent with 503 when the queue is full
+DEFAULT_TIMEOUT: float = 30.0 # seconds to wait for the head of a request or the next chunk of its body
+CHUNK_SIZE: int = 1024 * 1024
+MAX_FIELD_SIZE: int = 64 * 1024 # form fields, part headers and json bodies
+
+UPLOADED_PDF: str = "input.pdf"
+UPLOADED_TEMPLATE: str = "template.xlsx"
+OUTPUT_FILES: tuple[str] = ("output.xlsx", "Variables.csv", "Datasets.csv", "annotations.sqlite", "output.pdf")
+CONTENT_TYPES: dict[str, str] = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".csv": "text/csv; charset=utf-8",
+    ".sqlite": "application/vnd.sqlite3",
+    ".pdf": "application/pdf",
+}
+
+JOB_OPTIONS: dict[str, type] = { # options of a job and their type, see ExportOptions and output_sinks
+    "convert_old": bool,
+    "sqlite": bool,
+    "lazy": bool,
+    "streaming": bool,
+    "page_ranges": bool,
+    "incremental": bool,
+    "backend": str,
+    "document": str,
+    "color_precision": int,
+}
+TRUE_VALUES: tuple[str] = ("1", "true", "yes", "on")
+
+
+class HttpError(Exception):
+    """
+    Raised while handling a request, answered with the status and the message.
+    """
+    def __init__(self, status: HTTPStatus, message: str, headers: dict[str, str] | None = None) -> None:
+        """
+        Initialise class.
+
+        :param status: the status of the response
+        :type status: HTTPStatus
+        :param message: the error message
+        :type message: str
+        :param headers: additional headers of the response
+        :type headers: dict[str, str] | None
+        """
+        super().__init__(message)
+        self.status: HTTPStatus = status
+        self.headers: dict[str, str] = headers or {}
+
+
+@dataclass
+class ServiceJob:
+    """
+    A job of the service, the export job and its state.
+    """
+    id: str
+    export_job: ExportJob
+    folder: str | None # folder created for the job, removed with the job
+    state: str = QUEUED
+    created: float = field(default_factory=time.time)
+    result: JobResult | None = None
+
+    def output_files(self) -> list[str]:
+        """
+        Returns the names of the output files that exist.
+
+        :return: the file names
+        :rtype: list[str]
+        """
+        return [name for name in OUTPUT_FILES if os.path.isfile(os.path.join(self.export_job.output, name))]
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns the state of the job for the response.
+
+        :return: the state of the job
+        :rtype: dict[str, Any]
+        """
+        finished = self.state in (DONE, FAILED)
+        return {
+            "id": self.id,
+            "state": self.state,
+            "created": self.created,
+            "result": asdict(self.result) if self.result is not None else None,
+            "files": self.output_files() if finished else [],
+            }
+
+
+def parse_option(name: str, value: Any) -> Any:
+    """
+    Converts the value of a job option, form fields are strings.
+
+    :param name: name of the option, see JOB_OPTIONS
+    :type name: str
+    :param value: the value of the request
+    :type value: Any
+    :return: the converted value
+    :rtype: Any
+    """
+    option_type = JOB_OPTIONS[name]
+    if option_type is bool:
+        return value if isinstance(value, bool) else str(value).lower() in TRUE_VALUES
+
+    if name == "color_precision" and value in (None, "", "exact"): # exact color matching
+        return None
+    try:
+        value = option_type(value)
+    except (TypeError, ValueError) as e:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"invalid value for {name}: {value!r}") from e
+    if name == "backend" and value not in BACKENDS:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"unknown backend {value}, choose from {list(BACKENDS)}")
+    return value
+
+
+async def read_timeout(read: Awaitable[Any], timeout: float) -> Any:
+    """
+    Waits for a read of the request stream, a client that sends nothing for timeout seconds gets 408.
+
+    :param read: the read
+    :type read: Awaitable[Any]
+    :param timeout: seconds to wait
+    :type timeout: float
+    :return: the result of the read
+    :rtype: Any
+    """
+    try:
+        return await asyncio.wait_for(read, timeout)
+    except asyncio.TimeoutError as e:
+        raise HttpError(HTTPStatus.REQUEST_TIMEOUT, "the request timed out") from e
+
+
+class MultipartReader:
+    """
+    Reads a multipart/form-data body from the request stream one chunk at a time.
+    Uploaded files are written to disk as they arrive, so a large upload is never
+    kept in memory.
+    """
+    def __init__(
+            self,
+            reader: asyncio.StreamReader,
+            length: int,
+            content_type: str,
+            timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        Initialise class.
+
+        :param reader: the request stream, positioned at the start of the body
+        :type reader: asyncio.StreamReader
+        :param length: the length of the body
+        :type length: int
+        :param content_type: the content type header with the boundary
+        :type content_type: str
+        :param timeout: seconds to wait for the next chunk
+        :type timeout: float
+        """
+        message = email.message.Message()
+        message["content-type"] = content_type
+        boundary = message.get_param("boundary")
+        if not isinstance(boundary, str) or not boundary:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "the multipart boundary is missing")
+        self.reader: asyncio.StreamReader = reader
+        self.remaining: int = length
+        self.timeout: float = timeout
+        self.delimiter: bytes = b"\r\n--" + boundary.encode("latin-1")
+        self.buffer: bytearray = bytearray(b"\r\n") # the first boundary is not preceded by a line break
+
+    async def fill(self) -> None:
+        """
+        Reads the next chunk of the body into the buffer.
+        """
+        if self.remaining <= 0:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "invalid multipart body")
+        chunk = await read_timeout(self.reader.read(min(CHUNK_SIZE, self.remaining)), self.timeout)
+        if not chunk:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "incomplete body")
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+
+    async def read_part(self, write: Callable[[bytes], Awaitable[None]]) -> None:
+        """
+        Passes the data up to the next boundary to write and consumes the boundary.
+
+        :param write: called with the data of the part, chunk by chunk
+        :type write: Callable[[bytes], Awaitable[None]]
+        """
+        keep = len(self.delimiter) - 1 # the start of a boundary split between two chunks
+        while (end := self.buffer.find(self.delimiter)) < 0:
+            if len(self.buffer) > keep:
+                await write(bytes(self.buffer[:-keep]))
+                del self.buffer[:-keep]
+            await self.fill()
+        await write(bytes(self.buffer[:end]))
+        del self.buffer[:end + len(self.delimiter)]
+
+    async def read_headers(self) -> email.message.Message | None:
+        """
+        Reads the headers of the next part.
+
+        :return: the headers or None after the last part
+        :rtype: email.message.Message | None
+        """
+        while len(self.buffer) < 2:
+            await self.fill()
+        if self.buffer[:2] == b"--":
+            return None
+        while (end := self.buffer.find(b"\r\n\r\n")) < 0:
+            if len(self.buffer) > MAX_FIELD_SIZE:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "the headers of a part are too long")
+            await self.fill()
+        headers = email.parser.BytesHeaderParser(policy=email.policy.HTTP).parsebytes(bytes(self.buffer[2:end]))
+        del self.buffer[:end + 4]
+        return headers
+
+    async def read(self, file_paths: dict[str, str]) -> tuple[dict[str, str], dict[str, str]]:
+        """
+        Reads the body, the files with a name in file_paths are written to their path,
+        other files are skipped.
+
+        :param file_paths: name of the file field to the path it is written to
+        :type file_paths: dict[str, str]
+        :return: the fields and the paths of the written files, by name
+        :rtype: tuple[dict[str, str], dict[str, str]]
+        """
+        async def skip(data: bytes) -> None:
+            pass
+
+        await self.read_part(skip) # preamble
+        fields: dict[str, str] = {}
+        files: dict[str, str] = {}
+        while (headers := await self.read_headers()) is not None:
+            name = headers.get_param("name", header="content-disposition")
+            if headers.get_filename() is None:
+                value = bytearray()
+
+                async def collect(data: bytes) -> None:
+                    if len(value) + len(data) > MAX_FIELD_SIZE:
+                        raise HttpError(HTTPStatus.BAD_REQUEST, f"the field {name} is too long")
+                    value.extend(data)
+
+                await self.read_part(collect)
+                if name:
+                    fields[name] = value.decode("utf-8", "replace")
+            elif name in file_paths:
+                f = await asyncio.to_thread(open, file_paths[name], "wb")
+                try:
+                    await self.read_part(lambda data, f=f: asyncio.to_thread(f.write, data))
+                finally:
+                    await asyncio.to_thread(f.close)
+                files[name] = file_paths[name]
+            else:
+                await self.read_part(skip)
+        return fields, files
+
+
+class ExportService:
+    """
+    The http service, see the module docstring.
+    """
+    def __init__(
+            self,
+            work_dir: str,
+            workers: int = 1,
+            queue_size: int = DEFAULT_QUEUE_SIZE,
+            max_upload: int = DEFAULT_MAX_UPLOAD,
+            allow_paths: bool = False,
+            keep_jobs: int = DEFAULT_KEEP_JOBS,
+            log_level: int | str = lg.WARNING,
+            log_file: str | None = None,
+            timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        Initialise class.
+
+        :param work_dir: folder for the uploaded files and the outputs of the jobs
+        :type work_dir: str
+        :param workers: number of worker processes, the number of jobs running at once
+        :type workers: int
+        :param queue_size: number of jobs waiting at most, further jobs are rejected
+        :type queue_size: int
+        :param max_upload: maximum size of a request body in bytes
+        :type max_upload: int
+        :param allow_paths: whether jobs can reference files on the machine of the service
+        :type allow_paths: bool
+        :param keep_jobs: number of finished jobs that are kept, older ones are removed
+        :type keep_jobs: int
+        :param log_level: log level of the worker processes
+        :type log_level: int | str
+        :param log_file: log file of the worker processes, they log to stderr if None
+        :type log_file: str | None
+        :param timeout: seconds to wait for the head of a request or the next chunk of its body
+        :type timeout: float
+        """
+        self.work_dir: str = work_dir
+        self.workers: int = max(1, workers)
+        self.queue_size: int = queue_size
+        self.max_upload: int = max_upload
+        self.allow_paths: bool = allow_paths
+        self.keep_jobs: int = keep_jobs
+        self.log_level: int | str = log_level
+        self.log_file: str | None = log_file
+        self.timeout: float = timeout
+        self.jobs: dict[str, ServiceJob] = {} # in creation order
+        self.queue: asyncio.Queue[ServiceJob] | None = None
+        self.pool: ProcessPoolExecutor | None = None
+        self.running: int = 0
+        self.uploading: int = 0 # jobs whose request is still read, they have a place in the queue
+
+    def create_pool(self) -> ProcessPoolExecutor:
+        """
+        Creates the worker processes.
+
+        :return: the process pool
+        :rtype: ProcessPoolExecutor
+        """
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=configure_logging,
+            initargs=(self.log_level, self.log_file, "a", False))
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+        """
+        Runs the service until it is cancelled.
+
+        :param host: address to listen on
+        :type host: str
+        :param port: port to listen on
+        :type port: int
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.queue = asyncio.Queue(self.queue_size)
+        self.pool = self.create_pool()
+        dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+        try:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            async with server:
+                for sock in server.sockets:
+                    print("listening on http://{}:{}".format(*sock.getsockname()[:2]), flush=True)
+                serving = asyncio.create_task(server.serve_forever())
+                try: # stop cleanly on SIGTERM, so the worker processes are shut down
+                    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+                except (NotImplementedError, AttributeError): # windows
+                    pass
+                try:
+                    await serving
+                except asyncio.CancelledError:
+                    logger.info("service stopped")
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def dispatch(self) -> None:
+        """
+        Takes the jobs from the queue and runs them in the process pool, one at a time.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.state == CANCELLED:
+                    continue
+                job.state = RUNNING
+                self.running += 1
+                try:
+                    job.result = await loop.run_in_executor(self.pool, run_job, job.export_job)
+                except BrokenProcessPool as e: # a worker died, for example out of memory
+                    logger.error("worker process of job %s died, restarting the pool", job.id)
+                    job.result = JobResult(job.export_job.pdf, job.export_job.output, 1, 0.0, repr(e))
+                    self.pool.shutdown(wait=False, cancel_futures=True)
+                    self.pool = self.create_pool()
+                except Exception as e: # pylint: disable=broad-except # the dispatcher has to keep running
+                    logger.exception("job %s could not be run", job.id)
+                    job.result = JobResult(job.export_job.pdf, job.export_job.output, 1, 0.0, repr(e))
+                finally:
+                    self.running -= 1
+                job.state = DONE if job.result is not None and job.result.status == 0 else FAILED
+                await self.prune()
+            finally:
+                self.queue.task_done()
+
+    async def prune(self) -> None:
+        """
+        Removes the oldest finished jobs and their folders if more than keep_jobs are finished.
+        """
+        finished = [job for job in self.jobs.values() if job.state in (DONE, FAILED, CANCELLED)]
+        for job in finished[:max(0, len(finished) - self.keep_jobs)]:
+            await self.remove_job(job)
+
+    async def remove_job(self, job: ServiceJob) -> None:
+        """
+        Forgets a job and removes its folder.
+
+        :param job: the job
+        :type job: ServiceJob
+        """
+        self.jobs.pop(job.id, None)
+        if job.folder is not None:
+            await asyncio.to_thread(shutil.rmtree, job.folder, True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answers a single request, the connection is closed afterwards.
+
+        :param reader: the request stream
+        :type reader: asyncio.StreamReader
+        :param writer: the response stream
+        :type writer: asyncio.StreamWriter
+        """
+        try:
+            try:
+                method, path, headers = await read_timeout(self.read_head(reader), self.timeout)
+                await self.route(method, path, headers, reader, writer)
+            except HttpError as e:
+                await self.respond(writer, e.status, {"error": str(e)}, e.headers)
+            except Exception: # pylint: disable=broad-except
+                logger.exception("request failed")
+                await self.respond(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal error"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_head(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str]]:
+        """
+        Reads the request line and the headers.
+
+        :param reader: the request stream
+        :type reader: asyncio.StreamReader
+        :return: the method, the path and the headers with lower case names
+        :rtype: tuple[str, str, dict[str, str]]
+        """
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            method, target, _ = request_line.split(" ", 2)
+            headers: dict[str, str] = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, asyncio.LimitOverrunError) as e: # a line too long for the reader is a ValueError
+            raise HttpError(HTTPStatus.BAD_REQUEST, "malformed request") from e
+        return method.upper(), target.split("?", 1)[0], headers
+
+    @staticmethod
+    def content_length(headers: dict[str, str], limit: int) -> int:
+        """
+        Returns the length of the body of a request.
+
+        :param headers: the headers of the request
+        :type headers: dict[str, str]
+        :param limit: maximum length of the body
+        :type limit: int
+        :return: the length
+        :rtype: int
+        """
+        if "content-length" not in headers:
+            raise HttpError(HTTPStatus.LENGTH_REQUIRED, "content-length is required")
+        try:
+            length = int(headers["content-length"])
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "invalid content-length") from e
+        if length > limit:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"the body is limited to {limit} bytes")
+        return length
+
+    async def read_body(self, reader: asyncio.StreamReader, headers: dict[str, str]) -> bytes:
+        """
+        Reads a json body, its size is limited to MAX_FIELD_SIZE.
+
+        :param reader: the request stream
+        :type reader: asyncio.StreamReader
+        :param headers: the headers of the request
+        :type headers: dict[str, str]
+        :return: the body
+        :rtype: bytes
+        """
+        length = self.content_length(headers, MAX_FIELD_SIZE)
+        try:
+            return await read_timeout(reader.readexactly(length), self.timeout)
+        except asyncio.IncompleteReadError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "incomplete body") from e
+
+    async def route(
+            self,
+            method: str,
+            path: str,
+            headers: dict[str, str],
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter) -> None:
+        """
+        Calls the handler of the endpoint.
+
+        :param method: the http method
+        :type method: str
+        :param path: the path of the request
+        :type path: str
+        :param headers: the headers of the request
+        :type headers: dict[str, str]
+        :param reader: the request stream
+        :type reader: asyncio.StreamReader
+        :param writer: the response stream
+        :type writer: asyncio.StreamWriter
+        """
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            await self.respond(writer, HTTPStatus.OK, {
+                "workers": self.workers, "queued": self.queue.qsize(),
+                "running": self.running, "queue_size": self.queue_size})
+        elif parts == ["jobs"] and method == "POST":
+            job = await self.create_job(headers, reader)
+            await self.respond(writer, HTTPStatus.ACCEPTED, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+        elif len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+            await self.respond(writer, HTTPStatus.OK, self.get_job(parts[1]).to_dict())
+        elif len(parts) == 2 and parts[0] == "jobs" and method == "DELETE":
+            job = self.get_job(parts[1])
+            await self.delete_job(job)
+            await self.respond(writer, HTTPStatus.OK, {"id": job.id, "state": job.state, "removed": True})
+        elif len(parts) == 4 and parts[0] == "jobs" and parts[2] == "files" and method == "GET":
+            await self.send_file(writer, self.get_job(parts[1]), parts[3])
+        elif parts in (["health"], ["jobs"]) or (len(parts) in (2, 4) and parts[0] == "jobs"):
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not allowed for {path}")
+        else:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"{path} not found")
+
+    def get_job(self, job_id: str) -> ServiceJob:
+        """
+        Returns a job.
+
+        :param job_id: id of the job
+        :type job_id: str
+        :return: the job
+        :rtype: ServiceJob
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"job {job_id} not found")
+        return job
+
+    async def create_job(self, headers: dict[str, str], reader: asyncio.StreamReader) -> ServiceJob:
+        """
+        Creates a job from the request and queues it. A place in the queue is taken
+        before the body is read, so a full service rejects the job without reading
+        the uploads, which are written to the folder of the job as they arrive.
+
+        :param headers: the headers of the request
+        :type headers: dict[str, str]
+        :param reader: the request stream, positioned at the start of the body
+        :type reader: asyncio.StreamReader
+        :return: the queued job
+        :rtype: ServiceJob
+        """
+        if self.queue.maxsize > 0 and self.queue.qsize() + self.uploading >= self.queue.maxsize:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "the queue is full", {"Retry-After": str(RETRY_AFTER)})
+
+        content_type = headers.get("content-type", "")
+        multipart = content_type.startswith("multipart/form-data")
+        if not multipart and not content_type.startswith("application/json"):
+            raise HttpError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "use multipart/form-data or application/json")
+
+        job_id = uuid.uuid4().hex
+        folder = os.path.join(self.work_dir, job_id)
+        self.uploading += 1
+        try:
+            if multipart:
+                length = self.content_length(headers, self.max_upload)
+                await asyncio.to_thread(os.makedirs, folder, exist_ok=True)
+                fields, files = await MultipartReader(reader, length, content_type, self.timeout).read({
+                    "pdf": os.path.join(folder, UPLOADED_PDF), "template": os.path.join(folder, UPLOADED_TEMPLATE)})
+            else:
+                try:
+                    fields, files = json.loads(await self.read_body(reader, headers)), {}
+                except ValueError as e:
+                    raise HttpError(HTTPStatus.BAD_REQUEST, "invalid json") from e
+                if not isinstance(fields, dict):
+                    raise HttpError(HTTPStatus.BAD_REQUEST, "the json body must be an object")
+
+            pdf = self.job_input(fields, files, "pdf")
+            template = self.job_input(fields, files, "template")
+            output = fields.get("output")
+            if output is not None and not self.allow_paths:
+                raise HttpError(HTTPStatus.FORBIDDEN, "output folders can only be chosen with --allow-paths")
+            if output is None:
+                output = os.path.join(folder, "output")
+            await asyncio.to_thread(os.makedirs, output, exist_ok=True)
+
+            options = {name: parse_option(name, fields[name]) for name in JOB_OPTIONS if name in fields}
+            sinks = output_sinks(options.pop("convert_old", False), options.pop("sqlite", False))
+            job = ServiceJob(job_id, ExportJob(pdf, template, output, ExportOptions(sinks=sinks, **options)), folder)
+            self.queue.put_nowait(job)
+        except BaseException:
+            await asyncio.to_thread(shutil.rmtree, folder, True)
+            raise
+        finally:
+            self.uploading -= 1
+
+        self.jobs[job_id] = job
+        logger.info("queued job %s for %s", job_id, pdf)
+        return job
+
+    def job_input(self, fields: dict[str, Any], files: dict[str, str], name: str) -> str:
+        """
+        Returns the path of an input of a job, the uploaded file or, with allow_paths, the path of the request.
+
+        :param fields: the fields of the request
+        :type fields: dict[str, Any]
+        :param files: the paths of the uploaded files
+        :type files: dict[str, str]
+        :param name: name of the input, pdf or template
+        :type name: str
+        :return: the path of the input
+        :rtype: str
+        """
+        if name in files:
+            return files[name]
+
+        path = fields.get(name)
+        if path is None:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"{name} is missing")
+        if not self.allow_paths:
+            raise HttpError(HTTPStatus.FORBIDDEN, f"upload the {name}, paths are only accepted with --allow-paths")
+        if not isinstance(path, str) or not os.path.isfile(path):
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"{name} {path!r} does not exist")
+        return path
+
+    async def delete_job(self, job: ServiceJob) -> None:
+        """
+        Cancels a queued job or removes a finished job.
+
+        :param job: the job
+        :type job: ServiceJob
+        """
+        if job.state == RUNNING:
+            raise HttpError(HTTPStatus.CONFLICT, f"job {job.id} is running")
+        if job.state == QUEUED:
+            job.state = CANCELLED # skipped by dispatch
+        await self.remove_job(job)
+
+    async def send_file(self, writer: asyncio.StreamWriter, job: ServiceJob, name: str) -> None:
+        """
+        Sends an output file of a finished job.
+
+        :param writer: the response stream
+        :type writer: asyncio.StreamWriter
+        :param job: the job
+        :type job: ServiceJob
+        :param name: name of the file, see OUTPUT_FILES
+        :type name: str
+        """
+        if name not in OUTPUT_FILES:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"{name} is not an output file")
+        if job.state not in (DONE, FAILED):
+            raise HttpError(HTTPStatus.CONFLICT, f"job {job.id} is {job.state}")
+        path = os.path.join(job.export_job.output, name)
+        try:
+            f = open(path, "rb") # pylint: disable=consider-using-with
+        except OSError as e:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"job {job.id} has no {name}") from e
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+            await self.write_head(writer, HTTPStatus.OK, content_type, size, {
+                "Content-Disposition": f'attachment; filename="{name}"'})
+            while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                writer.write(chunk)
+                await writer.drain()
+
+    @staticmethod
+    async def write_head(
+            writer: asyncio.StreamWriter,
+            status: HTTPStatus,
+            content_type: str,
+            length: int,
+            headers: dict[str, str] | None = None) -> None:
+        """
+        Writes the status line and the headers of a response.
+
+        :param writer: the response stream
+        :type writer: asyncio.StreamWriter
+        :param status: the status
+        :type status: HTTPStatus
+        :param content_type: the content type of the body
+        :type content_type: str
+        :param length: the length of the body
+        :type length: int
+        :param headers: additional headers
+        :type headers: dict[str, str] | None
+        """
+        lines = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {length}",
+            "Connection: close",
+            ]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def respond(
+            self,
+            writer: asyncio.StreamWriter,
+            status: HTTPStatus,
+            content: dict[str, Any],
+            headers: dict[str, str] | None = None) -> None:
+        """
+        Sends a json response.
+
+        :param writer: the response stream
+        :type writer: asyncio.StreamWriter
+        :param status: the status
+        :type status: HTTPStatus
+        :param content: the content of the response
+        :type content: dict[str, Any]
+        :param headers: additional headers
+        :type headers: dict[str, str] | None
+        """
+        body = json.dumps(content).encode("utf-8")
+        await self.write_head(writer, status, "application/json", len(body), headers)
+        writer.write(body)
+        await writer.drain()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    parses the arguments and runs the service until it is interrupted
+
+    :param argv: command line arguments, defaults to sys.argv
+    :type argv: list[str] | None
+    :return: exit code
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        prog="annotation-exporter-service",
+        description="Local http service running aCRF annotation exports.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes (jobs running at once)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="number of waiting jobs before 503 is returned")
+    parser.add_argument(
+        "--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD // (1024 * 1024), help="maximum size of a request in MB")
+    parser.add_argument("--work-dir", help="folder for uploads and outputs, defaults to a temporary folder")
+    parser.add_argument(
+        "--allow-paths", action="store_true",
+        help="accept paths of files and output folders on this machine instead of uploads")
+    parser.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT,
+        help="seconds to wait for a client before its request is answered with 408")
+    parser.add_argument("--keep-jobs", type=int, default=DEFAULT_KEEP_JOBS, help="number of finished jobs that are kept")
+    parser.add_argument("--log-level", default="WARNING", help="log level, for example INFO or DEBUG")
+    parser.add_argument("--log-file", help="write the log to this file instead of stderr")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level.upper(), args.log_file)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="annotation_exporter_")
+    service = ExportService(
+        work_dir, args.workers, args.queue_size, args.max_upload_mb * 1024 * 1024, args.allow_paths,
+        args.keep_jobs, args.log_level.upper(), args.log_file, args.timeout)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,535 @@
+"""
+In-memory representation of the SDTM specification: \n
+-SpecSheet holds the values of one sheet of the template \n
+-SpecTemplate holds all sheets of the template \n
+-SpecOverlay records the changes an export makes to the template
+
+The workbook population only works on these classes, the changes
+are applied to a workbook when the output is written. The template
+is cached in an index file next to the template (see INDEX_SUFFIX),
+so it only has to be parsed again when it changes. The index is
+stored as json and only contains the values of the cells.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import datetime
+import hashlib
+import json
+import logging as lg
+import os
+import tempfile
+from typing import Any, Iterator
+import openpyxl as pyxl
+
+logger = lg.getLogger(__name__)
+
+PRESENT: str = "Present"
+EXPORTER_HEADER: str = "Present in aCRF"
+DATASETS: str = "Datasets"
+VARIABLES: str = "Variables"
+
+# 1 based column indices of the template
+DATASET_COL: int = 1 # A, Datasets sheet
+VAR_DATASET_COL: int = 2 # B
+VAR_NAME_COL: int = 3 # C
+VAR_LABEL_COL: int = 4 # D
+VAR_LENGTH_COL: int = 6 # F
+VAR_ORIGIN_COL: int = 12 # L
+VAR_PAGES_COL: int = 13 # M
+
+PAGE_SEPARATOR: str = " "
+PAGE_RANGE_SEPARATOR: str = "-"
+
+INDEX_SUFFIX: str = ".annot_index"
+INDEX_VERSION: int = 2 # increase when SpecSheet or SpecTemplate change
+INDEX_TYPES: dict[str, type] = { # cell values json can not store, stored as {type name: isoformat}
+    "datetime": datetime.datetime,
+    "date": datetime.date,
+    "time": datetime.time,
+}
+
+
+class TemplateFullError(Exception):
+    """
+    Raised if a sheet of the template has no free column for the exporter.
+    """
+
+
+def parse_pages(value: Any) -> tuple[set[int], list[str]]:
+    """
+    Splits the value of a page cell into page numbers and the remaining text,
+    ranges like "3-7" are expanded.
+
+    :param value: the value of the cell
+    :type value: Any
+    :return: the page numbers and the parts that are not page numbers
+    :rtype: tuple[set[int], list[str]]
+    """
+    pages: set[int] = set()
+    other: list[str] = []
+    for part in str(value or "").split():
+        first, _, last = part.partition(PAGE_RANGE_SEPARATOR)
+        if first.isdigit() and (not last or last.isdigit()):
+            pages.update(range(int(first), int(last or first) + 1))
+        else:
+            other.append(part)
+    return pages, other
+
+
+def format_pages(pages: set[int], ranges: bool = False) -> str:
+    """
+    Returns the sorted page numbers as text, with ranges
+    consecutive pages are combined ("3-7 12" instead of "3 4 5 6 7 12").
+
+    :param pages: the page numbers
+    :type pages: set[int]
+    :param ranges: whether consecutive pages are combined
+    :type ranges: bool
+    :return: the page numbers as text
+    :rtype: str
+    """
+    sorted_pages = sorted(pages)
+    if not ranges:
+        return PAGE_SEPARATOR.join(map(str, sorted_pages))
+
+    parts: list[str] = []
+    start = end = None
+    for page_nr in sorted_pages + [None]:
+        if end is not None and page_nr == end + 1:
+            end = page_nr
+            continue
+        if start is not None:
+            parts.append(str(start) if start == end else f"{start}{PAGE_RANGE_SEPARATOR}{end}")
+        start = end = page_nr
+    return PAGE_SEPARATOR.join(parts)
+
+
+def encode_value(value: Any) -> Any:
+    """
+    Converts a cell value for the template index, see INDEX_TYPES.
+
+    :param value: the cell value
+    :type value: Any
+    :return: the value json can store
+    :rtype: Any
+    """
+    if value is None or isinstance(value, (str, int, float)): # bool is an int
+        return value
+    if isinstance(value, datetime.timedelta):
+        return {"timedelta": value.total_seconds()}
+    for name, value_type in INDEX_TYPES.items(): # datetime before date, it is a subclass
+        if isinstance(value, value_type):
+            return {name: value.isoformat()}
+    raise TypeError(f"can not store {type(value).__name__} in the template index")
+
+
+def decode_value(value: Any) -> Any:
+    """
+    Converts a value of the template index back to the cell value.
+
+    :param value: the value of the index
+    :type value: Any
+    :return: the cell value
+    :rtype: Any
+    """
+    if not isinstance(value, dict):
+        return value
+    (name, stored), = value.items()
+    if name == "timedelta":
+        return datetime.timedelta(seconds=stored)
+    return INDEX_TYPES[name].fromisoformat(stored)
+
+
+class SpecSheet:
+    """
+    The values of one sheet of the template, row 1 is the header.
+    """
+    def __init__(self, title: str, rows: list[tuple]) -> None:
+        """
+        Initialise class. The rows are padded to the same length.
+
+        :param title: name of the sheet
+        :type title: str
+        :param rows: the values of every row
+        :type rows: list[tuple]
+        """
+        width = max((len(row) for row in rows), default=0)
+        self.title: str = title
+        self.rows: list[tuple] = [row + (None,) * (width - len(row)) for row in rows]
+        self.max_column: int = width
+
+    @property
+    def max_row(self) -> int:
+        """
+        number of rows in the sheet
+
+        :return: the number of rows
+        :rtype: int
+        """
+        return len(self.rows)
+
+    def value(self, row_nr: int, col: int) -> Any:
+        """
+        Returns the value of a cell.
+
+        :param row_nr: 1 based row number
+        :type row_nr: int
+        :param col: 1 based column index
+        :type col: int
+        :return: the value or None if the cell is outside of the sheet
+        :rtype: Any
+        """
+        if row_nr > len(self.rows) or col > self.max_column:
+            return None
+        return self.rows[row_nr - 1][col - 1]
+
+    def rows_with_value(self, col: int, value: Any) -> list[int]:
+        """
+        Returns the row numbers of all rows with the value in the column.
+
+        :param col: 1 based column index
+        :type col: int
+        :param value: the value
+        :type value: Any
+        :return: the row numbers
+        :rtype: list[int]
+        """
+        if col is None or col > self.max_column:
+            return []
+        return [row_nr for row_nr, row in enumerate(self.rows, start=1) if row[col - 1] == value]
+
+    def exporter_col(self) -> int | None:
+        """
+        Returns the column index of the exporter column, the last free column
+        of the header (see AnnotationExporter.determine_exporter_col).
+
+        :return: the column index or None if there is no free column
+        :rtype: int | None
+        """
+        if not self.rows:
+            return None
+
+        free_cols = [col for col, value in enumerate(self.rows[0], start=1) if value is None]
+        return free_cols[-1] if free_cols else None
+
+
+class SpecTemplate:
+    """
+    All sheets of the template, in workbook order.
+    """
+    def __init__(self, sheets: list[SpecSheet]) -> None:
+        """
+        Initialise class.
+
+        :param sheets: the sheets of the template
+        :type sheets: list[SpecSheet]
+        """
+        self.sheets: dict[str, SpecSheet] = {sheet.title: sheet for sheet in sheets}
+
+    @classmethod
+    def from_workbook(cls, wb: pyxl.Workbook) -> SpecTemplate:
+        """
+        Creates the template from an already loaded workbook.
+
+        :param wb: the workbook
+        :type wb: pyxl.Workbook
+        :return: the template
+        :rtype: SpecTemplate
+        """
+        return cls([SpecSheet(ws.title, list(ws.iter_rows(values_only=True))) for ws in wb.worksheets])
+
+    @classmethod
+    def read(cls, template_path: str) -> SpecTemplate:
+        """
+        Reads the template in read only mode, which is a lot faster and uses
+        less memory than loading the full workbook.
+
+        :param template_path: path to the template file
+        :type template_path: str
+        :return: the template
+        :rtype: SpecTemplate
+        """
+        wb = pyxl.load_workbook(template_path, read_only=True)
+        try:
+            return cls.from_workbook(wb)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        """
+        sha256 of a file
+
+        :param path: path to the file
+        :type path: str
+        :return: hex digest
+        :rtype: str
+        """
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    @staticmethod
+    def read_index(template_path: str) -> dict | None:
+        """
+        Reads the index file next to the template.
+
+        :param template_path: path to the template file
+        :type template_path: str
+        :return: the index or None if there is no index of the current version
+        :rtype: dict | None
+        """
+        try:
+            with open(template_path + INDEX_SUFFIX, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+            return None
+        return index
+
+    @classmethod
+    def from_index(cls, template_path: str) -> SpecTemplate | None:
+        """
+        Loads the template from the index file next to it. The index is only used
+        if the modification time and size of the template match or, if they don't,
+        its hash still matches (for example after copying the file).
+
+        :param template_path: path to the template file
+        :type template_path: str
+        :return: the template or None if there is no valid index
+        :rtype: SpecTemplate | None
+        """
+        index = cls.read_index(template_path)
+        if index is None:
+            return None
+
+        stat = os.stat(template_path)
+        if (index.get("mtime"), index.get("size")) != (stat.st_mtime_ns, stat.st_size) and (
+                index.get("size") != stat.st_size or index.get("sha256") != cls.file_hash(template_path)):
+            logger.info("template index of %s is outdated", template_path)
+            return None
+
+        try:
+            return cls([
+                SpecSheet(sheet["title"], [tuple(decode_value(value) for value in row) for row in sheet["rows"]])
+                for sheet in index["sheets"]
+                ])
+        except (KeyError, TypeError, ValueError):
+            logger.warning("template index of %s is invalid", template_path)
+            return None
+
+    def write_index(self, template_path: str) -> None:
+        """
+        Saves the template next to the template file, so the next export
+        does not have to parse the workbook. The index is written to a temporary
+        file that replaces the index, so other processes never read a partial index.
+        An index with the same hash is not written again.
+
+        :param template_path: path to the template file
+        :type template_path: str
+        """
+        stat = os.stat(template_path)
+        sha256 = self.file_hash(template_path)
+        current = self.read_index(template_path)
+        if current is not None and current.get("sha256") == sha256:
+            return
+
+        try:
+            index = {
+                "version": INDEX_VERSION,
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": sha256,
+                "sheets": [
+                    {"title": sheet.title, "rows": [[encode_value(value) for value in row] for row in sheet.rows]}
+                    for sheet in self.sheets.values()
+                    ],
+            }
+        except TypeError as e:
+            logger.warning("could not write the template index for %s: %s", template_path, e)
+            return
+
+        index_path = template_path + INDEX_SUFFIX
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                prefix=os.path.basename(index_path), suffix=".tmp", dir=os.path.dirname(os.path.abspath(index_path)))
+        except OSError:
+            logger.warning("could not write the template index for %s", template_path)
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(temp_path, index_path)
+        except OSError:
+            logger.warning("could not write the template index for %s", template_path)
+            os.unlink(temp_path)
+
+    def __getitem__(self, title: str) -> SpecSheet:
+        return self.sheets[title]
+
+
+class SpecOverlay:
+    """
+    Records the changes of an export: rows marked as present,
+    appended rows and the page column. Appended rows are numbered
+    after the last row of the template. The pages of every row are
+    collected as a set and only formatted when the value is read.
+    """
+    def __init__(self, template: SpecTemplate, page_ranges: bool = False) -> None:
+        """
+        Initialise class.
+
+        :param template: the template the changes are applied to
+        :type template: SpecTemplate
+        :param page_ranges: whether consecutive pages are combined into ranges
+        :type page_ranges: bool
+        """
+        self.template: SpecTemplate = template
+        self.datasets: SpecSheet = template[DATASETS]
+        self.variables: SpecSheet = template[VARIABLES]
+        self.exporter_col_ds: int | None = self.datasets.exporter_col()
+        self.exporter_col_var: int | None = self.variables.exporter_col()
+        self.present_datasets: dict[int, None] = {} # dicts are used as ordered sets
+        self.new_datasets: list[str] = []
+        self.present_variables: dict[int, None] = {}
+        self.new_variables: list[tuple[str, str]] = []
+        self.page_ranges: bool = page_ranges
+        self.pages: dict[int, set[int]] = {}
+
+    def append_dataset(self, dataset_name: str) -> int:
+        """
+        Appends a dataset row, the row is marked as present.
+
+        :param dataset_name: name of the dataset
+        :type dataset_name: str
+        :return: the row number of the new row
+        :rtype: int
+        """
+        self.new_datasets.append(dataset_name)
+        return self.datasets.max_row + len(self.new_datasets)
+
+    def mark_dataset(self, row_nr: int) -> None:
+        """
+        Marks a dataset row of the template as present,
+        appended rows are always present.
+
+        :param row_nr: the row number
+        :type row_nr: int
+        """
+        if row_nr <= self.datasets.max_row:
+            self.present_datasets[row_nr] = None
+
+    def append_variable(self, dataset_name: str, variable_name: str) -> int:
+        """
+        Appends a variable row, the row is marked as present.
+
+        :param dataset_name: name of the dataset
+        :type dataset_name: str
+        :param variable_name: name of the variable
+        :type variable_name: str
+        :return: the row number of the new row
+        :rtype: int
+        """
+        self.new_variables.append((dataset_name, variable_name))
+        return self.variables.max_row + len(self.new_variables)
+
+    def mark_variable(self, row_nr: int) -> None:
+        """
+        Marks a variable row of the template as present.
+
+        :param row_nr: the row number
+        :type row_nr: int
+        """
+        self.present_variables[row_nr] = None
+
+    def is_variable_present(self, row_nr: int) -> bool:
+        """
+        Returns whether a variable row is marked as present.
+
+        :param row_nr: the row number
+        :type row_nr: int
+        :return: True if the row is present
+        :rtype: bool
+        """
+        if row_nr > self.variables.max_row or row_nr in self.present_variables:
+            return True
+        return self.variables.value(row_nr, self.exporter_col_var) == PRESENT
+
+    def add_page(self, row_nr: int, page_nr: int) -> None:
+        """
+        Adds the page number to the pages of a variable row.
+
+        :param row_nr: the row number
+        :type row_nr: int
+        :param page_nr: the 1 based page number
+        :type page_nr: int
+        """
+        pages = self.pages.get(row_nr)
+        if pages is None:
+            pages = self.pages[row_nr] = set()
+        pages.add(page_nr)
+
+    def page_value(self, row_nr: int) -> str:
+        """
+        Returns the page column of a variable row with the collected pages,
+        pages already in the template are kept.
+
+        :param row_nr: the row number
+        :type row_nr: int
+        :return: the sorted page numbers as text
+        :rtype: str
+        """
+        template_pages, other = parse_pages(self.variables.value(row_nr, VAR_PAGES_COL))
+        pages = self.pages[row_nr] | template_pages
+        return PAGE_SEPARATOR.join(other + [format_pages(pages, self.page_ranges)])
+
+    def variable_value(self, row_nr: int, col: int) -> Any:
+        """
+        Returns the value of a cell of the Variables sheet with the changes applied.
+
+        :param row_nr: the row number
+        :type row_nr: int
+        :param col: the column index
+        :type col: int
+        :return: the value of the cell
+        :rtype: Any
+        """
+        if col == VAR_PAGES_COL and row_nr in self.pages:
+            return self.page_value(row_nr)
+
+        if row_nr <= self.variables.max_row:
+            if col == VAR_ORIGIN_COL and row_nr in self.present_variables:
+                return "CRF"
+            if col == self.exporter_col_var and row_nr in self.present_variables:
+                return PRESENT
+            return self.variables.value(row_nr, col)
+
+        dataset_name, variable_name = self.new_variables[row_nr - self.variables.max_row - 1]
+        return {
+            VAR_DATASET_COL: dataset_name,
+            VAR_NAME_COL: variable_name,
+            VAR_ORIGIN_COL: "CRF",
+            VAR_LENGTH_COL: "200",
+            self.exporter_col_var: PRESENT,
+        }.get(col)
+
+    def present_variable_rows(self) -> Iterator[int]:
+        """
+        Yields the row numbers of all variable rows marked as present, in sheet order.
+        These are the rows marked during the export, the rows already marked
+        in the template and the appended rows.
+
+        :return: iterator over the row numbers
+        :rtype: Iterator[int]
+        """
+        template_rows = set(self.variables.rows_with_value(self.exporter_col_var, PRESENT))
+        yield from sorted(template_rows.union(self.present_variables))
+        yield from range(self.variables.max_row + 1, self.variables.max_row + len(self.new_variables) + 1)
+
+    def check_exporter_cols(self) -> None:
+        """
+        Raises TemplateFullError if one of the sheets has no free column for the exporter.
+        """
+        for sheet, col in ((DATASETS, self.exporter_col_ds), (VARIABLES, self.exporter_col_var)):
+            if col is None:
+                logger.critical("no free column for sheet %s found", sheet)
+                raise TemplateFullError(f"no free column for sheet {sheet} found")
@@ -0,0 +1,348 @@
+"""
+Contains the AnnotationStore class which keeps the annotations of a document
+in columns instead of one object per annotation. Strings and colors are stored
+once in a table and referenced by their id, page numbers, flags and rects are
+kept in arrays. Annotation objects are views into the store.
+Variables are matched to the datasets of their page by a color key, the color
+rounded to color_precision decimals, so float noise does not prevent a match.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import logging as lg
+from array import array
+from typing import Any, Iterable, Iterator
+from .parser import classify
+
+logger = lg.getLogger(__name__)
+
+VALID: int = 1
+DATASET: int = 2
+NEW_DATASET: int = 4
+SUPP: int = 8
+
+NO_STRING: int = -1 # id for None
+
+# integer columns with one value per annotation
+ROW_COLUMNS: tuple[str, ...] = (
+    "page_nrs", "contents", "dataset_names", "variable_names", "assigned_datasets", "annotation_colors")
+
+DEFAULT_COLOR_PRECISION: int = 3 # decimals, finer than the 1/255 steps of 8 bit colors
+RECT_SIZE: int = 4 # values of a /Rect, the rects column has this many values per annotation
+
+
+def rect_values(rect: Any, page_nr: int) -> list[float]:
+    """
+    Returns the four values of a /Rect. Rects with a different number of values
+    are padded with zeros or cut, rects with values that are not numbers are
+    stored as zeros, both with a warning.
+
+    :param rect: the /Rect of the annotation
+    :type rect: Any
+    :param page_nr: the page number, for the warning
+    :type page_nr: int
+    :return: the values
+    :rtype: list[float]
+    """
+    try:
+        values = [float(value) for value in rect]
+    except (TypeError, ValueError):
+        logger.warning("annotation on page %s has an invalid /Rect %r, it is stored as zeros", page_nr, rect)
+        return [0.0] * RECT_SIZE
+    if len(values) != RECT_SIZE:
+        logger.warning("annotation on page %s has a /Rect with %s values, it is padded or cut to %s",
+                       page_nr, len(values), RECT_SIZE)
+        values = (values + [0.0] * RECT_SIZE)[:RECT_SIZE]
+    return values
+
+
+class AnnotationStore:
+    """
+    Columnar table of the annotations of a document, one row per variable.
+    """
+    def __init__(self, color_precision: int | None = DEFAULT_COLOR_PRECISION) -> None:
+        """
+        Initialise class. With a color_precision of None colors only match
+        if they are exactly equal.
+
+        :param color_precision: number of decimals colors are rounded to for matching
+        :type color_precision: int | None
+        """
+        self.color_precision: int | None = color_precision
+        self.string_ids: dict[str, int] = {}
+        self.strings: list[str] = []
+        self.color_ids: dict[str, int] = {}
+        self.colors: list[list[float]] = []
+        self.color_keys: list[tuple] = [] # color key for every color id
+
+        self.page_nrs: array = array("I")
+        self.flags: bytearray = bytearray()
+        self.contents: array = array("i")
+        self.dataset_names: array = array("i")
+        self.variable_names: array = array("i")
+        self.assigned_datasets: array = array("i")
+        self.annotation_colors: array = array("i")
+        self.rects: array = array("d") # four values per annotation
+
+        self.datasets: dict[int, list[tuple]] = {} # page number to (dataset name, color)
+        self.dataset_colors: dict[int, dict[tuple, str]] = {} # page number to color key to dataset name
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def intern(self, string: str | None) -> int:
+        """
+        Returns the id of a string, adding it to the table if it is new.
+
+        :param string: the string
+        :type string: str | None
+        :return: the id of the string
+        :rtype: int
+        """
+        if string is None:
+            return NO_STRING
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def string(self, string_id: int) -> str | None:
+        """
+        Returns the string for an id.
+
+        :param string_id: the id of the string
+        :type string_id: int
+        :return: the string
+        :rtype: str | None
+        """
+        return None if string_id == NO_STRING else self.strings[string_id]
+
+    def color_id(self, color: list[float]) -> int:
+        """
+        Returns the id of a color, adding it to the table if it is new.
+        Colors are only the same if they are written the same way.
+
+        :param color: the color
+        :type color: list[float]
+        :return: the id of the color
+        :rtype: int
+        """
+        key = repr(color)
+        color_id = self.color_ids.get(key)
+        if color_id is None:
+            color_id = self.color_ids[key] = len(self.colors)
+            self.colors.append(color)
+            self.color_keys.append(self.color_key(color))
+        return color_id
+
+    def color_key(self, color: list[float]) -> tuple:
+        """
+        Returns the key colors are matched by, the color rounded to color_precision decimals.
+
+        :param color: the color
+        :type color: list[float]
+        :return: the color key
+        :rtype: tuple
+        """
+        if self.color_precision is None:
+            return tuple(color)
+        return tuple(round(float(value), self.color_precision) for value in color)
+
+    def page_datasets(self, page_nr: int) -> list[tuple]:
+        """
+        Returns the datasets of a page.
+
+        :param page_nr: the page number
+        :type page_nr: int
+        :return: the datasets, each dataset is a tuple with dataset name and color
+        :rtype: list[tuple]
+        """
+        return self.datasets.setdefault(page_nr, [])
+
+    def add_dataset(self, page_nr: int, dataset_name: str, color: list[float]) -> None:
+        """
+        Adds a dataset to a page. If two datasets of a page have the same
+        color key variables are matched to the first one.
+
+        :param page_nr: the page number
+        :type page_nr: int
+        :param dataset_name: the name of the dataset
+        :type dataset_name: str
+        :param color: the color of the dataset
+        :type color: list[float]
+        """
+        self.page_datasets(page_nr).append((dataset_name, color))
+        self.dataset_colors.setdefault(page_nr, {}).setdefault(self.color_key(color), dataset_name)
+
+    def match_dataset(self, index: int) -> str | None:
+        """
+        Returns the dataset on the same page with the same color key as the annotation.
+
+        :param index: the index of the annotation
+        :type index: int
+        :return: the name of the dataset or None if there is none
+        :rtype: str | None
+        """
+        page_colors = self.dataset_colors.get(self.page_nrs[index])
+        if page_colors is None:
+            return None
+        return page_colors.get(self.color_keys[self.annotation_colors[index]])
+
+    def append(self, record: tuple, page_nr: int) -> int:
+        """
+        Classifies an annotation record (see Annotation.get_multiple_variables)
+        and adds it to the store. Datasets are added to the datasets of the page.
+
+        :param record: the annotation record
+        :type record: tuple
+        :param page_nr: the page number
+        :type page_nr: int
+        :return: the index of the annotation
+        :rtype: int
+        """
+        content, color, subtype, rect = record
+        color_id = self.color_id(color)
+        dataset_name = variable_name = None
+        if subtype != "/FreeText":
+            flags = 0
+        else:
+            parsed = classify(content)
+            content = parsed.content
+            dataset_name = parsed.dataset_name
+            variable_name = parsed.variable_name
+            flags = VALID
+            if parsed.dataset:
+                flags |= DATASET
+                self.add_dataset(page_nr, dataset_name, self.colors[color_id])
+            if parsed.new_dataset:
+                flags |= NEW_DATASET
+            if parsed.supp:
+                flags |= SUPP
+
+        self.page_nrs.append(page_nr)
+        self.flags.append(flags)
+        self.contents.append(self.intern(content))
+        self.dataset_names.append(self.intern(dataset_name))
+        self.variable_names.append(self.intern(variable_name))
+        self.assigned_datasets.append(NO_STRING)
+        self.annotation_colors.append(color_id)
+        self.rects.extend(rect_values(rect, page_nr))
+        return len(self.flags) - 1
+
+    def append_row(self, source: AnnotationStore, index: int, page_nr: int | None = None) -> int:
+        """
+        Copies an annotation of another store (or this one) without classifying it again.
+        The datasets of the page are not changed.
+
+        :param source: the store the annotation is in
+        :type source: AnnotationStore
+        :param index: the index of the annotation in the source
+        :type index: int
+        :param page_nr: the page number of the copy, by default the one of the annotation
+        :type page_nr: int | None
+        :return: the index of the copy
+        :rtype: int
+        """
+        self.page_nrs.append(source.page_nrs[index] if page_nr is None else page_nr)
+        self.flags.append(source.flags[index])
+        self.contents.append(self.intern(source.strings[source.contents[index]]))
+        self.dataset_names.append(self.intern(source.string(source.dataset_names[index])))
+        self.variable_names.append(self.intern(source.string(source.variable_names[index])))
+        self.assigned_datasets.append(self.intern(source.string(source.assigned_datasets[index])))
+        self.annotation_colors.append(self.color_id(source.colors[source.annotation_colors[index]]))
+        self.rects.extend(source.rects[index * 4:index * 4 + 4])
+        return len(self.flags) - 1
+
+    def empty_copy(self) -> AnnotationStore:
+        """
+        Returns a store without annotations that shares the string and color tables
+        with this store, so strings and colors are not stored again for every copy.
+
+        :return: the new store
+        :rtype: AnnotationStore
+        """
+        part = AnnotationStore(self.color_precision)
+        part.string_ids, part.strings = self.string_ids, self.strings
+        part.color_ids, part.colors, part.color_keys = self.color_ids, self.colors, self.color_keys
+        return part
+
+    def page_slice(self, page_nr: int, indices: Iterable[int]) -> AnnotationStore:
+        """
+        Returns a new store with the annotations at the indices and the datasets of a page,
+        so the page can be kept without the rows of the other pages. The string and color
+        tables are shared with this store.
+
+        :param page_nr: the page number
+        :type page_nr: int
+        :param indices: the indices of the annotations
+        :type indices: Iterable[int]
+        :return: the new store
+        :rtype: AnnotationStore
+        """
+        indices = list(indices)
+        part = self.empty_copy()
+        for name in ROW_COLUMNS:
+            column = getattr(self, name)
+            setattr(part, name, array(column.typecode, [column[index] for index in indices]))
+        part.flags = bytearray(self.flags[index] for index in indices)
+        part.rects = array("d", [value for index in indices for value in self.rects[index * 4:index * 4 + 4]])
+        part.datasets[page_nr] = list(self.page_datasets(page_nr))
+        part.dataset_colors[page_nr] = dict(self.dataset_colors.get(page_nr, {}))
+        return part
+
+    def page_block(self, index: int) -> range:
+        """
+        Returns the indices of the annotations next to an annotation that are on
+        the same page, the annotations of a page are added one after another.
+
+        :param index: the index of the annotation
+        :type index: int
+        :return: the indices
+        :rtype: range
+        """
+        page_nr = self.page_nrs[index]
+        start = stop = index
+        while start > 0 and self.page_nrs[start - 1] == page_nr:
+            start -= 1
+        while stop + 1 < len(self.flags) and self.page_nrs[stop + 1] == page_nr:
+            stop += 1
+        return range(start, stop + 1)
+
+    def extend(self, records: Iterable[tuple], page_nr: int) -> range:
+        """
+        Adds the annotation records of a page.
+
+        :param records: the annotation records
+        :type records: Iterable[tuple]
+        :param page_nr: the page number
+        :type page_nr: int
+        :return: the indices of the added annotations
+        :rtype: range
+        """
+        start = len(self.flags)
+        for record in records:
+            self.append(record, page_nr)
+        return range(start, len(self.flags))
+
+    def rows(self, indices: Iterable[int]) -> Iterator[tuple]:
+        """
+        Yields the valid annotations as tuples of
+        (dataset, new dataset, dataset name, supp, assigned dataset, variable name, content, color).
+
+        :param indices: the indices of the annotations
+        :type indices: Iterable[int]
+        :return: iterator over the rows
+        :rtype: Iterator[tuple]
+        """
+        string = self.string
+        for index in indices:
+            flags = self.flags[index]
+            if not flags & VALID:
+                continue
+            yield (bool(flags & DATASET),
+                   bool(flags & NEW_DATASET),
+                   string(self.dataset_names[index]),
+                   bool(flags & SUPP),
+                   string(self.assigned_datasets[index]),
+                   string(self.variable_names[index]),
+                   self.strings[self.contents[index]],
+                   self.colors[self.annotation_colors[index]])
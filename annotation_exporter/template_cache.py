@@ -0,0 +1,180 @@
+"""
+Per process cache of the parsed templates. TemplateCache keeps the SpecTemplate
+of every template and the content of the template file.
+
+Batches usually export many studies with the same template. The template is
+parsed once per process and treated as read only, every export records its
+changes in a SpecOverlay (see spec). To save the output the overlay is applied
+to a workbook of its own, loaded from the cached content of the file, so the
+cached template is never changed. A cached template is used as long as the
+modification time and size of the file do not change.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import io
+import logging as lg
+import os
+import threading
+from collections import OrderedDict
+import openpyxl as pyxl
+from .spec import SpecTemplate
+
+logger = lg.getLogger(__name__)
+
+DEFAULT_MAX_TEMPLATES: int = 4
+
+
+class CachedTemplate:
+    """
+    The parsed template and the content of a template file.
+    """
+    def __init__(self, template_path: str, stamp: tuple[int, int], template: SpecTemplate) -> None:
+        """
+        Initialise class.
+
+        :param template_path: path to the template file
+        :type template_path: str
+        :param stamp: modification time and size of the file
+        :type stamp: tuple[int, int]
+        :param template: the values of the template
+        :type template: SpecTemplate
+        """
+        self.template_path: str = template_path
+        self.stamp: tuple[int, int] = stamp
+        self.template: SpecTemplate = template
+        self.data: bytes | None = None # content of the file, read when a workbook is needed
+        self.wb: pyxl.Workbook | None = None # workbook loaded while parsing, given to the first export
+        self.lock: threading.Lock = threading.Lock()
+
+    def workbook(self) -> pyxl.Workbook:
+        """
+        Returns a workbook of the template that belongs to the caller and can be changed.
+        It is loaded from the cached content of the file, the first call may return
+        the workbook loaded while the template was parsed.
+
+        :return: the workbook
+        :rtype: pyxl.Workbook
+        """
+        with self.lock:
+            wb, self.wb = self.wb, None
+            if wb is not None:
+                return wb
+            if self.data is None:
+                with open(self.template_path, "rb") as f:
+                    self.data = f.read()
+            data = self.data
+        return pyxl.load_workbook(io.BytesIO(data))
+
+
+class TemplateCache:
+    """
+    Keeps the most recently used templates of the process, see the module docstring.
+    """
+    def __init__(self, max_templates: int = DEFAULT_MAX_TEMPLATES) -> None:
+        """
+        Initialise class. With max_templates 0 nothing is cached.
+
+        :param max_templates: number of templates that are kept
+        :type max_templates: int
+        """
+        self.max_templates: int = max_templates
+        self.templates: OrderedDict[str, CachedTemplate] = OrderedDict()
+        self.lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def file_stamp(template_path: str) -> tuple[int, int]:
+        """
+        modification time and size of a file
+
+        :param template_path: path to the file
+        :type template_path: str
+        :return: the modification time in ns and the size
+        :rtype: tuple[int, int]
+        """
+        stat = os.stat(template_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, template_path: str, load_workbook: bool = False, template_index: bool = True) -> CachedTemplate:
+        """
+        Returns the cached template, parses it if it is not cached or the file changed.
+        The template is taken from the template index if possible, otherwise the workbook
+        is loaded with load_workbook (and kept for the output) or read in read only mode.
+
+        :param template_path: path to the template file
+        :type template_path: str
+        :param load_workbook: whether to load the full workbook if the template is parsed
+        :type load_workbook: bool
+        :param template_index: whether to use and update the template index
+        :type template_index: bool
+        :return: the cached template
+        :rtype: CachedTemplate
+        """
+        key = os.path.abspath(template_path)
+        stamp = self.file_stamp(template_path)
+        with self.lock:
+            cached = self.templates.get(key)
+            if cached is not None and cached.stamp == stamp:
+                logger.info("using cached template %s", template_path)
+                self.templates.move_to_end(key)
+                return cached
+
+        cached = self.parse(template_path, stamp, load_workbook, template_index)
+        if self.max_templates > 0:
+            with self.lock:
+                self.templates[key] = cached
+                self.templates.move_to_end(key)
+                while len(self.templates) > self.max_templates:
+                    self.templates.popitem(last=False)
+        return cached
+
+    @staticmethod
+    def parse(template_path: str, stamp: tuple[int, int], load_workbook: bool, template_index: bool) -> CachedTemplate:
+        """
+        Parses a template, see get.
+
+        :param template_path: path to the template file
+        :type template_path: str
+        :param stamp: modification time and size of the file
+        :type stamp: tuple[int, int]
+        :param load_workbook: whether to load the full workbook if the template is parsed
+        :type load_workbook: bool
+        :param template_index: whether to use and update the template index
+        :type template_index: bool
+        :return: the parsed template
+        :rtype: CachedTemplate
+        """
+        data = None
+        if load_workbook:
+            with open(template_path, "rb") as f:
+                data = f.read()
+
+        template = SpecTemplate.from_index(template_path) if template_index else None
+        if template is not None:
+            logger.info("using template index of %s", template_path)
+            cached = CachedTemplate(template_path, stamp, template)
+            cached.data = data
+            return cached
+
+        wb = None
+        if load_workbook:
+            wb = pyxl.load_workbook(io.BytesIO(data))
+            template = SpecTemplate.from_workbook(wb)
+        else:
+            template = SpecTemplate.read(template_path)
+
+        if template_index:
+            template.write_index(template_path)
+
+        cached = CachedTemplate(template_path, stamp, template)
+        cached.data = data
+        cached.wb = wb
+        return cached
+
+    def clear(self) -> None:
+        """
+        removes all templates from the cache
+        """
+        with self.lock:
+            self.templates.clear()
+
+
+TEMPLATE_CACHE: TemplateCache = TemplateCache() # shared by the exporters of the process
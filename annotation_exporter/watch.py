@@ -0,0 +1,355 @@
+"""
+Watch mode of the command line (annotation-exporter --watch). Keeps running after
+the first export, watches the pdfs and templates of the manifest and exports a job
+again when its pdf or template changes: \n
+-InotifyWatcher is notified by the kernel about the changes (linux) \n
+-PollingWatcher compares the modification time and size of the files, it is used
+ if inotify is not available \n
+-WatchDaemon runs the jobs
+
+The jobs run in the watching process, so the libraries stay imported, the templates
+stay parsed (see template_cache) and the records of the annotations of every pdf
+are kept (see backends.RecordMemo), only annotations that changed are parsed again.
+Changes arriving shortly after each other, for example while a pdf is saved, are
+combined into one export. Changes of the manifest reload it and run new jobs.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import csv
+import ctypes
+import ctypes.util
+import logging as lg
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Iterable
+from .backends import RecordMemo
+from .cli import ExportJob, JobResult, read_manifest, run_job
+from .options import ExportOptions
+
+logger = lg.getLogger(__name__)
+
+DEFAULT_SETTLE: float = 1.0 # seconds without changes before the jobs run
+DEFAULT_POLL_INTERVAL: float = 1.0
+
+# inotify(7)
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_TO: int = 0x00000080
+IN_Q_OVERFLOW: int = 0x00004000
+WATCH_MASK: int = IN_CLOSE_WRITE | IN_MOVED_TO # saved files are closed or renamed into place
+EVENT_HEADER: struct.Struct = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+class PollingWatcher:
+    """
+    Detects changes by comparing the modification time and size of the files.
+    """
+    def __init__(self, paths: Iterable[str], interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        """
+        Initialise class.
+
+        :param paths: the files to watch
+        :type paths: Iterable[str]
+        :param interval: seconds between two checks
+        :type interval: float
+        """
+        self.paths: set[str] = {os.path.abspath(path) for path in paths}
+        self.interval: float = interval
+        self.stamps: dict[str, tuple[int, int] | None] = {path: self.stamp(path) for path in self.paths}
+
+    @staticmethod
+    def stamp(path: str) -> tuple[int, int] | None:
+        """
+        modification time and size of a file, None if it does not exist
+
+        :param path: path to the file
+        :type path: str
+        :return: the modification time in ns and the size
+        :rtype: tuple[int, int] | None
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        """
+        Waits until a file changed or the timeout passed.
+
+        :param timeout: seconds to wait at most, None to wait for a change
+        :type timeout: float | None
+        :return: the paths of the changed files
+        :rtype: set[str]
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path in self.paths:
+                stamp = self.stamp(path)
+                if stamp != self.stamps[path]:
+                    self.stamps[path] = stamp
+                    changed.add(path)
+            if changed:
+                return changed
+
+            remaining = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            if remaining <= 0:
+                return changed
+            time.sleep(remaining)
+
+    def close(self) -> None:
+        """
+        stops watching
+        """
+
+
+class InotifyWatcher:
+    """
+    Watches the folders of the files with inotify, only linux is supported.
+    Raises OSError if inotify can not be used.
+    """
+    def __init__(self, paths: Iterable[str]) -> None:
+        """
+        Initialise class.
+
+        :param paths: the files to watch
+        :type paths: Iterable[str]
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on linux")
+        self.paths: set[str] = {os.path.abspath(path) for path in paths}
+        self.libc: ctypes.CDLL = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd: int = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.folders: dict[int, str] = {} # watch descriptor to folder
+        try:
+            for folder in {os.path.dirname(path) for path in self.paths}:
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"can not watch {folder}")
+                self.folders[wd] = folder
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        """
+        Waits until a file changed or the timeout passed.
+
+        :param timeout: seconds to wait at most, None to wait for a change
+        :type timeout: float | None
+        :return: the paths of the changed files
+        :rtype: set[str]
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                return set()
+            changed = self.read_events()
+            if changed:
+                return changed
+
+    def read_events(self) -> set[str]:
+        """
+        Reads the pending events.
+
+        :return: the paths of the changed files that are watched
+        :rtype: set[str]
+        """
+        changed: set[str] = set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW: # events were lost
+                logger.warning("inotify queue overflow, treating all files as changed")
+                return set(self.paths)
+            folder = self.folders.get(wd)
+            if folder is not None and name:
+                path = os.path.join(folder, os.fsdecode(name))
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        """
+        stops watching
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def open_watcher(
+        paths: Iterable[str],
+        poll: bool = False,
+        interval: float = DEFAULT_POLL_INTERVAL) -> InotifyWatcher | PollingWatcher:
+    """
+    Creates a watcher for the files, uses inotify if possible.
+
+    :param paths: the files to watch
+    :type paths: Iterable[str]
+    :param poll: always use the polling watcher
+    :type poll: bool
+    :param interval: seconds between two checks of the polling watcher
+    :type interval: float
+    :return: the watcher
+    :rtype: InotifyWatcher | PollingWatcher
+    """
+    paths = list(paths)
+    if not poll:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e: # AttributeError if the libc has no inotify functions
+            logger.info("inotify not available, polling for changes: %s", e)
+    return PollingWatcher(paths, interval)
+
+
+class WatchDaemon:
+    """
+    Runs the jobs of a manifest and runs them again when their files change, see the module docstring.
+    """
+    def __init__(
+            self,
+            manifest_path: str,
+            options: ExportOptions | None = None,
+            settle: float = DEFAULT_SETTLE,
+            poll: bool = False,
+            interval: float = DEFAULT_POLL_INTERVAL,
+            on_result: Callable[[JobResult], None] | None = None) -> None:
+        """
+        Initialise class.
+
+        :param manifest_path: path to the manifest csv
+        :type manifest_path: str
+        :param options: the options of every job, see read_manifest
+        :type options: ExportOptions | None
+        :param settle: seconds without changes before the changed jobs run
+        :type settle: float
+        :param poll: always use the polling watcher
+        :type poll: bool
+        :param interval: seconds between two checks of the polling watcher
+        :type interval: float
+        :param on_result: called with the result of every job
+        :type on_result: Callable[[JobResult], None] | None
+        """
+        self.manifest_path: str = os.path.abspath(manifest_path)
+        self.options: ExportOptions | None = options
+        self.settle: float = settle
+        self.poll: bool = poll
+        self.interval: float = interval
+        self.on_result: Callable[[JobResult], None] | None = on_result
+        self.jobs: list[ExportJob] = []
+        self.memos: dict[str, RecordMemo] = {} # pdf path to the records of its annotations
+        self.watcher: InotifyWatcher | PollingWatcher | None = None
+
+    def load_jobs(self) -> list[ExportJob]:
+        """
+        Reads the manifest and watches the files of the jobs.
+
+        :return: the jobs that are new or changed since the manifest was read the last time
+        :rtype: list[ExportJob]
+        """
+        previous = self.jobs
+        self.jobs = read_manifest(self.manifest_path, self.options)
+        pdfs = {os.path.abspath(job.pdf) for job in self.jobs}
+        self.memos = {pdf: memo for pdf, memo in self.memos.items() if pdf in pdfs}
+
+        if self.watcher is not None:
+            self.watcher.close()
+        paths = {self.manifest_path} | pdfs | {os.path.abspath(job.template) for job in self.jobs}
+        self.watcher = open_watcher(paths, self.poll, self.interval)
+        logger.info("watching %s files with %s", len(paths), type(self.watcher).__name__)
+        return [job for job in self.jobs if job not in previous]
+
+    def affected_jobs(self, changed: set[str]) -> list[ExportJob]:
+        """
+        Returns the jobs whose pdf or template changed.
+
+        :param changed: the paths of the changed files
+        :type changed: set[str]
+        :return: the jobs
+        :rtype: list[ExportJob]
+        """
+        return [
+            job for job in self.jobs
+            if os.path.abspath(job.pdf) in changed or os.path.abspath(job.template) in changed]
+
+    def run_jobs(self, jobs: list[ExportJob]) -> list[JobResult]:
+        """
+        Runs the jobs one after another, every pdf keeps its memo.
+
+        :param jobs: the jobs to run
+        :type jobs: list[ExportJob]
+        :return: the results
+        :rtype: list[JobResult]
+        """
+        results = []
+        for job in jobs:
+            memo = self.memos.setdefault(os.path.abspath(job.pdf), RecordMemo())
+            result = run_job(job, memo)
+            if self.on_result is not None:
+                self.on_result(result)
+            results.append(result)
+        return results
+
+    def collect_changes(self, stop_event: threading.Event | None = None) -> set[str]:
+        """
+        Waits for a change, then keeps collecting changes until none arrived for settle seconds.
+
+        :param stop_event: stops waiting once it is set
+        :type stop_event: threading.Event | None
+        :return: the paths of the changed files, empty if stopped
+        :rtype: set[str]
+        """
+        changed: set[str] = set()
+        while not changed:
+            if stop_event is not None and stop_event.is_set():
+                return changed
+            changed = self.watcher.wait(self.interval)
+
+        while True:
+            more = self.watcher.wait(self.settle)
+            if not more:
+                return changed
+            changed |= more
+
+    def run(self, stop_event: threading.Event | None = None) -> None:
+        """
+        Runs all jobs, then runs the jobs whose files change until the stop event is set.
+
+        :param stop_event: stops the daemon once it is set
+        :type stop_event: threading.Event | None
+        """
+        try:
+            self.run_jobs(self.load_jobs())
+            while True:
+                changed = self.collect_changes(stop_event)
+                if not changed:
+                    return
+                logger.info("changed: %s", sorted(changed))
+                jobs = self.affected_jobs(changed)
+                if self.manifest_path in changed:
+                    try:
+                        new_jobs = self.load_jobs()
+                    except (OSError, KeyError, csv.Error): # for example while the manifest is saved
+                        logger.exception("could not read the manifest %s, keeping the jobs", self.manifest_path)
+                        new_jobs = []
+                    jobs = [job for job in self.jobs if job in jobs or job in new_jobs]
+                self.run_jobs(jobs)
+        finally:
+            if self.watcher is not None:
+                self.watcher.close()
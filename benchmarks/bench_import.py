@@ -0,0 +1,75 @@
+"""
+Measures the import time of the package and checks that importing it, the
+generic module and the command line module does not load the heavy
+dependencies (PyPDF2, openpyxl, sqlite3). Every import runs in a fresh
+interpreter. Run from the project root:
+
+    python benchmarks/bench_import.py --repeat 5
+"""
+from __future__ import annotations # Nessecary for typehinting
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT: Path = Path(__file__).resolve().parents[1] # run against the checked out package
+
+HEAVY_MODULES: tuple[str] = ("PyPDF2", "openpyxl", "sqlite3")
+
+CHEAP_IMPORTS: tuple[str] = (
+    "import annotation_exporter",
+    "from annotation_exporter.generic import Annotation",
+    "import annotation_exporter.cli",
+    )
+FULL_IMPORT: str = "from annotation_exporter import AnnotationExporter"
+
+MEASURE: str = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [name for name in {heavy!r} if name in sys.modules]]))
+"""
+
+
+def measure(statement: str) -> tuple[float, list[str]]:
+    """
+    Runs an import statement in a new interpreter.
+
+    :param statement: the import statement
+    :type statement: str
+    :return: the seconds the import took and the heavy modules it loaded
+    :rtype: tuple[float, list[str]]
+    """
+    code = MEASURE.format(statement=statement, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    seconds, loaded = json.loads(output)
+    return seconds, loaded
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    measures the imports and prints the timings
+
+    :param argv: command line arguments, defaults to sys.argv
+    :type argv: list[str] | None
+    """
+    parser = argparse.ArgumentParser(description="Measure the import time of annotation_exporter.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for statement in CHEAP_IMPORTS + (FULL_IMPORT,):
+        runs = [measure(statement) for _ in range(args.repeat)]
+        seconds = min(run[0] for run in runs)
+        loaded = runs[0][1]
+        print(f"{statement}: {seconds * 1000:.1f}ms, loads {', '.join(loaded) or 'no heavy modules'}")
+        if statement in CHEAP_IMPORTS and loaded:
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Checks that the single pass parser (annotation_exporter.parser) gives the same
+results as the previous implementation of Annotation.get_multiple_variables,
+is_dataset, is_supp and truncate_exess_text on more random texts than the tests
+and compares their speed. The previous implementation is in tests/test_parser.py.
+Run from the project root:
+
+    python benchmarks/bench_parser.py --annotations 50000
+"""
+from __future__ import annotations # Nessecary for typehinting
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1])) # run against the checked out package
+
+from annotation_exporter.parser import parse # pylint: disable=wrong-import-position
+from tests.test_parser import CORPUS, legacy_parse, random_corpus # pylint: disable=wrong-import-position
+
+
+def realistic_corpus(count: int, seed: int = 0) -> list[str]:
+    """
+    Annotation texts like the ones in an aCRF.
+
+    :param count: number of texts
+    :type count: int
+    :param seed: seed for the random generator
+    :type seed: int
+    :return: list of texts
+    :rtype: list[str]
+    """
+    rng = random.Random(seed)
+    templates = [
+        "{ds} = Dataset {ds}", "{ds} (Dataset {ds})", "{ds}VAR{n}", "{ds}VAR{n} = VALUE",
+        "{ds}VAR{n}, {ds}VAR{m}", "SUPP{ds}.QVAL when QNAM={ds}X{n}", "{ds}VAR{n} (when {ds}YN=Y)"]
+    return [
+        rng.choice(templates).format(ds=rng.choice(["DM", "AE", "VS", "LB"]), n=rng.randrange(50), m=rng.randrange(50))
+        for _ in range(count)
+        ]
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    checks the parser against the previous implementation and prints the timings
+
+    :param argv: command line arguments, defaults to sys.argv
+    :type argv: list[str] | None
+    """
+    parser = argparse.ArgumentParser(description="Compare the annotation parser with the previous implementation.")
+    parser.add_argument("--annotations", type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    check_corpus = CORPUS + random_corpus(args.annotations)
+    mismatches = [text for text in check_corpus if [tuple(p) for p in parse(text)] != legacy_parse(text)]
+    for text in mismatches[:20]:
+        print(f"mismatch: {text!r}\n  parser: {parse(text)}\n  legacy: {legacy_parse(text)}")
+    print(f"{len(check_corpus) - len(mismatches)}/{len(check_corpus)} texts match")
+
+    corpus = realistic_corpus(args.annotations)
+    legacy = min(timeit.repeat(lambda: [legacy_parse(text) for text in corpus], number=1, repeat=3))
+    parse.cache_clear()
+    new = min(timeit.repeat(lambda: [parse(text) for text in corpus], number=1, repeat=1)) # cold cache
+    print(f"legacy: {legacy:.3f}s, parser: {new:.3f}s, speedup: {legacy / new:.1f}x")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
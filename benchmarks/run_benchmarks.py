@@ -0,0 +1,150 @@
+"""
+Benchmarks the stages of the export on synthetic aCRFs and specifications.
+Run from the project root:
+
+    python benchmarks/run_benchmarks.py --pages 50 500 --annotations 2000 20000 --rows 3000
+
+Every combination of pages, annotations and rows is measured, the results are
+printed as json (or written to --output) so they can be compared between releases.
+Besides the stages every output (sink) is timed on its own, so the workbook save
+(xlsx) and the csv generation (variables_csv, datasets_csv) are reported separately.
+A summary table is printed to stderr.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1])) # run against the checked out package
+
+import PyPDF2 # pylint: disable=wrong-import-position
+from annotation_exporter.annot_export import AnnotationExporter # pylint: disable=wrong-import-position
+from annotation_exporter.options import ExportOptions # pylint: disable=wrong-import-position
+from annotation_exporter.pipeline import SINKS # pylint: disable=wrong-import-position
+from synthetic import generate_acrf, generate_spec # pylint: disable=wrong-import-position
+
+
+def run_case(
+        work_dir: str,
+        pages: int,
+        annotations: int,
+        rows: int,
+        trace_memory: bool = False,
+        threaded_sinks: bool = False) -> dict:
+    """
+    Generates the inputs for one combination and runs the export with all outputs,
+    the stage and sink timings are taken from the report of the export. By default
+    the sinks run one after another, so their timings do not overlap.
+
+    :param work_dir: folder for the inputs and outputs
+    :type work_dir: str
+    :param pages: number of pages
+    :type pages: int
+    :param annotations: number of annotations
+    :type annotations: int
+    :param rows: number of variable rows in the spec
+    :type rows: int
+    :param trace_memory: whether to measure the peak memory of every stage
+    :type trace_memory: bool
+    :param threaded_sinks: whether the sinks run on their own threads like in a normal export
+    :type threaded_sinks: bool
+    :return: the parameters, stage and sink timings
+    :rtype: dict
+    """
+    pdf_path = os.path.join(work_dir, f"acrf_{pages}_{annotations}.pdf")
+    spec_path = os.path.join(work_dir, f"spec_{rows}.xlsx")
+    output_folder = os.path.join(work_dir, f"out_{pages}_{annotations}_{rows}")
+    os.makedirs(output_folder, exist_ok=True)
+    if not os.path.exists(pdf_path):
+        generate_acrf(pdf_path, pages, annotations)
+    if not os.path.exists(spec_path):
+        generate_spec(spec_path, rows)
+
+    with redirect_stdout(sys.stderr): # keep stdout clean for the json output
+        exporter = AnnotationExporter()
+        report = exporter.export_annotations(
+            spec_path, pdf_path, output_folder,
+            ExportOptions(template_index=False, trace_memory=trace_memory, sinks=SINKS, threaded_sinks=threaded_sinks))
+
+    return {
+        "pages": pages,
+        "annotations": annotations,
+        "rows": rows,
+        "stages": report.stages,
+        "sinks": report.sinks,
+        "total": sum(metrics["seconds"] for metrics in report.stages.values()),
+        "counts": report.counts,
+    }
+
+
+def print_table(cases: list[dict]) -> None:
+    """
+    Prints the stage and sink timings of the cases as a table to stderr.
+
+    :param cases: the results of run_case
+    :type cases: list[dict]
+    """
+    stages = list(dict.fromkeys(stage for case in cases for stage in case["stages"]))
+    columns = ["pages", "annotations", "rows", *stages, *SINKS, "total"]
+    lines = [columns]
+    for case in cases:
+        seconds = {stage: metrics["seconds"] for stage, metrics in case["stages"].items()}
+        seconds.update(case["sinks"])
+        seconds["total"] = case["total"]
+        lines.append([
+            *(str(case[key]) for key in ("pages", "annotations", "rows")),
+            *(f"{seconds[column]:.3f}" if column in seconds else "-" for column in columns[3:])])
+
+    widths = [max(len(line[i]) for line in lines) for i in range(len(columns))]
+    for line in lines:
+        print("  ".join(value.rjust(width) for value, width in zip(line, widths)), file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    parses the arguments and runs all combinations
+
+    :param argv: command line arguments, defaults to sys.argv
+    :type argv: list[str] | None
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the annotation export on synthetic data.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 200])
+    parser.add_argument("--annotations", type=int, nargs="+", default=[500, 5000])
+    parser.add_argument("--rows", type=int, nargs="+", default=[500, 3000])
+    parser.add_argument("--trace-memory", action="store_true", help="measure the peak memory of every stage")
+    parser.add_argument(
+        "--threaded-sinks", action="store_true",
+        help="run the outputs on their own threads, their timings overlap")
+    parser.add_argument("--work-dir", help="keep the generated files in this folder")
+    parser.add_argument("--output", help="write the results to this json file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        results = {
+            "python": platform.python_version(),
+            "PyPDF2": PyPDF2.__version__,
+            "cases": [
+                run_case(work_dir, pages, annotations, rows, args.trace_memory, args.threaded_sinks)
+                for pages, annotations, rows in itertools.product(args.pages, args.annotations, args.rows)
+                ],
+        }
+    print_table(results["cases"])
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
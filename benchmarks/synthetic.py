@@ -0,0 +1,147 @@
+"""
+Generates synthetic aCRFs and specification templates for the benchmarks,
+so they can run offline without real study documents.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import random
+import string
+import openpyxl as pyxl
+from openpyxl.styles import PatternFill
+import PyPDF2
+from PyPDF2.generic import AnnotationBuilder, ArrayObject, FloatObject, NameObject
+
+DATASET_HEADER: list[str] = [
+    "Dataset", "Description", "Class", "SubClass", "Structure", "Purpose",
+    "KeyVariables", "Repeating", "ReferenceData", "Comment"]
+VARIABLE_HEADER: list[str] = [
+    "Order", "Dataset", "Variable", "Label", "DataType", "Length", "SignificantDigits",
+    "Format", "Mandatory", "Core", "Codelist", "Origin", "Pages", "Method"]
+HEADER_FILL = PatternFill(start_color="FFF5F7F1", end_color="FFF5F7F1", fill_type="solid")
+
+
+def dataset_names(count: int) -> list[str]:
+    """
+    Returns count two letter dataset names, always the same for the same count.
+
+    :param count: number of datasets
+    :type count: int
+    :return: list of dataset names
+    :rtype: list[str]
+    """
+    names = [a + b for a in string.ascii_uppercase for b in string.ascii_uppercase]
+    return names[:count]
+
+
+def variable_name(dataset: str, nr: int) -> str:
+    """
+    name of the nr-th variable of a dataset
+
+    :param dataset: the dataset name
+    :type dataset: str
+    :param nr: the variable number
+    :type nr: int
+    :return: the variable name
+    :rtype: str
+    """
+    return f"{dataset}VAR{nr}"
+
+
+def generate_spec(path: str, rows: int, datasets: int = 40) -> None:
+    """
+    Generates a specification template with the given number of variable rows,
+    spread evenly over the datasets. The header has a free (styled) column for
+    the exporter like the real template.
+
+    :param path: path of the xlsx file
+    :type path: str
+    :param rows: number of variable rows
+    :type rows: int
+    :param datasets: number of datasets
+    :type datasets: int
+    """
+    wb = pyxl.Workbook()
+    study = wb.active
+    study.title = "Study"
+    study.append(["Attribute", "Value"])
+    study.append(["StudyName", "Benchmark"])
+
+    names = dataset_names(datasets)
+    ws_datasets = wb.create_sheet("Datasets")
+    ws_datasets.append(DATASET_HEADER)
+    for name in names:
+        ws_datasets.append([name, f"Dataset {name}", "FINDINGS"])
+
+    ws_variables = wb.create_sheet("Variables")
+    ws_variables.append(VARIABLE_HEADER)
+    for row_nr in range(rows):
+        dataset = names[row_nr % datasets]
+        ws_variables.append([
+            row_nr + 1, dataset, variable_name(dataset, row_nr // datasets),
+            f"Label {row_nr}", "text", 200])
+
+    for ws, width in ((ws_datasets, len(DATASET_HEADER)), (ws_variables, len(VARIABLE_HEADER))):
+        for col in range(1, width + 2): # one styled empty column for the exporter
+            ws.cell(row=1, column=col).fill = HEADER_FILL
+
+    wb.save(path)
+
+
+def generate_acrf(
+        path: str,
+        pages: int,
+        annotations: int,
+        datasets: int = 40,
+        datasets_per_page: int = 3,
+        seed: int = 0) -> None:
+    """
+    Generates an aCRF with the given number of pages and FreeText annotations.
+    Every page has a few dataset annotations (alternating between the old
+    "XX = label" and the new "XX (label)" style), the remaining annotations are
+    variables in the colors of the datasets, including SUPP and multi-variable
+    annotations. The variables refer to the spec from generate_spec where possible.
+
+    :param path: path of the pdf file
+    :type path: str
+    :param pages: number of pages
+    :type pages: int
+    :param annotations: total number of annotations
+    :type annotations: int
+    :param datasets: number of datasets
+    :type datasets: int
+    :param datasets_per_page: number of dataset annotations per page
+    :type datasets_per_page: int
+    :param seed: seed for the random generator
+    :type seed: int
+    """
+    rng = random.Random(seed)
+    names = dataset_names(datasets)
+    colors = [[round(rng.uniform(0.5, 1), 6) for _ in range(3)] for _ in names]
+    writer = PyPDF2.PdfWriter()
+    per_page = max(annotations // pages, datasets_per_page + 1)
+
+    for page_nr in range(pages):
+        writer.add_blank_page(width=595, height=842)
+        page_datasets = rng.sample(range(datasets), min(datasets_per_page, datasets))
+
+        for annot_nr in range(per_page):
+            dataset_nr = page_datasets[annot_nr % len(page_datasets)]
+            dataset = names[dataset_nr]
+            if annot_nr < len(page_datasets):
+                if page_nr % 2:
+                    text = f"{dataset} = Dataset {dataset}"
+                else:
+                    text = f"{dataset} (Dataset {dataset})"
+            elif annot_nr % 10 == 0:
+                text = f"SUPP{dataset}.QVAL when QNAM={dataset}EXTRA"
+            elif annot_nr % 7 == 0:
+                text = f"{variable_name(dataset, rng.randrange(30))}, {variable_name(dataset, rng.randrange(30))}"
+            else:
+                text = f"{variable_name(dataset, rng.randrange(60))} = VALUE"
+
+            y = 800 - (annot_nr % 40) * 20
+            annot = AnnotationBuilder.free_text(text, rect=(20, y, 220, y + 18))
+            annot[NameObject("/C")] = ArrayObject([FloatObject(c) for c in colors[dataset_nr]])
+            writer.add_annotation(page_nr, annot)
+
+    with open(path, "wb") as f:
+        writer.write(f)
@@ -13,6 +13,12 @@ setup(
     long_description=LONG_DESCRIPTION,
     packages=find_packages(),
     install_requires=["openpyxl", "PyPDF2", "FreeSimpleGUI"],
+    entry_points={
+        "console_scripts": [
+            "annotation-exporter=annotation_exporter.cli:main",
+            "annotation-exporter-service=annotation_exporter.service:main",
+            ],
+    },
     keywords=["python", "CRF", "CDISC"],
     classifiers= [
             "Development Status :: 4 - Beta",
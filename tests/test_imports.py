@@ -0,0 +1,49 @@
+"""
+Checks that importing the package, the generic module and the command line module
+does not load the heavy dependencies (PyPDF2, openpyxl, sqlite3), they are only
+imported when an export needs them. Every import runs in a fresh interpreter.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+ROOT: Path = Path(__file__).resolve().parents[1] # run against the checked out package
+
+HEAVY_MODULES: tuple[str, ...] = ("PyPDF2", "openpyxl", "sqlite3")
+
+LOADED: str = """
+import json, sys
+{statement}
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+
+def loaded_modules(statement: str) -> list[str]:
+    """
+    Runs an import statement in a new interpreter.
+
+    :param statement: the import statement
+    :type statement: str
+    :return: the heavy modules the import loaded
+    :rtype: list[str]
+    """
+    code = LOADED.format(statement=statement, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+@pytest.mark.parametrize("statement", [
+    "import annotation_exporter",
+    "from annotation_exporter.generic import Annotation",
+    "import annotation_exporter.cli",
+    ])
+def test_import_does_not_load_heavy_modules(statement: str) -> None:
+    assert loaded_modules(statement) == []
+
+
+def test_full_import_loads_heavy_modules() -> None:
+    # makes sure the check can fail, AnnotationExporter needs openpyxl
+    assert "openpyxl" in loaded_modules("from annotation_exporter import AnnotationExporter")
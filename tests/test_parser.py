@@ -0,0 +1,108 @@
+"""
+Checks that the single pass parser (annotation_exporter.parser) gives the same
+results as the previous implementation of Annotation.get_multiple_variables,
+is_dataset, is_supp and truncate_exess_text, which is kept here as reference.
+benchmarks/bench_parser.py uses it to compare the speed.
+"""
+from __future__ import annotations # Nessecary for typehinting
+import random
+import pytest
+from annotation_exporter.parser import SEPARATORS, classify, parse, tokenize
+
+CORPUS: list[str] = [
+    "DM = Demographics", "DM (Demographics)", "DM(Demographics)", " DM =Demographics ",
+    "SUBJID", "DSTERM = Informed Consent Obtained", "SUPPDS.QVAL where QNAM=CONSPAT",
+    "SUPPRP.QVAL when SUPPRP.QNAM=NCPREAS", "RPORRES=N", "VSORRES, VSORRESU", "A, B; C",
+    "A; B; C", "A|B|C", "A,B,A", "A, (B), C)", "X(Y), Z)", ")", "(", "", " ", ",", ",,;;||",
+    "AE (Adverse Events); AETERM", "AETERM (when AEYN=Y)", "AESTDTC) trailing", "LB=",
+    "=LB", "L B = Lab", "SUPP", "SUPPAE", "SUPPAE=", "QS, SUPPQS.QVAL", "A;B,C|D", "a,b;c,d|e",
+    "\tTAB\tDS\n=x", "ÄÖ = Umlaut", "1,2,3", "DM = A, B", "VS (Vital Signs), VSORRES",
+    ]
+
+
+def legacy_split(content: str) -> list[str]:
+    """
+    previous implementation of Annotation.get_multiple_variables (without the dictionaries)
+    """
+    split_variables: dict[str, None] = {}
+    for separator in SEPARATORS:
+        for possible_variable in content.split(separator):
+            if any(ext in possible_variable for ext in SEPARATORS):
+                continue
+            elif "(" in possible_variable:
+                possible_variable = possible_variable.split("(", 1)[0]
+            elif ")" in possible_variable:
+                possible_variable = possible_variable.split(")", 1)[1]
+
+            if possible_variable == "":
+                continue
+            split_variables[possible_variable] = None
+    return list(split_variables)
+
+
+def legacy_classify(content: str) -> tuple:
+    """
+    previous implementation of is_dataset, is_supp and truncate_exess_text
+    """
+    content_without_spaces = "".join(content.split())
+    dataset = new_dataset = supp = False
+    dataset_name = variable_name = None
+    if len(content_without_spaces.split("(", 1)[0]) == 2:
+        new_dataset = True
+        dataset_name = content_without_spaces.split("(", 1)[0]
+        dataset = True
+    elif len(content_without_spaces.split("=", 1)[0]) == 2:
+        dataset_name = content_without_spaces.split("=", 1)[0]
+        dataset = True
+    else:
+        variable_name = content_without_spaces.split("=", 1)[0]
+
+    if content_without_spaces.split("=", 1)[0][:4] == "SUPP":
+        dataset_name = content_without_spaces.split("=", 1)[0][:6]
+        supp = True
+
+    if not dataset and not supp:
+        for separator in SEPARATORS:
+            if separator in content:
+                content = content.split(separator, 1)[0]
+
+    return (content, content_without_spaces, dataset, new_dataset, supp, dataset_name, variable_name)
+
+
+def legacy_parse(content: str) -> list[tuple]:
+    """
+    previous implementation, split and classify
+    """
+    return [legacy_classify(token) for token in legacy_split(content)]
+
+
+def random_corpus(count: int, seed: int = 0) -> list[str]:
+    """
+    Random annotation texts built from the characters that matter to the parser.
+
+    :param count: number of texts
+    :type count: int
+    :param seed: seed for the random generator
+    :type seed: int
+    :return: list of texts
+    :rtype: list[str]
+    """
+    rng = random.Random(seed)
+    alphabet = "AB DMSUP=()" + "".join(SEPARATORS)
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randrange(12))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_tokenize_matches_legacy(text: str) -> None:
+    assert tokenize(text) == legacy_split(text)
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_classify_matches_legacy(text: str) -> None:
+    for token in [text] + legacy_split(text):
+        assert tuple(classify(token)) == legacy_classify(token)
+
+
+def test_random_texts_match_legacy() -> None:
+    mismatches = [text for text in random_corpus(5000) if [tuple(p) for p in parse(text)] != legacy_parse(text)]
+    assert mismatches == []